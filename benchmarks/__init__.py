@@ -0,0 +1 @@
+"""Seeded load tests for the main routes; see benchmarks/run_benchmarks.py."""
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for time-slot booking.
+
+Seeds one shared slot group (the same time offered to Individual and Family
+students) into a throwaway SQLite file, or into an empty database given
+with --database-url, then has every student POST /select-class-time for it
+at the same moment from its own thread. Exits 1 if the slot ends up with
+more bookings than seats, or with claims and selections out of step.
+
+Usage:
+    python benchmarks/booking_stress.py
+    python benchmarks/booking_stress.py --students 50 --capacity 3 --rounds 5
+    python benchmarks/booking_stress.py --database-url postgresql://localhost/stress
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from datetime import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fire parallel bookings at the same time slot')
+    parser.add_argument('--students', type=int, default=20, help='parallel bookings per round')
+    parser.add_argument('--capacity', type=int, default=1, help='max_capacity of the contested slot')
+    parser.add_argument('--rounds', type=int, default=3, help='fresh slot groups to contest')
+    parser.add_argument('--database-url', help='empty database to seed (default: temporary SQLite file)')
+    return parser.parse_args()
+
+
+def seed_students(db, count):
+    """Students with a completed Individual or Family enrollment; returns their user ids"""
+    from webapp.models import ClassEnrollment, IndividualClass, User
+
+    # The default admin also stops the first request from creating it while the threads race
+    admin = User(username='buxin', email='admin@buxin.com', first_name='Admin', last_name='Buxin',
+                 is_admin=True, is_student=False)
+    admin.set_password('buxin')
+    db.session.add(admin)
+    db.session.flush()
+    individual = IndividualClass(name='Stress class', teacher_id=admin.id)
+    db.session.add(individual)
+    students = [User(username=f'stress_student_{i}', email=f'stress_student_{i}@example.com', password_hash='x',
+                     first_name='Stress', last_name=str(i), student_id=f'STU-{i + 1:05d}')
+                for i in range(count)]
+    db.session.add_all(students)
+    db.session.flush()
+    db.session.add_all(ClassEnrollment(user_id=student.id, class_id=individual.id, amount=10, status='completed',
+                                       class_type='individual' if i % 2 == 0 else 'family')
+                       for i, student in enumerate(students))
+    db.session.commit()
+    return [student.id for student in students]
+
+
+def seed_slot_group(db, round_number, capacity):
+    """One slot per class type sharing a group; returns {class_type: class_time_id}"""
+    from webapp.models import ClassTime
+
+    slots = {class_type: ClassTime(class_type=class_type, day='Monday', start_time=time(8 + round_number, 0),
+                                   end_time=time(9 + round_number, 0), max_capacity=capacity,
+                                   shared_slot_group_id=f'shared_stress_{round_number}')
+             for class_type in ('individual', 'family')}
+    db.session.add_all(slots.values())
+    db.session.commit()
+    return {class_type: slot.id for class_type, slot in slots.items()}
+
+
+def fire(app, student_ids, slot_ids):
+    """POST /select-class-time for every student at once; returns Counter of flash categories"""
+    barrier = threading.Barrier(len(student_ids))
+    outcomes = Counter()
+    lock = threading.Lock()
+
+    def book(index, student_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['student_user_id'] = student_id
+        class_type = 'individual' if index % 2 == 0 else 'family'
+        barrier.wait()
+        client.post('/select-class-time', data={'time_id': slot_ids[class_type]})
+        with client.session_transaction() as session:
+            categories = [category for category, _ in session.get('_flashes', [])]
+        with lock:
+            outcomes.update(categories or ['none'])
+
+    threads = [threading.Thread(target=book, args=(i, student_id)) for i, student_id in enumerate(student_ids)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def check(db, slot_ids, capacity):
+    """Problems found for one slot group (empty when consistent)"""
+    from webapp.models import ClassTimeClaim, StudentClassTimeSelection
+
+    selections = StudentClassTimeSelection.query.filter(
+        StudentClassTimeSelection.class_time_id.in_(slot_ids.values())
+    ).all()
+    claims = ClassTimeClaim.query.filter(
+        ClassTimeClaim.selection_id.in_([s.id for s in selections] or [0])
+    ).all()
+    problems = []
+    if len(selections) > capacity:
+        problems.append(f'{len(selections)} bookings for {capacity} seat(s)')
+    if len(claims) != len(selections):
+        problems.append(f'{len(selections)} selections but {len(claims)} claims')
+    if len({claim.seat for claim in claims}) != len(claims):
+        problems.append('two claims hold the same seat')
+    return problems, len(selections)
+
+
+def main():
+    args = parse_args()
+    temp_path = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        handle, temp_path = tempfile.mkstemp(suffix='.db', prefix='booking-stress-')
+        os.close(handle)
+        os.environ['DATABASE_URL'] = f'sqlite:///{temp_path}'
+    os.environ.setdefault('PERF_INSTRUMENTATION', 'false')
+
+    from webapp import create_app
+    from webapp.extensions import db
+    from webapp.models import User
+
+    app = create_app()
+    app.logger.setLevel(logging.ERROR)
+    failed = False
+    try:
+        with app.app_context():
+            db.create_all()
+            if User.query.first() is not None:
+                raise SystemExit('booking_stress.py needs an empty database')
+            student_ids = seed_students(db, args.students)
+
+        for round_number in range(args.rounds):
+            with app.app_context():
+                slot_ids = seed_slot_group(db, round_number, args.capacity)
+            outcomes = fire(app, student_ids, slot_ids)
+            with app.app_context():
+                problems, booked = check(db, slot_ids, args.capacity)
+            status = 'FAIL' if problems else 'OK'
+            print(f'[{status}] round {round_number + 1}: {booked}/{args.capacity} seat(s) booked by '
+                  f'{args.students} parallel requests; responses {dict(outcomes)}')
+            for problem in problems:
+                print(f'    {problem}')
+            failed = failed or bool(problems)
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
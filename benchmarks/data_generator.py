@@ -0,0 +1,150 @@
+"""
+Synthetic data for the benchmark suite.
+
+Creates a teacher/admin, thousands of students, classes of all four types
+with completed enrollments, a school with registered pupils, attendance
+history, learning materials, student projects with likes and comments, and
+time slots. Rows are inserted in bulk with placeholder password hashes, so
+a 2,000-student database seeds in a few seconds on SQLite.
+"""
+from __future__ import annotations
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+CLASS_TYPES = ('individual', 'group', 'family', 'school')
+
+# students, classes per type, days of attendance history
+SCALES = {
+    'small': (300, 5, 14),
+    'medium': (2000, 20, 30),
+    'large': (6000, 50, 60),
+}
+
+
+@dataclass
+class SeededIds:
+    """Accounts the driver signs in as"""
+    admin_id: int
+    student_id: int
+    school_student_id: int
+
+
+def generate(db, scale: str = 'medium', seed: int = 42) -> SeededIds:
+    """Fill an empty database; returns the ids used by the benchmark driver"""
+    from webapp.models import (
+        User, GroupClass, IndividualClass, ClassEnrollment, Attendance, FamilyMember, SchoolStudent,
+        LearningMaterial, ClassTime, StudentClassTimeSelection, StudentProject, ProjectLike, ProjectComment,
+        School,
+    )
+
+    if User.query.first() is not None:
+        raise RuntimeError('Benchmark data must be generated into an empty database')
+
+    student_count, classes_per_type, history_days = SCALES[scale]
+    rng = random.Random(seed)
+    today = date.today()
+
+    admin = User(username='buxin', email='admin@buxin.com', first_name='Admin', last_name='Buxin',
+                 is_admin=True, is_student=False)
+    admin.set_password('buxin')
+    db.session.add(admin)
+
+    students = [User(username=f'bench_student_{i}', email=f'bench_student_{i}@example.com', password_hash='x',
+                     first_name='Student', last_name=str(i), student_id=f'STU-{i + 1:05d}')
+                for i in range(student_count)]
+    db.session.add_all(students)
+    db.session.flush()
+
+    school = School(school_system_id='SCH-BENCH1', school_name='Benchmark School', school_email='school@example.com',
+                    admin_name='School Admin', admin_email='school-admin@example.com', status='active',
+                    payment_status='completed', user_id=students[0].id)
+    db.session.add(school)
+
+    classes = []
+    for class_type in CLASS_TYPES:
+        for i in range(classes_per_type):
+            classes.append(GroupClass(name=f'{class_type.title()} class {i}', teacher_id=admin.id,
+                                      class_type=class_type, max_students=100))
+    db.session.add_all(classes)
+    db.session.add_all(IndividualClass(name=f'Individual class {i}', teacher_id=admin.id)
+                       for i in range(classes_per_type))
+    db.session.flush()
+
+    # Every student joins two classes; the first student is in one class of each type
+    enrollments = []
+    memberships = {}
+    for index, student in enumerate(students):
+        picks = [classes[CLASS_TYPES.index(t) * classes_per_type] for t in CLASS_TYPES] if index == 0 \
+            else rng.sample(classes, 2)
+        for cls in picks:
+            enrollment = ClassEnrollment(user_id=student.id, class_id=cls.id, class_type=cls.class_type, amount=10,
+                                         status='completed' if rng.random() < 0.9 or index == 0 else 'pending',
+                                         customer_name=f'{student.first_name} {student.last_name}',
+                                         customer_email=student.email,
+                                         enrolled_at=datetime.utcnow() - timedelta(days=rng.randint(1, 365)))
+            enrollments.append(enrollment)
+            memberships.setdefault(cls.id, []).append(student.id)
+    db.session.add_all(enrollments)
+    db.session.flush()
+
+    attendance = []
+    for cls in classes:
+        for student_id in memberships.get(cls.id, []):
+            for offset in range(history_days):
+                if rng.random() < 0.7:
+                    attendance.append(Attendance(student_id=student_id, class_id=cls.id, class_type=cls.class_type,
+                                                 attendance_date=today - timedelta(days=offset),
+                                                 status=rng.choice(('present', 'present', 'present', 'late')),
+                                                 marked_by=admin.id if offset % 2 else None))
+    db.session.add_all(attendance)
+
+    materials = []
+    for cls in classes:
+        for i in range(5):
+            materials.append(LearningMaterial(title=f'Lesson {i}', content='Benchmark material',
+                                              class_id=f'{cls.class_type}_{cls.id}', class_type=cls.class_type,
+                                              actual_class_id=cls.id, created_by=admin.id))
+    db.session.add_all(materials)
+
+    pupils = []
+    for enrollment in enrollments:
+        if enrollment.class_type == 'family':
+            pupils.extend(FamilyMember(enrollment_id=enrollment.id, class_id=enrollment.class_id,
+                                       member_name=f'Member {i}', registered_by=enrollment.user_id)
+                          for i in range(3))
+        elif enrollment.class_type == 'school' and enrollment.user_id == students[0].id:
+            pupils.extend(SchoolStudent(enrollment_id=enrollment.id, class_id=enrollment.class_id,
+                                        school_name=school.school_name, student_name=f'Pupil {i}',
+                                        student_system_id=f'STU-9{i:04d}', registered_by=enrollment.user_id)
+                          for i in range(40))
+    db.session.add_all(pupils)
+
+    slots = []
+    for cls in classes:
+        for day in ('Monday', 'Wednesday'):
+            slots.append(ClassTime(class_type=cls.class_type,
+                                   class_id=cls.id if cls.class_type in ('group', 'school') else None,
+                                   day=day, start_time=time(16, 0), end_time=time(17, 0)))
+    db.session.add_all(slots)
+    db.session.flush()
+    db.session.add_all(StudentClassTimeSelection(user_id=enrollment.user_id, enrollment_id=enrollment.id,
+                                                 class_time_id=rng.choice(slots).id, class_type=enrollment.class_type)
+                       for enrollment in enrollments if enrollment.class_type in ('individual', 'family'))
+
+    projects = [StudentProject(title=f'Project {i}', description='Benchmark project',
+                               image_url=f'https://example.com/project-{i}.png' if i % 2 else None,
+                               youtube_url=f'https://youtu.be/bench{i}' if i % 3 == 0 else None,
+                               student_id=rng.choice(students).id, featured=i % 10 == 0)
+                for i in range(max(50, student_count // 20))]
+    db.session.add_all(projects)
+    db.session.flush()
+    for project in projects:
+        for liker in rng.sample(students, 10):
+            db.session.add(ProjectLike(project_id=project.id, user_id=liker.id, is_like=rng.random() < 0.85))
+        for commenter in rng.sample(students, 3):
+            db.session.add(ProjectComment(project_id=project.id, user_id=commenter.id, comment='Nice work'))
+
+    db.session.commit()
+    school_pupil = SchoolStudent.query.filter_by(school_name=school.school_name).first()
+    return SeededIds(admin_id=admin.id, student_id=students[0].id, school_student_id=school_pupil.id)
@@ -0,0 +1,66 @@
+"""
+Drive the benchmarked routes through the Flask test client.
+
+Query counts come from the ``Server-Timing`` header written by
+``webapp.services.perf``; latency is measured around each test-client call.
+"""
+from __future__ import annotations
+import re
+import time
+from typing import Dict, List
+
+from .data_generator import SeededIds
+
+# (route label, path, identity the request is made as)
+ROUTES = [
+    ('home', '/', 'anonymous'),
+    ('student_dashboard', '/student/dashboard', 'student'),
+    ('admin_dashboard', '/admin/dashboard', 'admin'),
+    ('admin_attendance', '/admin/attendance', 'admin'),
+    ('student_projects', '/student-projects', 'anonymous'),
+    ('school_student_dashboard', '/school-student/dashboard', 'school_student'),
+]
+
+_QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def _client(app, identity: str, ids: SeededIds):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        if identity == 'admin':
+            sess['_user_id'] = str(ids.admin_id)
+            sess['_fresh'] = True
+        elif identity == 'student':
+            sess['student_user_id'] = ids.student_id
+        elif identity == 'school_student':
+            sess['school_student_id'] = ids.school_student_id
+    return client
+
+
+def run_routes(app, ids: SeededIds, iterations: int = 20, warmup: int = 2,
+               routes: List[tuple] = None) -> Dict[str, dict]:
+    """
+    Request every route ``warmup + iterations`` times and return, per label,
+    the path, the measured latencies (ms) and the query count of each request.
+    """
+    results = {}
+    clients = {}
+    for label, path, identity in routes or ROUTES:
+        client = clients.get(identity)
+        if client is None:
+            client = clients[identity] = _client(app, identity, ids)
+
+        latencies, query_counts = [], []
+        for attempt in range(warmup + iterations):
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} returned {response.status_code} for {identity}')
+            if attempt < warmup:
+                continue
+            match = _QUERY_COUNT.search(response.headers.get('Server-Timing', ''))
+            latencies.append(elapsed_ms)
+            query_counts.append(int(match.group(1)) if match else -1)
+        results[label] = {'path': path, 'latencies_ms': latencies, 'queries': query_counts}
+    return results
@@ -0,0 +1,83 @@
+"""
+Summaries of a benchmark run and comparison against a stored baseline.
+
+A route regresses when its p95 latency grows by more than the latency
+tolerance (default 25%) or when it issues more SQL statements than the
+baseline. Query counts are deterministic for a given scale, so any increase
+is reported; latency depends on the machine, so compare baselines recorded
+on the same hardware.
+"""
+from __future__ import annotations
+import json
+from typing import Dict, List, Optional
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Linear-interpolated percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(results: Dict[str, dict]) -> Dict[str, dict]:
+    summary = {}
+    for label, result in results.items():
+        latencies = result['latencies_ms']
+        summary[label] = {
+            'path': result['path'],
+            'requests': len(latencies),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p90_ms': round(percentile(latencies, 90), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2) if latencies else 0.0,
+            'queries': max(result['queries']) if result['queries'] else 0,
+        }
+    return summary
+
+
+def compare(summary: Dict[str, dict], baseline: Dict[str, dict], latency_tolerance: float = 0.25) -> List[str]:
+    """Human-readable regressions of ``summary`` against ``baseline``"""
+    regressions = []
+    for label, current in summary.items():
+        previous = baseline.get(label)
+        if not previous:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{label}: {previous['queries']} -> {current['queries']} queries")
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + latency_tolerance):
+            regressions.append(f"{label}: p95 {previous['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+    return regressions
+
+
+def format_table(summary: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> str:
+    header = f"{'route':<26}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'queries':>9}"
+    if baseline:
+        header += f"{'base p95':>10}{'base q':>8}"
+    lines = [header, '-' * len(header)]
+    for label, row in summary.items():
+        line = (f"{label:<26}{row['p50_ms']:>9.1f}{row['p90_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                f"{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}{row['queries']:>9}")
+        if baseline:
+            previous = baseline.get(label)
+            line += f"{previous['p95_ms']:>10.1f}{previous['queries']:>8}" if previous else f"{'-':>10}{'-':>8}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path: str, scale: str, summary: Dict[str, dict]) -> None:
+    with open(path, 'w') as handle:
+        json.dump({'scale': scale, 'routes': summary}, handle, indent=2, sort_keys=True)
+        handle.write('\n')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Seeded load test for the main routes.
+
+Generates synthetic data (into a throwaway SQLite file unless --database-url
+points at an empty local Postgres), requests each route through the Flask
+test client, prints latency percentiles and query counts, and compares them
+with the stored baseline. Exits 1 when a route regressed.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scale large --iterations 50
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --database-url postgresql://localhost/bench
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def parse_args():
+    from benchmarks.data_generator import SCALES
+
+    parser = argparse.ArgumentParser(description='Benchmark the main routes against seeded data')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='medium')
+    parser.add_argument('--iterations', type=int, default=20, help='timed requests per route')
+    parser.add_argument('--database-url', help='empty database to seed (default: temporary SQLite file)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='allowed p95 growth before a route counts as regressed (0.25 = 25%%)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    temp_path = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        handle, temp_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        os.environ['DATABASE_URL'] = f'sqlite:///{temp_path}'
+    # Slow-request warnings would drown the report
+    os.environ.setdefault('PERF_SLOW_REQUEST_MS', '60000')
+    os.environ['PERF_INSTRUMENTATION'] = 'true'
+
+    from webapp import create_app
+    from webapp.extensions import db
+    from benchmarks.data_generator import generate
+    from benchmarks.driver import run_routes
+    from benchmarks.report import summarize, compare, format_table, load_baseline, save_baseline
+
+    app = create_app()
+    app.logger.setLevel(logging.ERROR)
+    try:
+        with app.app_context():
+            db.create_all()
+            print(f"Seeding '{args.scale}' data set into {db.engine.dialect.name}...")
+            ids = generate(db, args.scale)
+            db.session.remove()
+
+        results = run_routes(app, ids, iterations=args.iterations)
+        summary = summarize(results)
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+    stored = load_baseline(args.baseline)
+    baseline = stored['routes'] if stored and stored.get('scale') == args.scale else None
+    if stored and baseline is None:
+        print(f"Baseline was recorded at scale '{stored.get('scale')}'; not comparing")
+
+    print()
+    print(format_table(summary, baseline))
+
+    if args.save_baseline:
+        save_baseline(args.baseline, args.scale, summary)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if baseline:
+        regressions = compare(summary, baseline, args.latency_tolerance)
+        if regressions:
+            print("\n[FAIL] Regressions against baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print("\n[OK] No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Print EXPLAIN plans for the application's hottest queries.
+
+Runs against DATABASE_URL (Postgres or SQLite). With --seed, a throwaway
+SQLite database is created and filled with synthetic rows first, so the
+plans can be checked without touching a real database.
+
+Usage:
+    python explain_hot_queries.py --seed
+    DATABASE_URL=postgresql://... python explain_hot_queries.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def hot_queries():
+    """(label, SQLAlchemy query) pairs mirroring the filters used by the routes"""
+    from webapp.models import (
+        ClassEnrollment, Attendance, IDCard, LearningMaterial, MonthlyPayment, StudentClassTimeSelection,
+    )
+    today = date.today()
+    return [
+        ('Student enrollments by status',
+         ClassEnrollment.query.filter_by(user_id=1, status='completed')),
+        ('Class roster by type and status',
+         ClassEnrollment.query.filter_by(class_id=1, class_type='group', status='completed')),
+        ('Class attendance for a month',
+         Attendance.query.filter(Attendance.class_id == 1,
+                                 Attendance.attendance_date >= today.replace(day=1),
+                                 Attendance.attendance_date <= today)),
+        ('ID card for an entity',
+         IDCard.query.filter_by(entity_type='individual', entity_id=1, is_active=True)),
+        ('Materials for a class',
+         LearningMaterial.query.filter_by(class_type='group', actual_class_id=1)),
+        ('Bookings for a time slot',
+         StudentClassTimeSelection.query.filter_by(class_time_id=1)),
+        ('Payment ledger receipts for enrollments',
+         MonthlyPayment.query.filter(MonthlyPayment.enrollment_id.in_([1, 2, 3]))),
+    ]
+
+
+def seed(db, rows=2000):
+    from webapp.models import (
+        User, ClassEnrollment, Attendance, IDCard, LearningMaterial, ClassTime, StudentClassTimeSelection,
+        MonthlyPayment,
+    )
+    from datetime import time
+
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x',
+                  first_name='User', last_name=str(i)) for i in range(rows // 10)]
+    db.session.add_all(users)
+    db.session.flush()
+
+    class_types = ['individual', 'group', 'family', 'school']
+    enrollments = []
+    for i in range(rows):
+        enrollments.append(ClassEnrollment(user_id=users[i % len(users)].id, class_id=i % 50,
+                                           class_type=class_types[i % 4], amount=10,
+                                           status='completed' if i % 3 else 'pending'))
+    db.session.add_all(enrollments)
+    db.session.flush()
+
+    today = date.today()
+    for i in range(rows):
+        db.session.add(Attendance(student_id=users[i % len(users)].id, class_id=i % 50, class_type='group',
+                                  attendance_date=today - timedelta(days=i // len(users))))
+        db.session.add(IDCard(entity_type=class_types[i % 4], entity_id=i, system_id=f'STU-{i:05d}', name='x'))
+        db.session.add(LearningMaterial(content='x', class_id=f'group_{i % 50}', class_type=class_types[i % 4],
+                                        actual_class_id=i % 50, created_by=users[0].id))
+
+    slots = [ClassTime(class_type='individual', day='Monday', start_time=time(h % 24, 0),
+                       end_time=time(h % 24, 30)) for h in range(48)]
+    db.session.add_all(slots)
+    db.session.flush()
+    for i, enrollment in enumerate(enrollments[:len(slots) * 10]):
+        db.session.add(StudentClassTimeSelection(user_id=enrollment.user_id, enrollment_id=enrollment.id,
+                                                 class_time_id=slots[i % len(slots)].id, class_type='individual'))
+    for i, enrollment in enumerate(enrollments):
+        db.session.add(MonthlyPayment(user_id=enrollment.user_id, enrollment_id=enrollment.id,
+                                      class_type=enrollment.class_type, payment_month=i % 12 + 1,
+                                      payment_year=today.year, amount=10, receipt_url='x'))
+    db.session.commit()
+
+
+def explain(db, query):
+    from sqlalchemy import text
+    compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    prefix = 'EXPLAIN QUERY PLAN' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN ANALYZE'
+    rows = db.session.execute(text(f'{prefix} {compiled}')).fetchall()
+    return [' | '.join(str(col) for col in row) for row in rows]
+
+
+def main():
+    seed_db = '--seed' in sys.argv
+    temp_path = None
+    if seed_db:
+        handle, temp_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        os.environ['DATABASE_URL'] = f'sqlite:///{temp_path}'
+
+    from webapp import create_app
+    from webapp.extensions import db
+
+    app = create_app()
+    try:
+        with app.app_context():
+            if seed_db:
+                print("Seeding synthetic data...")
+                db.create_all()
+                seed(db)
+            print(f"Dialect: {db.engine.dialect.name}")
+            for label, query in hot_queries():
+                print("\n" + "=" * 70)
+                print(label)
+                print("=" * 70)
+                for line in explain(db, query):
+                    print(f"   {line}")
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
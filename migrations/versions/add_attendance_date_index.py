@@ -0,0 +1,36 @@
+"""Index attendance by date for the admin attendance page
+
+Revision ID: add_attendance_date_index
+Revises: add_resumable_uploads
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_attendance_date_index'
+down_revision = 'add_resumable_uploads'
+branch_labels = None
+depends_on = None
+
+
+INDEX = 'ix_attendance_date'
+
+
+def _has_index(inspector):
+    return INDEX in {index['name'] for index in inspector.get_indexes('attendance')}
+
+
+def upgrade():
+    # ensure_attendance_schema() creates it on deployments that only run create_all()
+    inspector = sa.inspect(op.get_bind())
+    if 'attendance' in inspector.get_table_names() and not _has_index(inspector):
+        op.create_index(INDEX, 'attendance', ['attendance_date', 'created_at', 'status'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'attendance' in inspector.get_table_names() and _has_index(inspector):
+        op.drop_index(INDEX, table_name='attendance')
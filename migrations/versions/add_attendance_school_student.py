@@ -0,0 +1,52 @@
+"""Store school-student attendance in attendance.school_student_id
+
+Revision ID: add_attendance_school_student
+Revises: add_group_system_id_unique
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_attendance_school_student'
+down_revision = 'add_group_system_id_unique'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Shared with the deploy's create_all() step, which cannot run migrations
+    from webapp.services.attendance_schema import upgrade_attendance_table
+    upgrade_attendance_table(op)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'attendance' not in inspector.get_table_names():
+        return
+    indexes = {index['name'] for index in inspector.get_indexes('attendance')}
+    for name in ('unique_school_student_attendance', 'unique_attendance'):
+        if name in indexes:
+            op.drop_index(name, table_name='attendance')
+
+    # Only one school-student row per admin, class and day fits the old constraint;
+    # keep the most recent and make sure its notes still carry the marker
+    op.execute(
+        "UPDATE attendance SET notes = 'school_student_' || school_student_id "
+        "WHERE school_student_id IS NOT NULL AND (notes IS NULL OR notes NOT LIKE '%school_student_%')"
+    )
+    op.execute(
+        'DELETE FROM attendance WHERE id IN ('
+        ' SELECT a.id FROM attendance a JOIN attendance b'
+        ' ON a.student_id = b.student_id AND a.class_id = b.class_id'
+        ' AND a.attendance_date = b.attendance_date AND a.id < b.id)'
+    )
+    with op.batch_alter_table('attendance') as batch_op:
+        if 'school_student_id' in {column['name'] for column in inspector.get_columns('attendance')}:
+            if 'fk_attendance_school_student' in {fk['name'] for fk in inspector.get_foreign_keys('attendance')}:
+                batch_op.drop_constraint('fk_attendance_school_student', type_='foreignkey')
+            batch_op.drop_column('school_student_id')
+        batch_op.create_unique_constraint('unique_attendance', ['student_id', 'class_id', 'attendance_date'])
@@ -0,0 +1,88 @@
+"""Add class_time_claim for contention-safe slot booking
+
+Revision ID: add_class_time_claims
+Revises: add_class_time_windows
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_class_time_claims'
+down_revision = 'add_class_time_windows'
+branch_labels = None
+depends_on = None
+
+
+def _slot_key(slot):
+    # Kept in sync with webapp/services/slot_booking.py:slot_key()
+    if slot.shared_slot_group_id:
+        return (f"{slot.shared_slot_group_id}|{slot.day}|"
+                f"{slot.start_time.strftime('%H:%M')}|{slot.end_time.strftime('%H:%M')}")
+    return f"time:{slot.id}"
+
+
+def _backfill(bind):
+    """
+    One claim per selection that has none; slots that are already double-booked
+    get extra seats. Kept in sync with webapp/services/slot_booking.py:backfill_claims()
+    """
+    selection = sa.table('student_class_time_selection', sa.column('id'), sa.column('class_time_id'),
+                         sa.column('selected_at'))
+    class_time = sa.table('class_time', sa.column('id'), sa.column('day'), sa.column('start_time', sa.Time),
+                          sa.column('end_time', sa.Time), sa.column('shared_slot_group_id'))
+    claim = sa.table('class_time_claim', sa.column('slot_key'), sa.column('seat'), sa.column('selection_id'),
+                     sa.column('created_at'))
+    rows = bind.execute(
+        sa.select(selection.c.id.label('selection_id'), selection.c.selected_at, class_time)
+        .join(class_time, class_time.c.id == selection.c.class_time_id)
+        .outerjoin(claim, claim.c.selection_id == selection.c.id)
+        .where(claim.c.selection_id.is_(None))
+        .order_by(selection.c.selected_at, selection.c.id)
+    ).all()
+    taken = {}
+    for key, seat in bind.execute(sa.select(claim.c.slot_key, claim.c.seat)):
+        taken.setdefault(key, set()).add(seat)
+    claims = []
+    for row in rows:
+        key = _slot_key(row)
+        seats = taken.setdefault(key, set())
+        seat = 1
+        while seat in seats:
+            seat += 1
+        seats.add(seat)
+        claims.append({'slot_key': key, 'seat': seat, 'selection_id': row.selection_id,
+                       'created_at': row.selected_at})
+    if claims:
+        bind.execute(claim.insert(), claims)
+
+
+def upgrade():
+    bind = op.get_bind()
+    tables = set(sa.inspect(bind).get_table_names())
+    if 'student_class_time_selection' not in tables:
+        return
+
+    if 'class_time_claim' not in tables:
+        op.create_table(
+            'class_time_claim',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('slot_key', sa.String(length=150), nullable=False),
+            sa.Column('seat', sa.Integer(), nullable=False),
+            sa.Column('selection_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['selection_id'], ['student_class_time_selection.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('selection_id'),
+            sa.UniqueConstraint('slot_key', 'seat', name='unique_class_time_claim_seat')
+        )
+    # Also when the deploy's db.create_all() made the table: its selections have no claims yet
+    if 'class_time' in tables:
+        _backfill(bind)
+
+
+def downgrade():
+    if 'class_time_claim' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table('class_time_claim')
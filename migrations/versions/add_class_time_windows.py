@@ -0,0 +1,75 @@
+"""Add class_time_window with precomputed UTC schedule windows
+
+Revision ID: add_class_time_windows
+Revises: add_attendance_school_student
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_class_time_windows'
+down_revision = 'add_attendance_school_student'
+branch_labels = None
+depends_on = None
+
+
+def _backfill(bind):
+    """Compute windows for the active slots that already exist"""
+    import pytz
+    from webapp.services.class_schedule import weekly_windows
+
+    class_time = sa.table('class_time', sa.column('id'), sa.column('class_type'), sa.column('class_id'),
+                          sa.column('day'), sa.column('start_time', sa.Time), sa.column('end_time', sa.Time),
+                          sa.column('timezone'), sa.column('is_active', sa.Boolean))
+    window = sa.table('class_time_window', sa.column('class_time_id'), sa.column('class_type'),
+                      sa.column('class_id'), sa.column('start_minute'), sa.column('end_minute'),
+                      sa.column('effective_from'), sa.column('effective_until'))
+    rows = []
+    for slot in bind.execute(sa.select(class_time).where(class_time.c.is_active == sa.true())):
+        try:
+            windows = weekly_windows(slot.day, slot.start_time, slot.end_time, slot.timezone)
+        except pytz.UnknownTimeZoneError:
+            print(f"Skipping class_time {slot.id}: unknown timezone {slot.timezone!r}")
+            continue
+        rows.extend({'class_time_id': slot.id, 'class_type': slot.class_type, 'class_id': slot.class_id,
+                     **w._asdict()} for w in windows)
+    if rows:
+        bind.execute(window.insert(), rows)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if 'class_time' not in tables:
+        return
+
+    if 'class_time_window' not in tables:
+        op.create_table(
+            'class_time_window',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('class_time_id', sa.Integer(), nullable=False),
+            sa.Column('class_type', sa.String(length=20), nullable=False),
+            sa.Column('class_id', sa.Integer(), nullable=True),
+            sa.Column('start_minute', sa.Integer(), nullable=False),
+            sa.Column('end_minute', sa.Integer(), nullable=False),
+            sa.Column('effective_from', sa.DateTime(), nullable=True),
+            sa.Column('effective_until', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['class_time_id'], ['class_time.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_class_time_window_minutes', 'class_time_window', ['start_minute', 'end_minute'])
+        op.create_index('ix_class_time_window_class_time', 'class_time_window', ['class_time_id'])
+
+    # The deploy's db.create_all() may have created the table already, empty
+    window_count = bind.execute(sa.select(sa.func.count()).select_from(sa.table('class_time_window'))).scalar()
+    if not window_count:
+        _backfill(bind)
+
+
+def downgrade():
+    if 'class_time_window' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table('class_time_window')
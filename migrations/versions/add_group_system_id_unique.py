@@ -0,0 +1,47 @@
+"""Add unique index on class_enrollment.group_system_id
+
+Revision ID: add_group_system_id_unique
+Revises: add_id_sequences
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_group_system_id_unique'
+down_revision = 'add_id_sequences'
+branch_labels = None
+depends_on = None
+
+
+INDEX_NAME = 'ix_class_enrollment_group_system_id'
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'class_enrollment' not in inspector.get_table_names():
+        return
+    columns = {column['name'] for column in inspector.get_columns('class_enrollment')}
+    indexes = {index['name'] for index in inspector.get_indexes('class_enrollment')}
+    if 'group_system_id' not in columns or INDEX_NAME in indexes:
+        return
+
+    duplicates = bind.execute(sa.text(
+        'SELECT group_system_id FROM class_enrollment WHERE group_system_id IS NOT NULL '
+        'GROUP BY group_system_id HAVING COUNT(*) > 1'
+    )).scalars().all()
+    if duplicates:
+        # Leave existing data alone; the index can be added once these are resolved
+        print(f"Skipping {INDEX_NAME}: duplicate Group System IDs {', '.join(duplicates)}")
+        return
+    op.create_index(INDEX_NAME, 'class_enrollment', ['group_system_id'], unique=True)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'class_enrollment' in inspector.get_table_names() and \
+            INDEX_NAME in {index['name'] for index in inspector.get_indexes('class_enrollment')}:
+        op.drop_index(INDEX_NAME, table_name='class_enrollment')
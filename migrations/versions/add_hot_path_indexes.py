@@ -0,0 +1,49 @@
+"""Add composite indexes for hot filter paths
+
+Revision ID: add_hot_path_indexes
+Revises: add_gallery_victory
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_hot_path_indexes'
+down_revision = 'add_gallery_victory'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) - kept in sync with the models' __table_args__
+INDEXES = [
+    ('ix_class_enrollment_user_status', 'class_enrollment', ['user_id', 'status']),
+    ('ix_class_enrollment_class_type_status', 'class_enrollment', ['class_id', 'class_type', 'status']),
+    ('ix_attendance_class_date', 'attendance', ['class_id', 'attendance_date']),
+    ('ix_id_card_entity', 'id_card', ['entity_type', 'entity_id', 'is_active']),
+    ('ix_learning_material_class', 'learning_material', ['class_type', 'actual_class_id']),
+    ('ix_student_class_time_selection_class_time', 'student_class_time_selection', ['class_time_id']),
+]
+
+
+def _existing_indexes(inspector, table):
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # Several of these tables were created by the /admin/setup-* routes rather
+    # than by migrations, so skip tables that are missing and indexes that exist
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    for name, table, columns in INDEXES:
+        if table in tables and name not in _existing_indexes(inspector, table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    for name, table, columns in reversed(INDEXES):
+        if table in tables and name in _existing_indexes(inspector, table):
+            op.drop_index(name, table_name=table)
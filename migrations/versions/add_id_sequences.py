@@ -0,0 +1,68 @@
+"""Add sequences/counters for STU and FAM system IDs
+
+Revision ID: add_id_sequences
+Revises: add_hot_path_indexes
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_id_sequences'
+down_revision = 'add_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+# (counter name, sequence name, prefix, table, column) - kept in sync with webapp/services/id_allocator.py
+COUNTERS = [
+    ('student', 'student_system_id_seq', 'STU', 'user', 'student_id'),
+    ('family', 'family_system_id_seq', 'FAM', 'class_enrollment', 'family_system_id'),
+]
+
+
+def _current_max(bind, prefix, table, column):
+    source = sa.table(table, sa.column(column))
+    values = bind.execute(sa.select(source.c[column]).where(source.c[column].like(f'{prefix}-%'))).scalars()
+    highest = 0
+    for value in values:
+        number = value[len(prefix) + 1:]
+        if number.isdigit():
+            highest = max(highest, int(number))
+    return highest
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if 'id_counter' not in tables:
+        op.create_table(
+            'id_counter',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+    counter = sa.table('id_counter', sa.column('name'), sa.column('value'))
+
+    for name, sequence, prefix, table, column in COUNTERS:
+        current = _current_max(bind, prefix, table, column) if table in tables else 0
+        if bind.dialect.name == 'postgresql':
+            op.execute(f'CREATE SEQUENCE IF NOT EXISTS {sequence}')
+            # setval(..., false): the next nextval() returns exactly current + 1
+            bind.execute(sa.text('SELECT setval(CAST(:name AS regclass), :value, false)'), {'name': sequence, 'value': current + 1})
+        else:
+            bind.execute(counter.delete().where(counter.c.name == name))
+            bind.execute(counter.insert().values(name=name, value=current))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for name, sequence, prefix, table, column in COUNTERS:
+            op.execute(f'DROP SEQUENCE IF EXISTS {sequence}')
+    if 'id_counter' in sa.inspect(bind).get_table_names():
+        op.drop_table('id_counter')
@@ -0,0 +1,36 @@
+"""Index monthly_payment by enrollment and month for the payment ledger
+
+Revision ID: add_monthly_payment_ledger_index
+Revises: add_class_time_claims
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_monthly_payment_ledger_index'
+down_revision = 'add_class_time_claims'
+branch_labels = None
+depends_on = None
+
+
+INDEX = 'ix_monthly_payment_enrollment_month'
+
+
+def _has_index(inspector):
+    return INDEX in {index['name'] for index in inspector.get_indexes('monthly_payment')}
+
+
+def upgrade():
+    # monthly_payment is created by /admin/setup-monthly-payment-table on older deployments
+    inspector = sa.inspect(op.get_bind())
+    if 'monthly_payment' in inspector.get_table_names() and not _has_index(inspector):
+        op.create_index(INDEX, 'monthly_payment', ['enrollment_id', 'payment_year', 'payment_month'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'monthly_payment' in inspector.get_table_names() and _has_index(inspector):
+        op.drop_index(INDEX, table_name='monthly_payment')
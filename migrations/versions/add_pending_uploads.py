@@ -0,0 +1,54 @@
+"""Add pending_upload for background Cloudinary uploads
+
+Revision ID: add_pending_uploads
+Revises: add_monthly_payment_ledger_index
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_pending_uploads'
+down_revision = 'add_monthly_payment_ledger_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'pending_upload' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'pending_upload',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=32), nullable=False),
+        sa.Column('spool_path', sa.String(length=500), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('folder', sa.String(length=100), nullable=True),
+        sa.Column('resource_type', sa.String(length=20), nullable=True),
+        sa.Column('public_id', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('targets', sa.Text(), nullable=True),
+        sa.Column('url', sa.String(length=500), nullable=True),
+        sa.Column('result_public_id', sa.String(length=255), nullable=True),
+        sa.Column('bytes', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token')
+    )
+    op.create_index('ix_pending_upload_status_next_attempt', 'pending_upload', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    if 'pending_upload' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_index('ix_pending_upload_status_next_attempt', table_name='pending_upload')
+        op.drop_table('pending_upload')
@@ -0,0 +1,48 @@
+"""Add resumable_upload for chunked uploads
+
+Revision ID: add_resumable_uploads
+Revises: add_pending_uploads
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_resumable_uploads'
+down_revision = 'add_pending_uploads'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'resumable_upload' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'resumable_upload',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=32), nullable=False),
+        sa.Column('purpose', sa.String(length=40), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('received', sa.BigInteger(), nullable=False),
+        sa.Column('spool_path', sa.String(length=500), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('pending_upload_id', sa.Integer(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['pending_upload_id'], ['pending_upload.id']),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token')
+    )
+    op.create_index('ix_resumable_upload_status_updated', 'resumable_upload', ['status', 'updated_at'])
+
+
+def downgrade():
+    if 'resumable_upload' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_index('ix_resumable_upload_status_updated', table_name='resumable_upload')
+        op.drop_table('resumable_upload')
@@ -18,6 +18,13 @@ try:
     from app import app, db
     with app.app_context():
         db.create_all()
+        from webapp.services.attendance_schema import ensure_attendance_schema
+        ensure_attendance_schema()
+        from webapp.services.class_schedule import ensure_class_time_windows
+        ensure_class_time_windows()
+        from webapp.services.slot_booking import backfill_claims
+        backfill_claims()
+        db.session.commit()
         print('✅ Database initialized')
 except Exception as e:
     print(f'❌ Database init error: {e}')
@@ -0,0 +1,246 @@
+/*
+ * Browser-direct uploads to Cloudinary (see webapp/services/direct_upload.py).
+ *
+ * A file input marked data-direct-upload="<purpose>" is sent straight to
+ * Cloudinary when its form is submitted; the form then posts a token in
+ * "<name>_upload" instead of the file. If direct uploads are unavailable
+ * (503) or Cloudinary can't be reached, the file goes up in resumable chunks
+ * through our own API (webapp/services/resumable_upload.py), and failing
+ * that it is posted with the form as before.
+ */
+(function () {
+    'use strict';
+
+    // Cloudinary accepts chunks of at least 5MB; large videos go up in 20MB pieces
+    const CHUNK_SIZE = 20 * 1024 * 1024;
+    // Consecutive failed chunks before a resumable upload gives up
+    const MAX_RETRIES = 8;
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    function networkError(message) {
+        const err = new Error(message);
+        err.network = true;
+        return err;
+    }
+
+    function postJSON(url, body) {
+        return fetch(url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(body)
+        }).then(function (response) {
+            return response.json().catch(function () { return {}; }).then(function (data) {
+                return {status: response.status, ok: response.ok, data: data};
+            });
+        });
+    }
+
+    function getJSON(url) {
+        return fetch(url, {credentials: 'same-origin'}).then(function (response) {
+            if (!response.ok) throw networkError('Could not check the upload');
+            return response.json();
+        });
+    }
+
+    function sendChunk(url, params, blob, filename, headers, onProgress) {
+        return new Promise(function (resolve, reject) {
+            const xhr = new XMLHttpRequest();
+            const body = new FormData();
+            Object.keys(params).forEach(function (key) { body.append(key, params[key]); });
+            body.append('file', blob, filename);
+            xhr.open('POST', url);
+            Object.keys(headers).forEach(function (key) { xhr.setRequestHeader(key, headers[key]); });
+            xhr.upload.onprogress = function (e) { if (e.lengthComputable) onProgress(e.loaded); };
+            xhr.onload = function () {
+                let data = {};
+                try { data = JSON.parse(xhr.responseText); } catch (err) { /* reported below */ }
+                if (xhr.status >= 200 && xhr.status < 300) {
+                    resolve(data);
+                } else {
+                    reject(new Error((data.error && data.error.message) || 'Upload to Cloudinary failed'));
+                }
+            };
+            xhr.onerror = function () { reject(networkError('Network error while uploading')); };
+            xhr.send(body);
+        });
+    }
+
+    function sendRaw(url, blob, headers, onProgress) {
+        return new Promise(function (resolve, reject) {
+            const xhr = new XMLHttpRequest();
+            xhr.open('PATCH', url);
+            Object.keys(headers).forEach(function (key) { xhr.setRequestHeader(key, headers[key]); });
+            xhr.upload.onprogress = function (e) { if (e.lengthComputable) onProgress(e.loaded); };
+            xhr.onload = function () {
+                let data = {};
+                try { data = JSON.parse(xhr.responseText); } catch (err) { /* no body */ }
+                resolve({status: xhr.status, ok: xhr.status >= 200 && xhr.status < 300, data: data});
+            };
+            xhr.onerror = function () { reject(networkError('Network error while uploading')); };
+            xhr.send(blob);
+        });
+    }
+
+    async function uploadToCloudinary(signed, file, onProgress) {
+        const uploadId = Date.now().toString(36) + Math.random().toString(36).slice(2);
+        const chunked = file.size > CHUNK_SIZE;
+        let start = 0;
+        let result;
+        do {
+            const end = Math.min(start + CHUNK_SIZE, file.size);
+            const headers = chunked ? {
+                'X-Unique-Upload-Id': uploadId,
+                'Content-Range': 'bytes ' + start + '-' + (end - 1) + '/' + file.size
+            } : {};
+            const offset = start;
+            result = await sendChunk(signed.upload_url, signed.params, file.slice(start, end), file.name, headers,
+                function (loaded) { onProgress((offset + loaded) / (file.size || 1)); });
+            start = end;
+        } while (start < file.size);
+        return result;
+    }
+
+    // Resolves to the upload token, or null when direct uploads are unavailable
+    async function directUpload(input, onProgress) {
+        const file = input.files[0];
+        const signed = await postJSON('/api/direct-uploads/sign', {
+            purpose: input.dataset.directUpload,
+            filename: file.name
+        });
+        if (signed.status === 503) return null;
+        if (!signed.ok) throw new Error(signed.data.error || 'Could not start the upload');
+
+        const response = await uploadToCloudinary(signed.data, file, onProgress);
+        const done = await postJSON('/api/direct-uploads/complete', {ticket: signed.data.ticket, response: response});
+        if (!done.ok) throw new Error(done.data.error || 'Could not verify the upload');
+        return done.data.token;
+    }
+
+    // Sends the file in chunks, picking up from the server's offset after a dropped connection
+    async function resumableUpload(input, onProgress) {
+        const file = input.files[0];
+        const created = await postJSON('/api/resumable-uploads', {
+            purpose: input.dataset.directUpload,
+            filename: file.name,
+            size: file.size
+        });
+        if (created.status === 503) return null;
+        if (!created.ok) throw new Error(created.data.error || 'Could not start the upload');
+
+        let state = created.data;
+        const url = '/api/resumable-uploads/' + state.token;
+        let failures = 0;
+        while (state.status !== 'complete') {
+            const offset = state.offset;
+            const end = Math.min(offset + state.chunk_size, file.size);
+            try {
+                const result = await sendRaw(url, file.slice(offset, end), {
+                    'Upload-Offset': String(offset),
+                    'Content-Type': 'application/octet-stream'
+                }, function (loaded) { onProgress((offset + loaded) / file.size); });
+                if (result.status === 409) {
+                    // The server is somewhere else (e.g. an earlier attempt did arrive): resume from its state
+                    state = await getJSON(url);
+                    continue;
+                }
+                if (!result.ok) {
+                    const err = new Error(result.data.error || 'Upload failed');
+                    err.network = result.status >= 500;
+                    throw err;
+                }
+                state = result.data;
+                failures = 0;
+            } catch (err) {
+                if (!err.network || ++failures > MAX_RETRIES) throw err;
+                await sleep(Math.min(30000, 1000 * Math.pow(2, failures)));
+                state = await getJSON(url).catch(function () { return state; });
+            }
+        }
+        return state.upload_token;
+    }
+
+    // Resolves to the upload token, or null when the file should be posted with the form instead
+    async function uploadFile(input, onProgress) {
+        let token = null;
+        try {
+            token = await directUpload(input, onProgress);
+        } catch (err) {
+            // Cloudinary can't be reached from this browser; send the file through us instead
+            if (!err.network) throw err;
+        }
+        if (token !== null) return token;
+        return resumableUpload(input, onProgress);
+    }
+
+    function progressBar(input) {
+        const wrapper = document.createElement('div');
+        wrapper.className = 'progress mt-2';
+        wrapper.innerHTML = '<div class="progress-bar progress-bar-striped progress-bar-animated" role="progressbar" style="width: 0%">0%</div>';
+        input.insertAdjacentElement('afterend', wrapper);
+        const bar = wrapper.firstElementChild;
+        return {
+            update: function (fraction) {
+                const percent = Math.min(100, Math.round(fraction * 100)) + '%';
+                bar.style.width = percent;
+                bar.textContent = percent;
+            },
+            remove: function () { wrapper.remove(); }
+        };
+    }
+
+    document.addEventListener('submit', async function (event) {
+        const form = event.target;
+        if (event.defaultPrevented || form.dataset.directUploadDone) return;
+        const inputs = Array.from(form.querySelectorAll('input[type=file][data-direct-upload]'))
+            .filter(function (input) { return !input.disabled && input.files.length; });
+        if (!inputs.length) return;
+
+        event.preventDefault();
+        const submitter = event.submitter;
+        const buttons = form.querySelectorAll('button[type=submit], input[type=submit]');
+        buttons.forEach(function (button) { button.disabled = true; });
+
+        try {
+            for (const input of inputs) {
+                const progress = progressBar(input);
+                let token;
+                try {
+                    token = await uploadFile(input, progress.update);
+                } finally {
+                    progress.remove();
+                }
+                if (token === null) continue;
+                const hidden = document.createElement('input');
+                hidden.type = 'hidden';
+                hidden.name = input.name + '_upload';
+                hidden.value = token;
+                form.appendChild(hidden);
+                // Disabled inputs are neither posted nor validated
+                input.disabled = true;
+            }
+        } catch (err) {
+            buttons.forEach(function (button) { button.disabled = false; });
+            alert('Upload failed: ' + err.message);
+            return;
+        }
+
+        buttons.forEach(function (button) { button.disabled = false; });
+        form.dataset.directUploadDone = '1';
+        if (form.requestSubmit) {
+            form.requestSubmit(submitter || undefined);
+        } else {
+            if (submitter && submitter.name) {
+                const hidden = document.createElement('input');
+                hidden.type = 'hidden';
+                hidden.name = submitter.name;
+                hidden.value = submitter.value;
+                form.appendChild(hidden);
+            }
+            form.submit();
+        }
+    });
+})();
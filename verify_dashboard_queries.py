@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Verify the student dashboard stays within its SQL query budget.
+
+Seeds a throwaway SQLite database with a student enrolled in individual,
+group, family and school classes, renders /student/dashboard at two roster
+sizes and fails if the statement count exceeds DASHBOARD_QUERY_BUDGET or
+grows with the number of classmates.
+
+Usage: python verify_dashboard_queries.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(db, classmates):
+    from webapp.models import (
+        User, GroupClass, ClassEnrollment, Attendance, FamilyMember, SchoolStudent,
+        LearningMaterial, ClassTime, StudentClassTimeSelection, MonthlyPayment, School,
+    )
+
+    def make_user(username, **kwargs):
+        user = User(username=username, email=f'{username}@example.com', first_name=username.title(),
+                    last_name='Test', **kwargs)
+        user.set_password('x')
+        db.session.add(user)
+        return user
+
+    teacher = make_user('teacher', is_admin=True, is_student=False)
+    student = make_user('student', student_id='STU-00001', is_school_admin=True)
+    db.session.flush()
+
+    school = School(school_system_id='SCH-TEST01', school_name='Test School', school_email='s@example.com',
+                    admin_name='Admin', admin_email='a@example.com', status='active',
+                    payment_status='completed', user_id=student.id)
+    db.session.add(school)
+
+    today = date.today()
+    classes = []
+    for class_type in ('individual', 'group', 'family', 'school'):
+        cls = GroupClass(name=f'{class_type} class', teacher_id=teacher.id, class_type=class_type)
+        db.session.add(cls)
+        classes.append(cls)
+    db.session.flush()
+
+    for cls in classes:
+        enrollment = ClassEnrollment(user_id=student.id, class_id=cls.id, class_type=cls.class_type,
+                                     amount=10, status='completed', enrolled_at=datetime.utcnow() - timedelta(days=90))
+        db.session.add(enrollment)
+        db.session.flush()
+        for day in range(1, today.day + 1):
+            db.session.add(Attendance(student_id=student.id, class_id=cls.id, class_type=cls.class_type,
+                                      attendance_date=date(today.year, today.month, day)))
+        db.session.add(LearningMaterial(title='m', content='c', class_id=f'{cls.class_type}_{cls.id}',
+                                        class_type=cls.class_type, actual_class_id=cls.id, created_by=teacher.id))
+        db.session.add(MonthlyPayment(user_id=student.id, enrollment_id=enrollment.id, class_type=cls.class_type,
+                                      payment_month=today.month, payment_year=today.year, amount=10,
+                                      receipt_url='http://example.com/r.png'))
+
+        if cls.class_type in ('group', 'family'):
+            for i in range(classmates):
+                mate = make_user(f'{cls.class_type}_mate_{i}')
+                db.session.flush()
+                db.session.add(ClassEnrollment(user_id=mate.id, class_id=cls.id, class_type=cls.class_type,
+                                               amount=10, status='completed'))
+                db.session.add(Attendance(student_id=mate.id, class_id=cls.id, class_type=cls.class_type,
+                                          attendance_date=today))
+        if cls.class_type == 'family':
+            for i in range(4):
+                db.session.add(FamilyMember(enrollment_id=enrollment.id, class_id=cls.id, member_name=f'Member {i}',
+                                            registered_by=student.id))
+        if cls.class_type == 'school':
+            for i in range(classmates):
+                db.session.add(SchoolStudent(enrollment_id=enrollment.id, class_id=cls.id, school_name='Test School',
+                                             student_name=f'Pupil {i}', registered_by=student.id))
+
+        slot = ClassTime(class_type=cls.class_type, class_id=cls.id if cls.class_type in ('group', 'school') else None,
+                         day='Monday', start_time=time(16, 0), end_time=time(17, 0), shared_slot_group_id='shared-1')
+        db.session.add(slot)
+        db.session.flush()
+        if cls.class_type in ('individual', 'family'):
+            db.session.add(StudentClassTimeSelection(user_id=student.id, enrollment_id=enrollment.id,
+                                                     class_time_id=slot.id, class_type=cls.class_type))
+
+    db.session.commit()
+    return student.id
+
+
+def count_dashboard_queries(classmates):
+    from sqlalchemy import event
+    from webapp import create_app
+    from webapp.extensions import db
+
+    app = create_app()
+    statements = []
+    with app.app_context():
+        db.create_all()
+        student_id = seed(db, classmates)
+        db.session.remove()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['student_user_id'] = student_id
+        client.get('/student/dashboard')  # warm up one-time hooks
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response = client.get('/student/dashboard')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+    if response.status_code != 200:
+        raise RuntimeError(f'/student/dashboard returned {response.status_code}')
+    return len(statements)
+
+
+def main():
+    from webapp.services.dashboard_loader import DASHBOARD_QUERY_BUDGET
+
+    results = {}
+    for classmates in (3, 25):
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        try:
+            results[classmates] = count_dashboard_queries(classmates)
+        finally:
+            os.remove(path)
+        print(f"   {classmates:3d} classmates per class: {results[classmates]} queries")
+
+    small, large = results[3], results[25]
+    if large > DASHBOARD_QUERY_BUDGET:
+        print(f"[FAIL] Dashboard issued {large} queries (budget {DASHBOARD_QUERY_BUDGET})")
+        return 1
+    if large != small:
+        print(f"[FAIL] Query count grows with roster size ({small} -> {large})")
+        return 1
+    print(f"[OK] Dashboard within budget ({large}/{DASHBOARD_QUERY_BUDGET} queries)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -43,6 +43,9 @@ def create_app():
     elif db_url.startswith('postgresql://'):
         db_url = db_url.replace('postgresql://', 'postgresql+psycopg://', 1)
     app.config['SQLALCHEMY_DATABASE_URI'] = db_url or 'sqlite:///learning_management.db'
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # sqlite3.connect() has no connect_timeout argument
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'].pop('connect_args', None)
 
     # Cloudinary configuration
     cloudinary.config(
@@ -55,6 +58,40 @@ def create_app():
     # File upload configuration
     app.config['UPLOAD_FOLDER'] = 'uploads'  # Virtual path for Cloudinary
     app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max upload (Cloudinary free tier limit)
+    # Cloudinary uploads are spooled to disk and pushed by background threads (0 workers uploads inline after commit)
+    app.config['UPLOAD_SPOOL_DIR'] = os.environ.get('UPLOAD_SPOOL_DIR') or os.path.join(app.instance_path, 'upload_spool')
+    app.config['UPLOAD_WORKERS'] = int(os.environ.get('UPLOAD_WORKERS', '2'))
+    # Serverless hosts (Vercel) freeze the process after the response and have a read-only instance path,
+    # so files are stored inside the request there instead of spooled (see services/upload_queue.py)
+    app.config['SERVERLESS'] = bool(os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+    app.config['UPLOAD_MAX_ATTEMPTS'] = int(os.environ.get('UPLOAD_MAX_ATTEMPTS', '5'))
+    app.config['UPLOAD_RETRY_DELAY'] = int(os.environ.get('UPLOAD_RETRY_DELAY', '30'))  # doubled after each failure
+    app.config['UPLOAD_STALE_SECONDS'] = int(os.environ.get('UPLOAD_STALE_SECONDS', '1800'))
+    # Browsers upload large media straight to Cloudinary (False sends it in chunks through us instead)
+    app.config['DIRECT_UPLOADS'] = os.environ.get('DIRECT_UPLOADS', 'true').lower() != 'false'
+    # Direct upload tickets and tokens expire after this many seconds
+    app.config['DIRECT_UPLOAD_MAX_AGE'] = int(os.environ.get('DIRECT_UPLOAD_MAX_AGE', str(6 * 3600)))
+    # Chunked uploads stream each chunk to the spool; idle ones are swept after RESUMABLE_UPLOAD_EXPIRY seconds
+    app.config['RESUMABLE_CHUNK_SIZE'] = int(os.environ.get('RESUMABLE_CHUNK_SIZE', str(5 * 1024 * 1024)))
+    app.config['RESUMABLE_UPLOAD_MAX_SIZE'] = int(os.environ.get('RESUMABLE_UPLOAD_MAX_SIZE', str(2 * 1024 ** 3)))
+    app.config['RESUMABLE_UPLOAD_EXPIRY'] = int(os.environ.get('RESUMABLE_UPLOAD_EXPIRY', str(24 * 3600)))
+    # Anonymous (receipt) uploads that may be receiving at once across all sessions; more get a 429
+    app.config['ANONYMOUS_UPLOAD_LIMIT'] = int(os.environ.get('ANONYMOUS_UPLOAD_LIMIT', '100'))
+    # Where uploads are stored: 'cloudinary', 'local' (content-addressed files under STORAGE_LOCAL_ROOT),
+    # or empty to use Cloudinary when it is configured and local disk otherwise
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', '')
+    app.config['STORAGE_LOCAL_ROOT'] = os.environ.get('STORAGE_LOCAL_ROOT') or os.path.join(app.instance_path, 'media')
+    # Local files are sent by the front server: 'x-sendfile' or 'x-accel-redirect' (empty sends them from Flask).
+    # X-Accel-Redirect points at STORAGE_ACCEL_PREFIX + the path relative to STORAGE_SENDFILE_ROOT
+    app.config['STORAGE_SENDFILE'] = os.environ.get('STORAGE_SENDFILE', '').lower()
+    app.config['STORAGE_SENDFILE_ROOT'] = os.environ.get('STORAGE_SENDFILE_ROOT') or base_dir
+    app.config['STORAGE_ACCEL_PREFIX'] = os.environ.get('STORAGE_ACCEL_PREFIX', '/_protected/')
+    # Images are also rendered from copies bounded to these widths (Cloudinary transformations or local copies)
+    app.config['IMAGE_VARIANT_WIDTHS'] = tuple(
+        int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '160,320,640,1280').split(',') if width.strip()
+    )
+    # A course file the user was allowed once is served from the session's grant for this many seconds
+    app.config['MEDIA_GRANT_TTL'] = int(os.environ.get('MEDIA_GRANT_TTL', '3600'))
 
     app.config['DEEPINFRA_API_KEY'] = os.environ.get('DEEPINFRA_API_KEY')
     app.config['DEEPINFRA_API_URL'] = os.environ.get('DEEPINFRA_API_URL', 'https://api.deepinfra.com/v1/openai/chat/completions')
@@ -71,6 +108,20 @@ def create_app():
     app.config['WHATSAPP_PHONE_NUMBER_ID'] = os.environ.get('WHATSAPP_PHONE_NUMBER_ID')
     app.config['RESET_TOKEN_SALT'] = os.environ.get('RESET_TOKEN_SALT', 'password-reset-salt-change-in-production')
 
+    # Process-local caches: full reload after the TTL, cross-worker version check every poll interval (seconds)
+    app.config['SITE_SETTINGS_CACHE_TTL'] = int(os.environ.get('SITE_SETTINGS_CACHE_TTL', '300'))
+    app.config['PRICING_CACHE_TTL'] = int(os.environ.get('PRICING_CACHE_TTL', '3600'))
+    app.config['HOMEPAGE_CACHE_TTL'] = int(os.environ.get('HOMEPAGE_CACHE_TTL', '600'))
+    app.config['CACHE_VERSION_POLL_INTERVAL'] = int(os.environ.get('CACHE_VERSION_POLL_INTERVAL', '5'))
+    # Live-class status entries expire at the next slot start/end, but never live longer than the max age
+    app.config['LIVE_STATUS_CACHE_TTL'] = int(os.environ.get('LIVE_STATUS_CACHE_TTL', '3600'))
+    app.config['LIVE_STATUS_CACHE_MAX_AGE'] = int(os.environ.get('LIVE_STATUS_CACHE_MAX_AGE', '300'))
+
+    # Request instrumentation: Server-Timing headers, slow-request log, /admin/perf rolling window (seconds)
+    app.config['PERF_INSTRUMENTATION'] = os.environ.get('PERF_INSTRUMENTATION', 'true').lower() == 'true'
+    app.config['PERF_SLOW_REQUEST_MS'] = int(os.environ.get('PERF_SLOW_REQUEST_MS', '1000'))
+    app.config['PERF_WINDOW_SECONDS'] = int(os.environ.get('PERF_WINDOW_SECONDS', '900'))
+
     # No need to create upload directories in production (using Cloudinary)
     if os.environ.get('FLASK_ENV') != 'production':
         try:
@@ -85,7 +136,11 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
-    
+
+    # Registered first so its timer wraps every other before_request hook
+    from .services import perf
+    perf.init_app(app)
+
     # In production, tables are created via migrations (flask db upgrade)
     # db.create_all() is not used when using Flask-Migrate
     login_manager.login_view = 'auth.login'
@@ -160,6 +215,10 @@ def create_app():
     app.register_blueprint(health_bp)
     app.register_blueprint(schools_bp)
     
+    # responsive_image() / image_variant() / image_srcset() template helpers
+    from .services import images
+    images.init_app(app)
+
     # Context processor to inject site settings into all templates
     # Made lazy to avoid database access during health checks
     @app.context_processor
@@ -179,11 +238,12 @@ def create_app():
                 'contact_email': ''
             }
         
-        # Only query database when actually rendering a template that needs it
+        # Served from the process-local settings cache; only hits the database on reload
         try:
             from .models.site_settings import SiteSettings
-            whatsapp_number = SiteSettings.get_setting('whatsapp_number', '')
-            contact_email = SiteSettings.get_setting('contact_email', '')
+            settings = SiteSettings.get_all_settings()
+            whatsapp_number = settings.get('whatsapp_number') or ''
+            contact_email = settings.get('contact_email') or ''
         except Exception:
             whatsapp_number = ''
             contact_email = ''
@@ -230,8 +290,13 @@ def create_app():
            request.path.startswith('/api/health') or \
            request.path in ['/health', '/status', '/ping']:
             return None
+        if not app.logger.isEnabledFor(logging.DEBUG):
+            return None
         app.logger.debug('Headers: %s', request.headers)
-        app.logger.debug('Body: %s', request.get_data())
+        # Only small form/JSON bodies: reading an upload here would buffer all of it in memory
+        if request.mimetype in ('application/json', 'application/x-www-form-urlencoded') and \
+           (request.content_length or 0) <= 64 * 1024:
+            app.logger.debug('Body: %s', request.get_data())
 
     @app.after_request
     def log_response(response):
@@ -262,6 +327,31 @@ def create_app():
         db.session.commit()
         click.echo('Admin user "buxin" created successfully!')
 
+    @app.cli.command('rebuild-class-schedule')
+    def rebuild_class_schedule():
+        """Recompute the UTC windows of every active class time."""
+        from .services.class_schedule import rebuild_class_time_windows
+        
+        count = rebuild_class_time_windows()
+        db.session.commit()
+        click.echo(f'Rebuilt class schedule: {count} window(s).')
+
+    @app.cli.command('process-uploads')
+    def process_uploads():
+        """Upload spooled files that are due for a retry or were left behind by a restarted worker."""
+        from .services.upload_queue import due_upload_ids, process_upload
+        
+        results = [process_upload(upload_id) for upload_id in due_upload_ids(limit=1000)]
+        click.echo(f'Processed uploads: {results.count(True)} done, {results.count(False)} failed, '
+                   f'{results.count(None)} taken by another worker.')
+
+    @app.cli.command('sweep-uploads')
+    def sweep_uploads():
+        """Delete chunked uploads left unfinished and staged files no form claimed."""
+        from .services.resumable_upload import sweep_abandoned
+        
+        click.echo(f'Swept {sweep_abandoned()} abandoned upload(s).')
+
     # Auto-create admin user on first request if doesn't exist
     # Made conditional to skip database access for health checks
     @app.before_request
@@ -8,7 +8,9 @@ from .student_projects import *
 from .gallery import *
 from .schools import *
 from .id_cards import *
+from .uploads import *
 from .site_settings import SiteSettings
+from .id_counters import IdCounter
 
 # Import MonthlyPayment explicitly
 from .classes import MonthlyPayment
\ No newline at end of file
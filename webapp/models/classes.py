@@ -32,6 +32,14 @@ class ClassEnrollment(db.Model):
     payment_proof = db.Column(db.String(255))
     family_system_id = db.Column(db.String(20), nullable=True)  # Family System ID for family classes (e.g., FAM-XXXXX)
     group_system_id = db.Column(db.String(20), nullable=True)  # Group System ID for group classes (e.g., GRO-XXXXX)
+    
+    # Indexes for the hot filters: a student's enrollments by status, and a class roster by type and status.
+    # Group System IDs are random, so a unique index backs the generator's collision check
+    __table_args__ = (
+        db.Index('ix_class_enrollment_user_status', 'user_id', 'status'),
+        db.Index('ix_class_enrollment_class_type_status', 'class_id', 'class_type', 'status'),
+        db.Index('ix_class_enrollment_group_system_id', 'group_system_id', unique=True),
+    )
 
 
 class IndividualClass(db.Model):
@@ -79,8 +87,24 @@ class Attendance(db.Model):
     student = db.relationship('User', foreign_keys=[student_id], lazy='select')
     marker = db.relationship('User', foreign_keys=[marked_by], lazy='select')
     
-    # Unique constraint: one attendance record per student per class per day
-    __table_args__ = (db.UniqueConstraint('student_id', 'class_id', 'attendance_date', name='unique_attendance'),)
+    # School students have no User account: their rows are held by the school admin (student_id)
+    # and identify the registered student here
+    school_student_id = db.Column(db.Integer, db.ForeignKey('school_student.id'), nullable=True)
+    
+    # Unique: one attendance record per student per class per day. For user rows that is
+    # (student_id, class_id, date); school-student rows share the admin's student_id, so they are
+    # unique on (school_student_id, class_id, date) instead, which also serves their lookups
+    # Index: class attendance sheets and monthly reports filter by class and date range; the
+    # admin attendance page pages through a whole day newest first and counts its statuses,
+    # which (date, created_at, status) answers from the index alone
+    __table_args__ = (
+        db.Index('unique_attendance', 'student_id', 'class_id', 'attendance_date', unique=True,
+                 postgresql_where=db.text('school_student_id IS NULL'),
+                 sqlite_where=db.text('school_student_id IS NULL')),
+        db.Index('unique_school_student_attendance', 'school_student_id', 'class_id', 'attendance_date', unique=True),
+        db.Index('ix_attendance_class_date', 'class_id', 'attendance_date'),
+        db.Index('ix_attendance_date', 'attendance_date', 'created_at', 'status'),
+    )
 
 
 class SchoolStudent(db.Model):
@@ -131,76 +155,15 @@ class FamilyMember(db.Model):
 
 
 # ID Generation functions for Group, Family, and Individual classes
-import secrets
-import string
-
 def generate_student_id_for_class(class_type='individual'):
     """
     Generate a unique Student ID for Group, Family, or Individual classes
     Format: STU-XXXXX (5-digit number)
-    CRITICAL: Ensures true uniqueness with database-level checking
     Returns sequential IDs: STU-00001, STU-00002, STU-00003, etc.
+    Numbers come from a database sequence/counter, so concurrent approvals never get the same ID
     """
-    from .users import User
-    from ..extensions import db
-    from sqlalchemy import func
-    
-    # Get all existing student IDs in a single query - use database aggregation for efficiency
-    existing_ids_query = db.session.query(User.student_id).filter(
-        User.student_id.isnot(None),
-        User.student_id.like('STU-%')
-    ).all()
-    
-    existing_ids = [row[0] for row in existing_ids_query if row[0] and row[0].startswith('STU-')]
-    
-    if existing_ids:
-        # Extract numbers from existing IDs and find the max
-        numbers = []
-        for sid in existing_ids:
-            try:
-                # Extract number part after 'STU-'
-                num_str = sid.split('-')[1] if '-' in sid else sid.replace('STU-', '')
-                num = int(num_str)
-                numbers.append(num)
-            except (ValueError, IndexError):
-                continue
-        
-        if numbers:
-            next_number = max(numbers) + 1
-        else:
-            next_number = 1
-    else:
-        next_number = 1
-    
-    # Format as 5-digit number with leading zeros
-    student_id = f"STU-{next_number:05d}"
-    
-    # CRITICAL: Double-check uniqueness at database level
-    # This prevents race conditions where multiple approvals happen simultaneously
-    existing_user = User.query.filter_by(student_id=student_id).first()
-    if existing_user:
-        # ID collision - find next available number
-        max_attempts = 1000
-        attempt = 0
-        while existing_user and attempt < max_attempts:
-            next_number += 1
-            student_id = f"STU-{next_number:05d}"
-            existing_user = User.query.filter_by(student_id=student_id).first()
-            attempt += 1
-        
-        if attempt >= max_attempts:
-            # Fallback: use timestamp-based ID
-            from datetime import datetime
-            timestamp = int(datetime.utcnow().timestamp()) % 100000
-            student_id = f"STU-{timestamp:05d}"
-            # Final uniqueness check
-            if User.query.filter_by(student_id=student_id).first():
-                # Last resort: add random suffix
-                import random
-                random_suffix = random.randint(100, 999)
-                student_id = f"STU-{timestamp:05d}-{random_suffix:03d}"
-    
-    return student_id
+    from ..services.id_allocator import next_sequential_id
+    return next_sequential_id('student')
 
 
 def reset_all_student_ids():
@@ -235,6 +198,9 @@ def reset_all_student_ids():
             for id_card in id_cards:
                 id_card.system_id = user.student_id
         
+        # Restart the STU- counter after the highest renumbered ID
+        from ..services.id_allocator import sync_sequential_id
+        sync_sequential_id('student')
         db.session.commit()
         
         return {
@@ -276,8 +242,12 @@ class MonthlyPayment(db.Model):
     enrollment = db.relationship('ClassEnrollment', lazy='select')
     verifier = db.relationship('User', foreign_keys=[verified_by], lazy='select')
     
-    # Unique constraint: one payment per student per month per enrollment
-    __table_args__ = (db.UniqueConstraint('user_id', 'enrollment_id', 'payment_month', 'payment_year', name='unique_monthly_payment'),)
+    # Unique constraint: one payment per student per month per enrollment.
+    # The ledger reads an enrollment's receipts by month, which the unique index (led by user_id) can't serve
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'enrollment_id', 'payment_month', 'payment_year', name='unique_monthly_payment'),
+        db.Index('ix_monthly_payment_enrollment_month', 'enrollment_id', 'payment_year', 'payment_month'),
+    )
     
     def __repr__(self):
         month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
@@ -295,37 +265,8 @@ def generate_family_system_id():
     Generate a unique Family System ID for family class enrollments
     Format: FAM-XXXXX (5-digit number)
     """
-    # Get all existing family system IDs
-    existing_ids = [e.family_system_id for e in ClassEnrollment.query.filter(
-        ClassEnrollment.family_system_id.isnot(None)
-    ).all() if e.family_system_id and e.family_system_id.startswith('FAM-')]
-    
-    if existing_ids:
-        # Extract numbers from existing IDs and find the max
-        numbers = []
-        for fid in existing_ids:
-            try:
-                num = int(fid.split('-')[1])
-                numbers.append(num)
-            except (ValueError, IndexError):
-                continue
-        
-        if numbers:
-            next_number = max(numbers) + 1
-        else:
-            next_number = 1
-    else:
-        next_number = 1
-    
-    # Format as 5-digit number with leading zeros
-    family_id = f"FAM-{next_number:05d}"
-    
-    # Double-check uniqueness
-    while ClassEnrollment.query.filter_by(family_system_id=family_id).first():
-        next_number += 1
-        family_id = f"FAM-{next_number:05d}"
-    
-    return family_id
+    from ..services.id_allocator import next_sequential_id
+    return next_sequential_id('family')
 
 
 class ClassTime(db.Model):
@@ -344,39 +285,30 @@ class ClassTime(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     
+    # Precomputed UTC windows (see services/class_schedule.py); removed with the slot
+    windows = db.relationship('ClassTimeWindow', lazy='select', cascade='all, delete-orphan')
+    
     def __repr__(self):
         return f'<ClassTime {self.day} {self.start_time}-{self.end_time} ({self.class_type})>'
     
     def get_display_time(self, target_timezone=None):
         """Format time as HH:MM - HH:MM, optionally converted to target timezone"""
-        from datetime import time as dt_time
-        import pytz
+        from datetime import date, time as dt_time
+        from ..services.timezones import convert_time
         
         start_time = self.start_time
         end_time = self.end_time
         
-        # Convert to target timezone if provided
+        # Convert to target timezone if provided (memoized per time, zones and today's date)
         if target_timezone and self.timezone:
             try:
-                # Create datetime objects for conversion (using today's date)
-                from datetime import datetime, date
                 today = date.today()
-                admin_tz = pytz.timezone(self.timezone)
-                target_tz = pytz.timezone(target_timezone)
-                
-                # Combine date and time
-                start_dt = admin_tz.localize(datetime.combine(today, start_time))
-                end_dt = admin_tz.localize(datetime.combine(today, end_time))
-                
-                # Convert to target timezone
-                start_dt_target = start_dt.astimezone(target_tz)
-                end_dt_target = end_dt.astimezone(target_tz)
-                
-                start_time = start_dt_target.time()
-                end_time = end_dt_target.time()
+                start_time = convert_time(start_time, self.timezone, target_timezone, today)
+                end_time = convert_time(end_time, self.timezone, target_timezone, today)
             except Exception:
                 # If conversion fails, use original time
-                pass
+                start_time = self.start_time
+                end_time = self.end_time
         
         if isinstance(start_time, dt_time):
             start_str = start_time.strftime('%H:%M')
@@ -396,20 +328,31 @@ class ClassTime(db.Model):
     
     def get_timezone_name(self):
         """Get human-readable timezone name"""
-        import pytz
-        try:
-            tz = pytz.timezone(self.timezone)
-            # Get common timezone names
-            tz_names = {
-                'Asia/Kolkata': 'India (IST)',
-                'Africa/Banjul': 'Gambia (GMT)',
-                'Europe/London': 'UK (GMT/BST)',
-                'America/New_York': 'USA Eastern (EST/EDT)',
-                'America/Los_Angeles': 'USA Pacific (PST/PDT)',
-            }
-            return tz_names.get(self.timezone, self.timezone.replace('_', ' '))
-        except Exception:
-            return self.timezone
+        from ..services.timezones import timezone_label
+        return timezone_label(self.timezone)
+
+
+class ClassTimeWindow(db.Model):
+    """A ClassTime as minutes since Monday 00:00 UTC, for the occurrences starting in [effective_from, effective_until)"""
+    __tablename__ = 'class_time_window'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    class_time_id = db.Column(db.Integer, db.ForeignKey('class_time.id', ondelete='CASCADE'), nullable=False)
+    class_type = db.Column(db.String(20), nullable=False)
+    class_id = db.Column(db.Integer, nullable=True)
+    start_minute = db.Column(db.Integer, nullable=False)  # 0 .. 10079
+    end_minute = db.Column(db.Integer, nullable=False)  # may run past 10080 into the next week
+    effective_from = db.Column(db.DateTime, nullable=True)  # naive UTC; None = since the slot existed
+    effective_until = db.Column(db.DateTime, nullable=True)  # naive UTC; None = open-ended
+    
+    # Index: "what is live now" is a range lookup on the current minute of the UTC week
+    __table_args__ = (
+        db.Index('ix_class_time_window_minutes', 'start_minute', 'end_minute'),
+        db.Index('ix_class_time_window_class_time', 'class_time_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ClassTimeWindow time_id={self.class_time_id} {self.start_minute}-{self.end_minute}>'
 
 
 class StudentClassTimeSelection(db.Model):
@@ -428,58 +371,52 @@ class StudentClassTimeSelection(db.Model):
     
     # Unique constraint: prevent selecting the same time slot twice for the same enrollment
     # Students can select up to 2 different time slots per enrollment
-    __table_args__ = (db.UniqueConstraint('enrollment_id', 'class_time_id', name='unique_enrollment_time_selection'),)
+    # Index: slot availability checks look up bookings by class_time_id alone
+    __table_args__ = (
+        db.UniqueConstraint('enrollment_id', 'class_time_id', name='unique_enrollment_time_selection'),
+        db.Index('ix_student_class_time_selection_class_time', 'class_time_id'),
+    )
     
     def __repr__(self):
         return f'<StudentClassTimeSelection user_id={self.user_id} time_id={self.class_time_id}>'
 
 
-def generate_group_system_id():
+class ClassTimeClaim(db.Model):
     """
-    Generate a unique Group System ID for group class enrollments
-    Format: GRO-XXXXX (6-character alphanumeric, similar to FAM-8KD29A format)
+    One booked seat of a time slot (see services/slot_booking.py). Slots in a
+    shared group at the same day and time share a slot_key, so the unique
+    (slot_key, seat) index lets only one booking take each seat across them.
     """
-    import secrets
-    import string
-    
-    # Generate a 6-character alphanumeric code
-    alphabet = string.ascii_uppercase + string.digits
-    # Exclude similar-looking characters: 0, O, I, 1
-    alphabet = ''.join(c for c in alphabet if c not in '0O1I')
-    
-    # Get all existing group system IDs
-    existing_ids = [e.group_system_id for e in ClassEnrollment.query.filter(
-        ClassEnrollment.group_system_id.isnot(None)
-    ).all() if e.group_system_id and e.group_system_id.startswith('GRO-')]
-    
-    # Generate a unique ID
-    max_attempts = 1000
-    for _ in range(max_attempts):
-        # Generate 6-character code
-        code = ''.join(secrets.choice(alphabet) for _ in range(6))
-        group_id = f"GRO-{code}"
-        
-        # Check if it's unique
-        if group_id not in existing_ids and not ClassEnrollment.query.filter_by(group_system_id=group_id).first():
-            return group_id
+    __tablename__ = 'class_time_claim'
     
-    # Fallback: use numeric format if random generation fails
-    existing_numeric = []
-    for gid in existing_ids:
-        try:
-            # Try to extract numeric part if it's numeric format
-            if len(gid) == 10 and gid.startswith('GRO-'):
-                num = int(gid.split('-')[1])
-                existing_numeric.append(num)
-        except (ValueError, IndexError):
-            continue
+    id = db.Column(db.Integer, primary_key=True)
+    slot_key = db.Column(db.String(150), nullable=False)
+    seat = db.Column(db.Integer, nullable=False, default=1)
+    selection_id = db.Column(db.Integer, db.ForeignKey('student_class_time_selection.id', ondelete='CASCADE'),
+                             nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    next_number = max(existing_numeric) + 1 if existing_numeric else 1
-    group_id = f"GRO-{next_number:05d}"
+    selection = db.relationship('StudentClassTimeSelection', lazy='select',
+                                backref=db.backref('claim', uselist=False, cascade='all, delete-orphan'))
     
-    # Double-check uniqueness
-    while ClassEnrollment.query.filter_by(group_system_id=group_id).first():
-        next_number += 1
-        group_id = f"GRO-{next_number:05d}"
+    __table_args__ = (
+        db.UniqueConstraint('slot_key', 'seat', name='unique_class_time_claim_seat'),
+    )
     
-    return group_id
\ No newline at end of file
+    def __repr__(self):
+        return f'<ClassTimeClaim {self.slot_key} seat={self.seat}>'
+
+
+def generate_group_system_id():
+    """
+    Generate a unique Group System ID for group class enrollments
+    Format: GRO-XXXXX (6-character alphanumeric, similar to FAM-8KD29A format)
+    """
+    from ..services.id_allocator import random_system_id
+    return random_system_id('GRO', ClassEnrollment.group_system_id)
+
+
+def assign_group_system_id(enrollment):
+    """Give an enrollment a fresh Group System ID and flush it, retrying if a concurrent request took it"""
+    from ..services.id_allocator import add_with_random_id
+    return add_with_random_id(enrollment, 'group_system_id', 'GRO', ClassEnrollment.group_system_id)
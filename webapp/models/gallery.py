@@ -1,5 +1,7 @@
+from copy import deepcopy
 from datetime import datetime
 from ..extensions import db
+from ..services.cache import VersionedCache
 
 
 class HomeGallery(db.Model):
@@ -129,37 +131,54 @@ class ClassPricing(db.Model):
             'school': {'name': 'School Class', 'price': 300, 'icon': 'fa-school', 'color': '#9b59b6', 'max_students': 30}
         }
     
+    @staticmethod
+    def load_pricing():
+        """Build the pricing dict from the database; returns None if no active pricing rows exist"""
+        defaults = ClassPricing.get_default_pricing()
+        pricing_list = ClassPricing.query.filter_by(is_active=True).order_by(ClassPricing.display_order).all()
+        if not pricing_list:
+            return None
+        result = {}
+        for p in pricing_list:
+            default_data = defaults.get(p.class_type, {})
+            result[p.class_type] = {
+                'name': p.name if p.name else default_data.get('name', ''),
+                'price': p.price if p.price else default_data.get('price', 100),
+                'icon': p.icon if p.icon else default_data.get('icon', 'fa-user'),
+                'color': p.color if p.color else default_data.get('color', '#00d4ff'),
+                'max_students': p.max_students if p.max_students else default_data.get('max_students', 1),
+                'is_popular': p.is_popular if p.is_popular is not None else default_data.get('is_popular', False)
+            }
+        # Ensure all default types are included
+        for class_type, default_data in defaults.items():
+            if class_type not in result:
+                result[class_type] = default_data
+        return result
+    
     @staticmethod
     def get_all_pricing():
-        """Get all pricing from database or defaults - features are hardcoded in HTML templates"""
+        """Get all pricing from the cached snapshot or defaults - features are hardcoded in HTML templates"""
         from ..extensions import db
-        defaults = ClassPricing.get_default_pricing()
-        
         try:
-            pricing_list = ClassPricing.query.filter_by(is_active=True).order_by(ClassPricing.display_order).all()
-            if pricing_list:
-                result = {}
-                for p in pricing_list:
-                    default_data = defaults.get(p.class_type, {})
-                    result[p.class_type] = {
-                        'name': p.name if p.name else default_data.get('name', ''),
-                        'price': p.price if p.price else default_data.get('price', 100),
-                        'icon': p.icon if p.icon else default_data.get('icon', 'fa-user'),
-                        'color': p.color if p.color else default_data.get('color', '#00d4ff'),
-                        'max_students': p.max_students if p.max_students else default_data.get('max_students', 1),
-                        'is_popular': p.is_popular if p.is_popular is not None else default_data.get('is_popular', False)
-                    }
-                # Ensure all default types are included
-                for class_type, default_data in defaults.items():
-                    if class_type not in result:
-                        result[class_type] = default_data
-                return result
+            pricing = _pricing_cache.get()
+            if pricing:
+                # Callers may adjust the dict for display; keep the cached snapshot intact
+                return deepcopy(pricing)
         except Exception:
             try:
                 db.session.rollback()
             except:
                 pass
-        return defaults
+        return ClassPricing.get_default_pricing()
+    
+    @staticmethod
+    def invalidate_cache():
+        """Bump the pricing snapshot version; call inside the transaction that changes pricing"""
+        _pricing_cache.invalidate()
+
+
+_pricing_cache = VersionedCache('class_pricing', ClassPricing.load_pricing, ttl_config_key='PRICING_CACHE_TTL',
+                                default_ttl=3600)
 
 
 class StudentVictory(db.Model):
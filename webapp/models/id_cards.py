@@ -55,6 +55,9 @@ class IDCard(db.Model):
     # Relationships
     approver = db.relationship('User', foreign_keys=[approved_by], lazy='select')
     
+    # Index: ID cards are always looked up by entity and active flag
+    __table_args__ = (db.Index('ix_id_card_entity', 'entity_type', 'entity_id', 'is_active'),)
+    
     def __repr__(self):
         return f'<IDCard {self.entity_type}: {self.system_id}>'
     
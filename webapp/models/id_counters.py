@@ -0,0 +1,13 @@
+from ..extensions import db
+
+
+class IdCounter(db.Model):
+    """Last number handed out for a sequential system ID (STU-, FAM-) on databases without sequences"""
+    __tablename__ = 'id_counter'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<IdCounter {self.name}={self.value}>'
+
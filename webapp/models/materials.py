@@ -18,6 +18,9 @@ class LearningMaterial(db.Model):
     file_type = db.Column(db.String(50))  # MIME type or file extension
     youtube_url = db.Column(db.String(500))  # YouTube URL if material_type is 'youtube'
     file_name = db.Column(db.String(255))  # Original filename
+    
+    # Index: materials are listed per class type and class
+    __table_args__ = (db.Index('ix_learning_material_class', 'class_type', 'actual_class_id'),)
 
     def class_name(self):
         from .users import User  # local import to avoid circulars
@@ -32,8 +35,10 @@ class LearningMaterial(db.Model):
                 return f"👤 {student.first_name} {student.last_name}"
             return "Unknown Student"
         if self.class_type == 'individual':
-            cls = GroupClass.query.filter_by(id=self.actual_class_id, class_type='individual').first() or \
-                  IndividualClass.query.get(self.actual_class_id)
+            # query.get() is served from the identity map when the class is already loaded
+            cls = GroupClass.query.get(self.actual_class_id)
+            if not cls or cls.class_type != 'individual':
+                cls = IndividualClass.query.get(self.actual_class_id)
             return f"📖 {cls.name}" if cls else "Unknown Individual Class"
         if self.class_type == 'group':
             cls = GroupClass.query.get(self.actual_class_id)
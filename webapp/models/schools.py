@@ -1,5 +1,4 @@
 from datetime import datetime
-import secrets
 import string
 from ..extensions import db
 
@@ -91,15 +90,19 @@ class RegisteredSchoolStudent(db.Model):
 
 
 # ID Generation functions (defined after models to avoid circular imports)
+SCHOOL_ID_ALPHABET = string.ascii_uppercase + string.digits
+
+
 def generate_school_id():
     """Generate a unique School System ID (e.g., SCH-9F3A21)"""
-    while True:
-        # Generate 6-character alphanumeric code
-        code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(6))
-        school_id = f"SCH-{code}"
-        # Check if it already exists
-        if not School.query.filter_by(school_system_id=school_id).first():
-            return school_id
+    from ..services.id_allocator import random_system_id
+    return random_system_id('SCH', School.school_system_id, alphabet=SCHOOL_ID_ALPHABET)
+
+
+def add_school_with_system_id(school):
+    """Add a new school under a fresh School System ID, retrying if a concurrent registration took it"""
+    from ..services.id_allocator import add_with_random_id
+    return add_with_random_id(school, 'school_system_id', 'SCH', School.school_system_id, alphabet=SCHOOL_ID_ALPHABET)
 
 
 def generate_student_id(school_id):
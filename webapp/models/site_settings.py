@@ -1,5 +1,6 @@
 from datetime import datetime
 from ..extensions import db
+from ..services.cache import VersionedCache, VERSION_KEY_PREFIX
 
 
 class SiteSettings(db.Model):
@@ -18,11 +19,16 @@ class SiteSettings(db.Model):
     def __repr__(self):
         return f'<SiteSettings {self.setting_key}: {self.setting_value}>'
     
+    @staticmethod
+    def get_all_settings():
+        """Get all settings as a {key: value} dict, served from the process-local cache"""
+        return _settings_cache.get()
+    
     @staticmethod
     def get_setting(key, default=None):
         """Get a setting value by key"""
-        setting = SiteSettings.query.filter_by(setting_key=key).first()
-        return setting.setting_value if setting else default
+        settings = SiteSettings.get_all_settings()
+        return settings[key] if key in settings else default
     
     @staticmethod
     def set_setting(key, value, user_id=None):
@@ -40,6 +46,16 @@ class SiteSettings(db.Model):
                 updated_by=user_id
             )
             db.session.add(setting)
+        # Bump the version in the same transaction so every worker reloads
+        _settings_cache.invalidate()
         db.session.commit()
         return setting
 
+
+def _load_all_settings():
+    """Load every setting in one query, leaving out cache version rows"""
+    rows = db.session.query(SiteSettings.setting_key, SiteSettings.setting_value).all()
+    return {key: value for key, value in rows if not key.startswith(VERSION_KEY_PREFIX)}
+
+
+_settings_cache = VersionedCache('site_settings', _load_all_settings, ttl_config_key='SITE_SETTINGS_CACHE_TTL')
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime
+
+from ..extensions import db
+
+# Path of the route that stands in for an upload until it reaches Cloudinary (file_uploads.pending_upload)
+PLACEHOLDER_PREFIX = '/api/uploads/'
+
+
+class PendingUpload(db.Model):
+    """A file spooled to local disk, waiting for a background worker to push it to Cloudinary"""
+    __tablename__ = 'pending_upload'
+
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), nullable=False, unique=True)  # names the placeholder URL
+    spool_path = db.Column(db.String(500), nullable=False)
+    filename = db.Column(db.String(255))
+    folder = db.Column(db.String(100), default='')
+    resource_type = db.Column(db.String(20), default='auto')
+    public_id = db.Column(db.String(255))  # requested Cloudinary public ID, if any
+    # pending, uploading, done, failed; staged uploads wait for a form to claim them (see release_upload)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    # JSON list of [table, row id, column] whose value carries the placeholder URL
+    targets = db.Column(db.Text)
+    url = db.Column(db.String(500))
+    result_public_id = db.Column(db.String(255))
+    bytes = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    # Workers poll for due uploads by status and retry time
+    __table_args__ = (
+        db.Index('ix_pending_upload_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    @property
+    def placeholder(self):
+        """URL stored in place of the Cloudinary URL until the upload finishes"""
+        return f"{PLACEHOLDER_PREFIX}{self.token}"
+
+    def get_targets(self):
+        try:
+            return json.loads(self.targets) if self.targets else []
+        except (TypeError, ValueError):
+            return []
+
+    def add_target(self, table, row_id, column):
+        targets = self.get_targets()
+        if [table, row_id, column] not in targets:
+            targets.append([table, row_id, column])
+        self.targets = json.dumps(targets)
+
+    def __repr__(self):
+        return f'<PendingUpload {self.id} {self.status} {self.filename}>'
+
+
+class ResumableUpload(db.Model):
+    """A file arriving in chunks, appended to a spool file until ``received`` reaches ``size``"""
+    __tablename__ = 'resumable_upload'
+
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), nullable=False, unique=True)
+    purpose = db.Column(db.String(40), nullable=False)  # key of services.direct_upload.UPLOAD_PURPOSES
+    filename = db.Column(db.String(255))
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # bytes written so far: the next chunk's offset
+    spool_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='receiving')  # receiving, complete
+    pending_upload_id = db.Column(db.Integer, db.ForeignKey('pending_upload.id'), nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # The sweeper looks for abandoned uploads by status and last activity
+    __table_args__ = (
+        db.Index('ix_resumable_upload_status_updated', 'status', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f'<ResumableUpload {self.id} {self.received}/{self.size} {self.filename}>'
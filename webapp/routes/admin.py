@@ -3,6 +3,10 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user, logout_user, login_user
 
 from ..extensions import db
+from ..services.homepage_cache import invalidate_home_sections
+from ..services.perf import track
+from ..services.class_schedule import live_class_time_ids, live_status_cache, rebuild_class_time_windows
+from ..services.timezones import is_valid_timezone
 from ..models import (
     User,
     Purchase,
@@ -619,6 +623,13 @@ def setup_monthly_payment_table():
             messages.append("✅ Created monthly_payment table successfully!")
         else:
             messages.append("ℹ️ monthly_payment table already exists.")
+        
+        # Index behind the payment ledger (same as migration add_monthly_payment_ledger_index)
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_monthly_payment_enrollment_month "
+            "ON monthly_payment (enrollment_id, payment_year, payment_month)"
+        ))
+        db.session.commit()
     except Exception as e:
         db.session.rollback()
         messages.append(f"❌ Error: {str(e)}")
@@ -1114,16 +1125,21 @@ def admin_dashboard():
     
     # Old POST handler removed - share materials now handled in individual admin pages
     # Get all data for the dashboard
+    from sqlalchemy import func
+    from sqlalchemy.orm import joinedload
+    
+    # Students: the dashboard only shows the total, so COUNT(*) instead of loading them
     try:
-        students = User.query.filter_by(is_student=True).all()
+        student_count = User.query.filter_by(is_student=True).count()
     except Exception:
         db.session.rollback()
-        students = []
-    individual_students = students
+        student_count = 0
     
     # Get course orders
     try:
-        course_orders = Purchase.query.order_by(Purchase.purchased_at.desc()).limit(50).all()
+        course_orders = Purchase.query.options(joinedload(Purchase.course)).order_by(
+            Purchase.purchased_at.desc()
+        ).limit(50).all()
     except Exception:
         db.session.rollback()
         course_orders = []
@@ -1162,26 +1178,35 @@ def admin_dashboard():
     schools_data = []
     try:
         schools = School.query.filter_by(status='active').order_by(School.school_name).all()
+        school_ids = [school.id for school in schools]
+        school_user_ids = [school.user_id for school in schools if school.user_id]
+        
+        # Registered students per school in one GROUP BY
+        student_counts = {}
+        if school_ids:
+            student_counts = dict(db.session.query(
+                RegisteredSchoolStudent.school_id, func.count(RegisteredSchoolStudent.id)
+            ).filter(
+                RegisteredSchoolStudent.school_id.in_(school_ids)
+            ).group_by(RegisteredSchoolStudent.school_id).all())
+        
+        # Classes each school has joined, for all schools at once
+        class_ids_by_user = {}
+        if school_user_ids:
+            for user_id, class_id in db.session.query(ClassEnrollment.user_id, ClassEnrollment.class_id).filter(
+                ClassEnrollment.user_id.in_(school_user_ids),
+                ClassEnrollment.class_type == 'school',
+                ClassEnrollment.status == 'completed'
+            ).order_by(ClassEnrollment.id).all():
+                class_ids_by_user.setdefault(user_id, []).append(class_id)
+        
         for school in schools:
-            # Count registered students for this school
-            student_count = RegisteredSchoolStudent.query.filter_by(school_id=school.id).count()
-            
-            # Get classes this school has joined
-            school_classes = []
-            if school.user_id:
-                enrollments = ClassEnrollment.query.filter_by(
-                    user_id=school.user_id,
-                    class_type='school',
-                    status='completed'
-                ).all()
-                school_classes = [e.class_id for e in enrollments]
-            
             schools_data.append({
                 'id': school.id,
                 'school_name': school.school_name,
                 'school_system_id': school.school_system_id,
-                'student_count': student_count,
-                'class_ids': school_classes
+                'student_count': student_counts.get(school.id, 0),
+                'class_ids': class_ids_by_user.get(school.user_id, []) if school.user_id else []
             })
     except Exception:
         db.session.rollback()
@@ -1189,25 +1214,35 @@ def admin_dashboard():
     # Get Families (entities) for family type - NOT enrollments
     families_data = []
     try:
-        family_enrollments = ClassEnrollment.query.filter_by(
-            class_type='family',
-            status='completed'
-        ).all()
+        # Family enrollments joined to their main user, with member counts aggregated per enrollment
+        member_counts = db.session.query(
+            FamilyMember.enrollment_id.label('enrollment_id'),
+            func.count(FamilyMember.id).label('member_count')
+        ).group_by(FamilyMember.enrollment_id).subquery()
+        family_rows = db.session.query(
+            ClassEnrollment.id, ClassEnrollment.user_id, ClassEnrollment.class_id,
+            User.first_name, User.last_name, member_counts.c.member_count
+        ).join(
+            User, User.id == ClassEnrollment.user_id
+        ).outerjoin(
+            member_counts, member_counts.c.enrollment_id == ClassEnrollment.id
+        ).filter(
+            ClassEnrollment.class_type == 'family',
+            ClassEnrollment.status == 'completed'
+        ).order_by(ClassEnrollment.id).all()
+        
         # Group by main user to create family entities
         families_dict = {}
-        for enrollment in family_enrollments:
-            main_user = User.query.get(enrollment.user_id)
-            if main_user:
-                # Use user_id as family identifier
-                if enrollment.user_id not in families_dict:
-                    member_count = FamilyMember.query.filter_by(enrollment_id=enrollment.id).count()
-                    families_dict[enrollment.user_id] = {
-                        'id': enrollment.user_id,  # Use user_id as family ID
-                        'family_name': f"{main_user.first_name} {main_user.last_name}'s Family",
-                        'member_count': member_count,
-                        'class_ids': []
-                    }
-                families_dict[enrollment.user_id]['class_ids'].append(enrollment.class_id)
+        for enrollment_id, user_id, class_id, first_name, last_name, member_count in family_rows:
+            # Use user_id as family identifier
+            if user_id not in families_dict:
+                families_dict[user_id] = {
+                    'id': user_id,  # Use user_id as family ID
+                    'family_name': f"{first_name} {last_name}'s Family",
+                    'member_count': member_count or 0,
+                    'class_ids': []
+                }
+            families_dict[user_id]['class_ids'].append(class_id)
         
         families_data = list(families_dict.values())
     except Exception:
@@ -1216,18 +1251,20 @@ def admin_dashboard():
     # Get group classes with student counts
     group_classes_data = []
     try:
+        enrollment_counts = dict(db.session.query(
+            ClassEnrollment.class_id, func.count(ClassEnrollment.id)
+        ).filter(
+            ClassEnrollment.class_type == 'group',
+            ClassEnrollment.status == 'completed'
+        ).group_by(ClassEnrollment.class_id).all())
+        
         # Only show classes with type 'group' or default 'group'
         for class_obj in all_group_classes:
             if hasattr(class_obj, 'class_type') and class_obj.class_type == 'group':
-                student_count = ClassEnrollment.query.filter_by(
-                    class_id=class_obj.id,
-                    class_type='group',
-                    status='completed'
-                ).count()
                 group_classes_data.append({
                     'id': class_obj.id,
                     'name': class_obj.name,
-                    'student_count': student_count,
+                    'student_count': enrollment_counts.get(class_obj.id, 0),
                     'curriculum': getattr(class_obj, 'curriculum', None) or ''
                 })
     except Exception:
@@ -1236,18 +1273,10 @@ def admin_dashboard():
     # Materials removed from dashboard - now shown in individual admin pages
     
     # Get all individual classes for the dashboard
-    all_individual_classes = []
-    try:
-        # Check if class_type column exists
-        individual_classes_new = GroupClass.query.filter_by(class_type='individual').all()
-        all_individual_classes = individual_classes_new + all_individual_classes_legacy
-    except Exception:
-        db.session.rollback()
-        all_individual_classes = all_individual_classes_legacy
+    all_individual_classes = [c for c in all_group_classes if c.class_type == 'individual'] + all_individual_classes_legacy
 
     return render_template('admin_dashboard.html',
-        students=students,
-        individual_students=individual_students,
+        student_count=student_count,
         all_group_classes=all_group_classes,
         all_individual_classes=all_individual_classes,
         school_classes_latest=school_classes_latest,
@@ -1611,8 +1640,8 @@ def approve_enrollment(enrollment_id):
         # Generate Group System ID if not exists
         try:
             if not enrollment.group_system_id:
-                from ..models.classes import generate_group_system_id
-                enrollment.group_system_id = generate_group_system_id()
+                from ..models.classes import assign_group_system_id
+                assign_group_system_id(enrollment)
         except Exception as e:
             # Handle case where group_system_id column doesn't exist yet
             if 'group_system_id' in str(e).lower() or 'column' in str(e).lower():
@@ -1777,9 +1806,9 @@ def reject_enrollment(enrollment_id):
 
 @bp.route('/student/dashboard')
 def student_dashboard():
-    from datetime import datetime, date, timedelta
+    from datetime import datetime, date
     from flask import flash, session
-    from calendar import monthrange
+    from ..services.dashboard_loader import load_student_dashboard, load_monthly_payments
     
     # NO LOGIN REQUIRED - Get user from session or current_user
     user = None
@@ -1800,11 +1829,12 @@ def student_dashboard():
         flash('Please enter your Name and System ID to access your classroom.', 'info')
         return redirect(url_for('main.index'))
     
-    # Check if user has any CONFIRMED enrollment (status = 'completed')
-    has_confirmed_enrollment = ClassEnrollment.query.filter_by(
+    # Confirmed enrollments (status = 'completed') gate the dashboard and drive everything on it
+    enrollments = ClassEnrollment.query.filter_by(
         user_id=user_id,
         status='completed'
-    ).first() is not None
+    ).order_by(ClassEnrollment.id).all()
+    has_confirmed_enrollment = bool(enrollments)
     
     # Set session variable for navbar (hide all links except BuXin Academy logo)
     if has_confirmed_enrollment:
@@ -1813,10 +1843,13 @@ def student_dashboard():
         session['is_registered_student'] = False
     
     # Check if user is a school admin with active status and completed payment
+    school_obj = None
     is_approved_school = False
+    if getattr(user, 'is_school_admin', False) or getattr(user, 'is_school_student', False) or \
+       any(e.class_type == 'school' for e in enrollments):
+        school_obj = School.query.filter_by(user_id=user_id).first()
     if getattr(user, 'is_school_admin', False) or getattr(user, 'is_school_student', False):
-        school = School.query.filter_by(user_id=user_id).first()
-        if school and school.status == 'active' and school.payment_status == 'completed':
+        if school_obj and school_obj.status == 'active' and school_obj.payment_status == 'completed':
             is_approved_school = True
     
     if not has_confirmed_enrollment and not getattr(user, 'is_admin', False) and not is_approved_school:
@@ -1832,312 +1865,9 @@ def student_dashboard():
             flash('You need to enroll in a class first. Please register for a class to access your dashboard.', 'info')
         return redirect(url_for('main.index'))
     
-    purchases = Purchase.query.filter_by(user_id=user_id, status='completed').all()
-    projects = StudentProject.query.filter_by(student_id=user_id).all()
-    enrollments = ClassEnrollment.query.filter_by(user_id=user_id, status='completed').all()
-    
-    # Get classes the student is enrolled in
-    enrolled_classes = []
-    for enrollment in enrollments:
-        # Try GroupClass first (unified), then IndividualClass (legacy)
-        class_obj = GroupClass.query.get(enrollment.class_id) or IndividualClass.query.get(enrollment.class_id)
-        if class_obj:
-            enrolled_classes.append({
-                'id': class_obj.id,
-                'name': class_obj.name,
-                'description': class_obj.description,
-                'class_type': enrollment.class_type,  # individual, group, family, school
-                'enrollment': enrollment
-            })
-    
-    # Get all students in same classes (for group/family classes)
-    class_students = {}  # {class_id: [list of students]}
-    # Also get all students for attendance (includes registered students for schools)
-    all_students_for_attendance = {}  # {class_id: [list of all students for attendance]}
-    
-    for cls in enrolled_classes:
-        if cls['class_type'] in ['group', 'family', 'school']:
-            students = []
-            attendance_students = []
-            
-            if cls['class_type'] == 'school':
-                # CRITICAL FIX: For school classes, ONLY show registered SchoolStudent records
-                # Do NOT include the school admin user in attendance - only registered students
-                current_school_enrollment = cls['enrollment']
-                
-                # For class_students, we can include the admin user (for other purposes)
-                # But for attendance, we ONLY want registered school students
-                students = []
-                if current_school_enrollment and current_school_enrollment.user_id == user_id:
-                    student = User.query.get(current_school_enrollment.user_id)
-                if student:
-                    students.append({
-                        'id': student.id,
-                        'name': f"{student.first_name} {student.last_name}",
-                        'username': student.username,
-                            'type': 'user'  # School admin user (for class_students only, not attendance)
-                        })
-                
-                # CRITICAL: Attendance should ONLY show registered SchoolStudent records
-                # Filter by class_id, enrollment_id, and registered_by to ensure strict school isolation
-                registered_school_students = SchoolStudent.query.filter_by(
-                    class_id=cls['id'],  # THIS class only
-                    enrollment_id=current_school_enrollment.id,  # THIS school's enrollment only
-                    registered_by=user_id  # Only students registered by this school admin
-                ).order_by(SchoolStudent.student_name).all()
-                
-                # Attendance list: ONLY registered school students (no admin user)
-                attendance_students = []
-                for reg_student in registered_school_students:
-                    attendance_students.append({
-                        'id': f"school_student_{reg_student.id}",  # Unique identifier
-                        'name': reg_student.student_name,
-                        'username': None,
-                        'type': 'school_student',
-                        'school_student_id': reg_student.id,
-                        'school_name': reg_student.school_name
-                    })
-                
-                class_students[cls['id']] = students
-            else:
-                # For group and family classes, get all enrollments (they're not school-specific)
-                class_enrollments = ClassEnrollment.query.filter_by(
-                    class_id=cls['id'],  # THIS class only
-                    class_type=cls['class_type'],  # Same class type
-                    status='completed'  # Only completed enrollments
-                ).all()
-                
-                for enr in class_enrollments:
-                    student = User.query.get(enr.user_id)
-                    if student:
-                        students.append({
-                            'id': student.id,
-                            'name': f"{student.first_name} {student.last_name}",
-                            'username': student.username,
-                            'type': 'user'  # Regular enrolled user
-                        })
-                
-                attendance_students = list(students)  # Start with enrolled users
-                
-                if cls['class_type'] == 'family':
-                    # Add registered family members
-                    registered_family_members = FamilyMember.query.filter_by(
-                        class_id=cls['id'],
-                        enrollment_id=cls['enrollment'].id
-                    ).all()
-                    for member in registered_family_members:
-                        attendance_students.append({
-                            'id': f"family_member_{member.id}",  # Unique identifier
-                            'name': member.member_name,
-                            'username': None,
-                            'type': 'family_member',
-                            'family_member_id': member.id,
-                            'relationship': member.relationship
-                        })
-                
-                class_students[cls['id']] = students
-            
-            all_students_for_attendance[cls['id']] = attendance_students
-    
-    # Get attendance data for current month
     today = date.today()
-    month_start = date(today.year, today.month, 1)
-    month_end = date(today.year, today.month, monthrange(today.year, today.month)[1])
-    
-    attendance_records = {}
-    monthly_stats = {}
-    all_class_attendance = {}  # For group classes - all students' attendance
-    
-    for cls in enrolled_classes:
-        # Get attendance for current user in this class this month
-        attendance = Attendance.query.filter(
-            Attendance.student_id == user_id,
-            Attendance.class_id == cls['id'],
-            Attendance.attendance_date >= month_start,
-            Attendance.attendance_date <= month_end
-        ).order_by(Attendance.attendance_date.desc()).all()
-        
-        attendance_records[cls['id']] = attendance
-        
-        # For group/family/school classes, get all students' attendance
-        if cls['class_type'] in ['group', 'family', 'school']:
-            if cls['class_type'] == 'school':
-                # CRITICAL: For school classes, only get attendance for students from THIS school
-                # Get list of valid student IDs (school admin + registered school students)
-                valid_student_ids = [user_id]  # School admin
-                
-                # Add registered school students for this class
-                registered_students = SchoolStudent.query.filter_by(
-                    class_id=cls['id'],
-                    enrollment_id=cls['enrollment'].id,
-                    registered_by=user_id
-                ).all()
-                
-                # For school students, we can't directly query by student_id since they're not Users
-                # Instead, filter attendance by class_id and then filter results
-                all_attendance = Attendance.query.filter(
-                    Attendance.class_id == cls['id'],
-                    Attendance.class_type == 'school',
-                    Attendance.attendance_date >= month_start,
-                    Attendance.attendance_date <= month_end
-                ).order_by(Attendance.attendance_date.desc()).all()
-                
-                # Filter to only include attendance for valid students
-                # For User-based attendance, check if student_id is in valid_student_ids
-                # For SchoolStudent attendance, we'd need a different approach (they don't have user_id)
-                # For now, only include attendance for the school admin user
-                filtered_attendance = [
-                    att for att in all_attendance 
-                    if att.student_id in valid_student_ids
-                ]
-                all_class_attendance[cls['id']] = filtered_attendance
-            else:
-                # For group and family classes, get all attendance (not school-specific)
-                all_students_attendance = Attendance.query.filter(
-                    Attendance.class_id == cls['id'],
-                    Attendance.attendance_date >= month_start,
-                    Attendance.attendance_date <= month_end
-                ).order_by(Attendance.attendance_date.desc()).all()
-                all_class_attendance[cls['id']] = all_students_attendance
-        
-        # Calculate monthly percentage
-        total_days = monthrange(today.year, today.month)[1]
-        present_days = len([a for a in attendance if a.status == 'present'])
-        percentage = (present_days / total_days * 100) if total_days > 0 else 0
-        monthly_stats[cls['id']] = {
-            'present': present_days,
-            'total': total_days,
-            'percentage': round(percentage, 1)
-        }
-    
-    # Check today's attendance
-    today_attendance = {}
-    all_students_today_attendance = {}  # {class_id: {student_id: attendance_record}}
-    
-    for cls in enrolled_classes:
-        today_att = Attendance.query.filter(
-            Attendance.student_id == user_id,
-            Attendance.class_id == cls['id'],
-            Attendance.attendance_date == today
-        ).first()
-        today_attendance[cls['id']] = today_att
-        
-        # Get today's attendance for all students in this class
-        # CRITICAL: Only get attendance for students registered in THIS specific class
-        if cls['class_type'] in ['group', 'family', 'school']:
-            class_today_attendance = {}
-            
-            if cls['class_type'] == 'school':
-                # CRITICAL: For school classes, get attendance for registered school students
-                # Get the school enrollment
-                school_enrollment = cls['enrollment']
-                if school_enrollment:
-                    # Get all registered school students for this class
-                    registered_students = SchoolStudent.query.filter_by(
-                        class_id=cls['id'],
-                        enrollment_id=school_enrollment.id,
-                        registered_by=user_id
-                    ).all()
-                    
-                    # Get attendance for each registered school student
-                    for reg_student in registered_students:
-                        # Find attendance record with school_student_id in notes
-                        att = Attendance.query.filter(
-                            Attendance.student_id == user_id,  # School admin as proxy
-                            Attendance.class_id == cls['id'],
-                            Attendance.class_type == 'school',
-                            Attendance.attendance_date == today,
-                            Attendance.notes.like(f'%school_student_{reg_student.id}%')
-                        ).first()
-                        
-                        if att:
-                            # Use special key format for school students
-                            class_today_attendance[f'school_student_{reg_student.id}'] = att
-                    # Note: SchoolStudent type students don't have user_id, so they can't have Attendance records
-                    # They are view-only in the attendance list
-            else:
-                # For group and family classes, get attendance for all enrolled users
-                for student in class_students.get(cls['id'], []):
-                    if student['type'] == 'user':
-                        att = Attendance.query.filter(
-                            Attendance.student_id == student['id'],
-                            Attendance.class_id == cls['id'],  # THIS class only
-                            Attendance.attendance_date == today
-                        ).first()
-                        if att:
-                            class_today_attendance[student['id']] = att
-            
-            all_students_today_attendance[cls['id']] = class_today_attendance
-    
-    # Get registered students/family members for school/family classes
-    registered_students = {}  # {class_id: [list of SchoolStudent]}
-    registered_family = {}    # {class_id: [list of FamilyMember]}
-    
-    for cls in enrolled_classes:
-        if cls['class_type'] == 'school':
-            # CRITICAL: Only get students registered for THIS specific class and THIS school
-            # Strict filtering to prevent cross-class or cross-school contamination
-            students = SchoolStudent.query.filter_by(
-                class_id=cls['id'],  # THIS class only
-                enrollment_id=cls['enrollment'].id,  # THIS enrollment only
-                registered_by=user_id  # Only students registered by this school admin
-            ).order_by(SchoolStudent.student_name).all()
-            registered_students[cls['id']] = students
-        elif cls['class_type'] == 'family':
-            # Get all registered family members
-            members = FamilyMember.query.filter_by(
-                class_id=cls['id'],
-                enrollment_id=cls['enrollment'].id
-            ).all()
-            registered_family[cls['id']] = members
-    
-    # Get materials shared to student's classes
-    materials = []
     try:
-        for cls in enrolled_classes:
-            # Get materials for this class based on class type
-            if cls['class_type'] == 'individual':
-                # Materials shared directly to student or to individual class
-                from sqlalchemy import or_
-                class_materials = LearningMaterial.query.filter(
-                    or_(
-                        LearningMaterial.class_id == f"student_{user_id}",
-                        (LearningMaterial.class_type == 'individual') & (LearningMaterial.actual_class_id == cls['id'])
-                    )
-                ).all()
-                materials.extend(class_materials)
-            elif cls['class_type'] == 'group':
-                # Materials shared to this group class
-                class_materials = LearningMaterial.query.filter_by(
-                    class_type='group',
-                    actual_class_id=cls['id']
-                ).all()
-                materials.extend(class_materials)
-            elif cls['class_type'] == 'school':
-                # Materials shared to this school class
-                # Format: "school_{class_id}" (as set in material sharing)
-                class_materials = LearningMaterial.query.filter(
-                    LearningMaterial.class_type == 'school',
-                    LearningMaterial.actual_class_id == cls['id']
-                ).all()
-                materials.extend(class_materials)
-            elif cls['class_type'] == 'family':
-                # Materials shared to this family enrollment
-                # Materials are saved with class_id=f"family_{enrollment.class_id}" and actual_class_id=enrollment.class_id
-                class_materials = LearningMaterial.query.filter(
-                    LearningMaterial.class_type == 'family',
-                    LearningMaterial.actual_class_id == cls['id']
-                ).all()
-                materials.extend(class_materials)
-        
-        # Remove duplicates and sort by date
-        seen_ids = set()
-        unique_materials = []
-        for material in materials:
-            if material.id not in seen_ids:
-                seen_ids.add(material.id)
-                unique_materials.append(material)
-        materials = sorted(unique_materials, key=lambda x: x.created_at, reverse=True)
+        context = load_student_dashboard(user, enrollments, today)
     except Exception as e:
         # If columns don't exist yet, check if it's a column error
         error_str = str(e)
@@ -2147,338 +1877,149 @@ def student_dashboard():
             return redirect(url_for('admin.setup_learning_material_columns'))
         # Re-raise if it's a different error
         raise
+    enrolled_classes = context['enrolled_classes']
+    class_times_by_type = context['class_times_by_type']
+    student_time_selections = context['student_time_selections']
     
     # Helper function for time-based greeting
     def now():
         return datetime.now()
     
     # Get school information if user is a school mentor
-    school = None
-    if getattr(user, 'is_school_admin', False):
-        school = School.query.filter_by(user_id=user_id).first()
+    school = school_obj if getattr(user, 'is_school_admin', False) else None
     
     # Get student's timezone (default to browser timezone or India if not set)
     student_timezone = getattr(user, 'timezone', None) or 'Asia/Kolkata'
     
-    # Get class times for each enrolled class type
-    class_times_by_type = {}
-    student_time_selections = {}
     active_live_class = None  # Will contain the enrollment and class time if live class is active
+    classes_by_enrollment = {cls['enrollment'].id: cls['class_obj'] for cls in enrolled_classes}
     
-    # Get current time in student's timezone
-    import pytz
-    from datetime import datetime, time as dt_time
-    student_tz = pytz.timezone(student_timezone)
-    current_datetime = datetime.now(student_tz)
-    current_time = current_datetime.time()
-    current_day = current_datetime.strftime('%A')  # Monday, Tuesday, etc.
+    def live_class_obj(enrollment):
+        """Class object for a live enrollment; GroupClass rows must match the enrollment's class type"""
+        class_obj = classes_by_enrollment.get(enrollment.id)
+        if isinstance(class_obj, GroupClass) and class_obj.class_type != enrollment.class_type:
+            return None
+        return class_obj
     
+    # Candidate slots per enrollment; whether one is live comes from the precomputed UTC windows
+    candidates_by_enrollment = {}
     for enrollment in enrollments:
         class_type = enrollment.class_type
-        class_id = enrollment.class_id
-        
-        # Create a unique key for this class type and class_id combination
-        # For individual/family, we use just class_type (class_id is None)
-        # For group/school, we need to filter by specific class_id
-        if class_type in ['group', 'school']:
-            times_key = f"{class_type}_{class_id}"
-        else:
-            times_key = class_type
-        
-        if times_key not in class_times_by_type:
-            # Get active time slots for this class type
-            # For group/school: filter by class_id (if class_id is None, get all; if set, get only that class)
-            # For individual/family: get all (class_id is None)
-            if class_type in ['group', 'school']:
-                # Get times ONLY for this specific class (class_id must match exactly)
-                # If class_id is None, don't show any times (each group/school class must have its own time slots)
-                times = ClassTime.query.filter(
-                    ClassTime.class_type == class_type,
-                    ClassTime.is_active == True,
-                    ClassTime.class_id == class_id  # Must match exactly - no general times
-                ).order_by(ClassTime.day, ClassTime.start_time).all()
-            else:
-                # For individual/family, get all times for this class type
-                times = ClassTime.query.filter_by(
-                    class_type=class_type,
-                    is_active=True
-                ).order_by(ClassTime.day, ClassTime.start_time).all()
-            
-            # Filter out time slots that are already booked (only for individual/family)
-            # Individual and Family classes share the same time pool - if ANY student selects a time, it's gone for ALL
-            available_times = []
-            # Get student's existing selections first to exclude them from available list
-            student_existing_selections = StudentClassTimeSelection.query.filter_by(
-                enrollment_id=enrollment.id
-            ).all()
-            student_selected_time_ids = {sel.class_time_id for sel in student_existing_selections}
-            
-            for time_slot in times:
-                is_available = True
-                
-                # Only check booking availability for individual/family (selectable classes)
-                if class_type in ['individual', 'family']:
-                    # Skip if student has already selected this time slot
-                    if time_slot.id in student_selected_time_ids:
-                        is_available = False
-                    else:
-                        # Check if this time slot is already selected by ANY student (individual or family)
-                        # Individual and Family share the same time pool - once selected, it's unavailable for all
-                        existing_booking = StudentClassTimeSelection.query.filter_by(
-                            class_time_id=time_slot.id
-                        ).first()
-                        
-                        if existing_booking:
-                            # Time slot is already taken by someone else - unavailable
-                            is_available = False
-                        else:
-                            # Also check shared slots - if any slot in the shared group is booked, all are unavailable
-                            if time_slot.shared_slot_group_id:
-                                # Find all time slots in the same shared group with same day/time
-                                shared_slots = ClassTime.query.filter_by(
-                                    shared_slot_group_id=time_slot.shared_slot_group_id,
-                                    day=time_slot.day,
-                                    start_time=time_slot.start_time,
-                                    end_time=time_slot.end_time,
-                                    is_active=True
-                                ).all()
-                                
-                                # Check if any of the shared slots are already booked by ANY student
-                                for shared_slot in shared_slots:
-                                    existing_booking = StudentClassTimeSelection.query.filter_by(
-                                        class_time_id=shared_slot.id
-                                    ).first()
-                                    
-                                    if existing_booking:
-                                        # Any slot in the shared group is booked - all are unavailable
-                                        is_available = False
-                                        break
-                
-                if is_available:
-                    available_times.append(time_slot)
-            
-            class_times_by_type[times_key] = available_times
-        
-        # Get student's time selections for this enrollment (can have up to 2)
-        selections = StudentClassTimeSelection.query.filter_by(
-            enrollment_id=enrollment.id
-        ).order_by(StudentClassTimeSelection.selected_at).all()
-        if selections:
-            student_time_selections[enrollment.id] = selections
         
-        # Check if Live Class should be active for this enrollment
         if class_type in ['individual', 'family']:
-            # For Individual/Family: Check if student has selected a time and it matches current time
-            # Check all selections to see if any match the current time
-            if selections:
-                for selection in selections:
-                    if selection and selection.class_time:
-                        class_time = selection.class_time
-                        # IMPORTANT: Verify class_time matches this enrollment's class_id
-                        # If class_time.class_id is None, it applies to all classes of this type
-                        # If class_time.class_id is set, it must match the enrollment's class_id
-                        if class_time.class_id is None or class_time.class_id == enrollment.class_id:
-                            # Convert class time to student's timezone
-                            try:
-                                admin_tz = pytz.timezone(class_time.timezone)
-                                today = current_datetime.date()
-                                start_dt = admin_tz.localize(datetime.combine(today, class_time.start_time))
-                                end_dt = admin_tz.localize(datetime.combine(today, class_time.end_time))
-                                
-                                start_dt_student = start_dt.astimezone(student_tz)
-                                end_dt_student = end_dt.astimezone(student_tz)
-                                
-                                student_start_time = start_dt_student.time()
-                                student_end_time = end_dt_student.time()
-                                student_day = start_dt_student.strftime('%A')
-                                
-                                # Check if current day and time match
-                                if (current_day == student_day and 
-                                    student_start_time <= current_time <= student_end_time):
-                                    # Get the class object based on class_type
-                                    class_obj = None
-                                    if class_type == 'individual':
-                                        class_obj = IndividualClass.query.get(enrollment.class_id) or \
-                                                   GroupClass.query.filter_by(id=enrollment.class_id, class_type='individual').first()
-                                    elif class_type == 'family':
-                                        class_obj = GroupClass.query.filter_by(id=enrollment.class_id, class_type='family').first()
-                                    
-                                    if class_obj:
-                                        active_live_class = {
-                                            'enrollment': enrollment,
-                                            'class_time': class_time,
-                                            'class': class_obj
-                                        }
-                                        break  # Only one live class at a time (use first matching selection)
-                            except Exception as e:
-                                from flask import current_app
-                                import traceback
-                                current_app.logger.error(f"Error checking live class for individual/family: {str(e)}\n{traceback.format_exc()}")
-                                pass  # If conversion fails, skip
-                    
+            # For Individual/Family: the live class follows the student's own time selections
+            candidate_times = [s.class_time for s in student_time_selections.get(enrollment.id, []) if s.class_time]
         elif class_type in ['group', 'school']:
-            # For Group/School: Check if there's a fixed time that matches current time AND class_id
-            times_key = f"{class_type}_{enrollment.class_id}"
-            fixed_times = class_times_by_type.get(times_key, [])
-            for class_time in fixed_times:
-                # IMPORTANT: class_time.class_id MUST match enrollment.class_id exactly
-                # For group/school, each class has its own time slots (no general times with class_id=None)
-                if class_time.class_id != enrollment.class_id:
-                    continue  # Skip if time slot is for a different class
-                
-                try:
-                    admin_tz = pytz.timezone(class_time.timezone)
-                    today = current_datetime.date()
-                    start_dt = admin_tz.localize(datetime.combine(today, class_time.start_time))
-                    end_dt = admin_tz.localize(datetime.combine(today, class_time.end_time))
-                    
-                    start_dt_student = start_dt.astimezone(student_tz)
-                    end_dt_student = end_dt.astimezone(student_tz)
-                    
-                    student_start_time = start_dt_student.time()
-                    student_end_time = end_dt_student.time()
-                    student_day = start_dt_student.strftime('%A')
-                    
-                    # Check if current day and time match
-                    if (current_day == student_day and 
-                        student_start_time <= current_time <= student_end_time):
-                        # Get the class object based on class_type
-                        class_obj = None
-                        if class_type == 'group':
-                            class_obj = GroupClass.query.filter_by(id=enrollment.class_id, class_type='group').first()
-                        elif class_type == 'school':
-                            class_obj = GroupClass.query.filter_by(id=enrollment.class_id, class_type='school').first()
-                        
-                        if class_obj:
-                            active_live_class = {
-                                'enrollment': enrollment,
-                                'class_time': class_time,
-                                'class': class_obj
-                            }
-                            break  # Only one live class at a time
-                except Exception as e:
-                    from flask import current_app
-                    import traceback
-                    current_app.logger.error(f"Error checking live class for group/school: {str(e)}\n{traceback.format_exc()}")
-                    pass  # If conversion fails, skip
+            # For Group/School: fixed times for this exact class
+            candidate_times = class_times_by_type.get(f"{class_type}_{enrollment.class_id}", [])
+        else:
+            candidate_times = []
+        
+        # If class_time.class_id is None it applies to all classes of this type (individual/family only)
+        candidates_by_enrollment[enrollment.id] = [
+            class_time for class_time in candidate_times
+            if class_time.class_id == enrollment.class_id or
+            (class_type not in ['group', 'school'] and class_time.class_id is None)
+        ]
+    
+    try:
+        live_ids = live_class_time_ids(
+            class_time.id for times in candidates_by_enrollment.values() for class_time in times
+        )
+    except Exception as e:
+        current_app.logger.error(f"Error checking live classes: {str(e)}", exc_info=True)
+        live_ids = set()
+    
+    for enrollment in enrollments:
+        if active_live_class:
+            break
+        for class_time in candidates_by_enrollment[enrollment.id]:
+            if class_time.id in live_ids:
+                class_obj = live_class_obj(enrollment)
+                if class_obj:
+                    active_live_class = {
+                        'enrollment': enrollment,
+                        'class_time': class_time,
+                        'class': class_obj
+                    }
+                    break  # Only one live class at a time
     
     # Get ID card for user (always get it if it exists, regardless of viewing status)
     user_id_card = None
-    if not getattr(user, 'is_admin', False):
-        approved_enrollment = ClassEnrollment.query.filter_by(
-            user_id=user_id,
-            status='completed'
-        ).first()
-        if approved_enrollment:
-            entity_type = approved_enrollment.class_type
-            entity_id = None
-            if entity_type == 'individual':
-                entity_id = user_id
-            elif entity_type == 'group':
-                entity_id = user_id
-            elif entity_type == 'family':
-                entity_id = approved_enrollment.id
-            elif entity_type == 'school':
-                school_obj = School.query.filter_by(user_id=user_id).first()
-                if school_obj:
-                    entity_id = school_obj.id
-            if entity_id:
-                user_id_card = get_id_card_for_entity(entity_type, entity_id)
+    if not getattr(user, 'is_admin', False) and enrollments:
+        approved_enrollment = enrollments[0]
+        entity_type = approved_enrollment.class_type
+        entity_id = None
+        if entity_type in ['individual', 'group']:
+            entity_id = user_id
+        elif entity_type == 'family':
+            entity_id = approved_enrollment.id
+        elif entity_type == 'school' and school_obj:
+            entity_id = school_obj.id
+        if entity_id:
+            user_id_card = get_id_card_for_entity(entity_type, entity_id)
     
     # Get monthly payments for all enrollments - dynamic based on enrollment date
-    monthly_payments = {}
-    enrollment_info = {}  # Store enrollment month/year for each enrollment
     current_year = datetime.now().year
     current_month = datetime.now().month
-    
     try:
-        for enrollment in enrollments:
-            # Get enrollment date (when student was enrolled/approved)
-            enrollment_date = enrollment.enrolled_at if enrollment.enrolled_at else datetime.utcnow()
-            enrollment_month = enrollment_date.month
-            enrollment_year = enrollment_date.year
-            
-            # Store enrollment info
-            enrollment_info[enrollment.id] = {
-                'month': enrollment_month,
-                'year': enrollment_year,
-                'date': enrollment_date
-            }
-            
-            # Get payments for this enrollment from enrollment year onwards
-            payments = MonthlyPayment.query.filter(
-                MonthlyPayment.enrollment_id == enrollment.id,
-                MonthlyPayment.payment_year >= enrollment_year
-            ).all()
-            
-            # Create a dict with month as key
-            payment_dict = {}
-            for payment in payments:
-                payment_dict[payment.payment_month] = payment
-            
-            # Auto-mark enrollment month as verified (paid) if status is completed
-            # This represents the initial payment that got them approved
-            if enrollment.status == 'completed' and enrollment_month not in payment_dict:
-                # Create a virtual payment record for the enrollment month
-                # We'll handle this in the template by checking enrollment status
-                pass
-            
-            monthly_payments[enrollment.id] = payment_dict
-            
-            # Calculate months to show (from enrollment to current + 1)
-            months_to_show = []
-            temp_year = enrollment_year
-            temp_month = enrollment_month
-            max_months = 15  # Show up to 15 months ahead
-            count = 0
-            
-            while count < max_months and (temp_year < current_year or (temp_year == current_year and temp_month <= current_month + 1)):
-                months_to_show.append((temp_year, temp_month))
-                temp_month += 1
-                if temp_month > 12:
-                    temp_month = 1
-                    temp_year += 1
-                count += 1
-            
-            enrollment_info[enrollment.id]['months_to_show'] = months_to_show
+        context.update(load_monthly_payments(enrollments, datetime.now()))
     except Exception as e:
         # If table doesn't exist yet, just use empty dict
         error_str = str(e)
         if 'monthly_payment' in error_str.lower() or 'does not exist' in error_str.lower():
-            monthly_payments = {}
-            enrollment_info = {}
+            context.update(payment_ledgers={})
         else:
             raise
     
     return render_template('student_dashboard.html', 
-                          enrollment_info=enrollment_info,
                           current_year=current_year,
                           current_month=current_month,
-                          purchases=purchases, 
-                          projects=projects,
-                          enrollments=enrollments,
-                          enrolled_classes=enrolled_classes,
-                          class_students=class_students,
-                          all_students_for_attendance=all_students_for_attendance,
-                          all_students_today_attendance=all_students_today_attendance,
-                          attendance_records=attendance_records,
-                          all_class_attendance=all_class_attendance,
-                          monthly_stats=monthly_stats,
-                          today_attendance=today_attendance,
-                          registered_students=registered_students,
-                          registered_family=registered_family,
-                          materials=materials,
                           school=school,
-                          class_times_by_type=class_times_by_type,
-                          student_time_selections=student_time_selections,
                           student_timezone=student_timezone,
                           active_live_class=active_live_class,
                           now=now,
                           id_card=user_id_card,
                           today=today,
-                          monthly_payments=monthly_payments,
                           Attendance=Attendance,
-                          user=user)
+                          user=user,
+                          **context)
+
+
+def live_status_response(status):
+    """JSON body for the live-class polling endpoints"""
+    next_change_at = status['next_change_at']
+    poll_after = 60
+    if next_change_at:
+        poll_after = max(5, int((next_change_at - datetime.utcnow()).total_seconds()) + 1)
+    return jsonify({
+        'live': status['live'],
+        'live_class': status['live_class'],
+        'next_change_at': next_change_at.isoformat() + 'Z' if next_change_at else None,
+        'poll_after': poll_after,
+    })
+
+
+@bp.route('/student/live-class-status')
+def student_live_class_status():
+    """Active live class for the session's student, for dashboard polling - NO LOGIN REQUIRED"""
+    from flask import session
+    from ..services.live_status import live_class_status
+    
+    if current_user.is_authenticated:
+        user = current_user
+    else:
+        user_id = session.get('student_user_id') or session.get('user_id')
+        user = User.query.get(user_id) if user_id else None
+    if not user:
+        return jsonify({'error': 'Not signed in'}), 401
+    
+    enrollments = ClassEnrollment.query.filter_by(
+        user_id=user.id,
+        status='completed'
+    ).order_by(ClassEnrollment.id).all()
+    student_timezone = getattr(user, 'timezone', None) or 'Asia/Kolkata'
+    return live_status_response(live_class_status(enrollments, student_timezone))
 
 
 @bp.route('/my-curriculum')
@@ -2599,24 +2140,20 @@ def mark_attendance():
             return redirect(url_for('schools.school_dashboard'))
         
         # For school students, we use the school admin's user_id as a proxy
-        # but store the school_student_id in the notes field for tracking
+        # and identify the registered student through school_student_id
         target_student_id = current_user.id  # Use school admin as proxy
         today = date.today()
         
         # Check if attendance already exists for this school student today
-        # We'll use a special format in notes: "school_student_{id}"
-        existing = Attendance.query.filter(
-            Attendance.student_id == target_student_id,
-            Attendance.class_id == class_id,
-            Attendance.class_type == 'school',
-            Attendance.attendance_date == today,
-            Attendance.notes.like(f'%school_student_{school_student_id}%')
+        existing = Attendance.query.filter_by(
+            school_student_id=school_student_id,
+            class_id=class_id,
+            attendance_date=today
         ).first()
         
         if existing:
             existing.status = status
             existing.marked_by = current_user.id
-            existing.notes = f'school_student_{school_student_id}'
             flash('Attendance updated successfully!', 'success')
         else:
             new_attendance = Attendance(
@@ -2626,7 +2163,7 @@ def mark_attendance():
                 attendance_date=today,
                 status=status,
                 marked_by=current_user.id,
-                notes=f'school_student_{school_student_id}'  # Store school student ID in notes
+                school_student_id=school_student_id
             )
             db.session.add(new_attendance)
             flash('Attendance marked successfully!', 'success')
@@ -2700,7 +2237,8 @@ def mark_attendance():
     existing = Attendance.query.filter_by(
         student_id=target_student_id,
         class_id=class_id,
-        attendance_date=today
+        attendance_date=today,
+        school_student_id=None
     ).first()
     
     if existing:
@@ -2788,7 +2326,8 @@ def register_student():
         image_file = request.files['student_image']
         if image_file and image_file.filename:
             try:
-                upload_result = cloudinary.uploader.upload(image_file)
+                with track('cloudinary'):
+                    upload_result = cloudinary.uploader.upload(image_file)
                 student_image_url = upload_result.get('secure_url')
             except Exception as e:
                 flash(f'Error uploading image: {str(e)}', 'warning')
@@ -2916,7 +2455,8 @@ def register_family_member():
         image_file = request.files['member_image']
         if image_file and image_file.filename:
             try:
-                upload_result = cloudinary.uploader.upload(image_file)
+                with track('cloudinary'):
+                    upload_result = cloudinary.uploader.upload(image_file)
                 member_image_url = upload_result.get('secure_url')
             except Exception as e:
                 flash(f'Error uploading image: {str(e)}', 'warning')
@@ -2952,8 +2492,8 @@ def admin_attendance():
     if admin_check:
         return admin_check
     
-    from datetime import date, timedelta
-    from calendar import monthrange
+    from datetime import date
+    from ..services import attendance_report
     
     # Get filter parameters
     selected_date = request.args.get('date', date.today().isoformat())
@@ -2965,78 +2505,55 @@ def admin_attendance():
     except:
         filter_date = date.today()
     
+    # Stats cover the current month unless an explicit range is given
+    stats_start, stats_end = attendance_report.month_range(date.today())
+    try:
+        if request.args.get('stats_start'):
+            stats_start = date.fromisoformat(request.args['stats_start'])
+        if request.args.get('stats_end'):
+            stats_end = date.fromisoformat(request.args['stats_end'])
+    except ValueError:
+        flash('Invalid stats date range; showing this month.', 'warning')
+        stats_start, stats_end = attendance_report.month_range(date.today())
+    if stats_end < stats_start:
+        stats_start, stats_end = stats_end, stats_start
+    custom_range = (stats_start, stats_end) != attendance_report.month_range(date.today())
+    stats_label = f"{stats_start.strftime('%b %d')} – {stats_end.strftime('%b %d, %Y')}" if custom_range else 'this month'
+    
     # Get all classes
     all_classes = GroupClass.query.all() + IndividualClass.query.all()
     
-    # Get attendance for selected date
-    attendance_query = Attendance.query.filter_by(attendance_date=filter_date)
-    
-    if selected_class_id:
-        attendance_query = attendance_query.filter_by(class_id=selected_class_id)
-    if selected_student_id:
-        attendance_query = attendance_query.filter_by(student_id=selected_student_id)
-    
-    attendance_records = attendance_query.order_by(Attendance.created_at.desc()).all()
-    
-    # Get class names, student names, and marker names
-    for att in attendance_records:
-        class_obj = GroupClass.query.get(att.class_id) or IndividualClass.query.get(att.class_id)
-        att.class_name = class_obj.name if class_obj else 'Unknown'
-        student = User.query.get(att.student_id)
-        att.student_name = f"{student.first_name} {student.last_name}" if student else 'Unknown'
-        # Get marker (who marked the attendance)
-        if att.marked_by:
-            marker = User.query.get(att.marked_by)
-            att.marker_name = f"{marker.first_name} {marker.last_name}" if marker else 'Unknown'
-        else:
-            att.marker_name = 'System'
-    
-    # Get all students enrolled in classes
-    all_enrollments = ClassEnrollment.query.filter_by(status='completed').all()
-    enrolled_students = {}
-    for enr in all_enrollments:
-        if enr.class_id not in enrolled_students:
-            enrolled_students[enr.class_id] = []
-        student = User.query.get(enr.user_id)
-        if student:
-            enrolled_students[enr.class_id].append({
-                'id': student.id,
-                'name': f"{student.first_name} {student.last_name}",
-                'username': student.username
-            })
+    # One page of the selected date's attendance, class, student and marker names joined in
+    daily = attendance_report.daily_records(filter_date, selected_class_id, selected_student_id,
+                                            page=request.args.get('page', 1, type=int))
     
-    # Get monthly stats for each student
-    today = date.today()
-    month_start = date(today.year, today.month, 1)
-    month_end = date(today.year, today.month, monthrange(today.year, today.month)[1])
-    
-    monthly_stats = {}
-    all_students = User.query.filter_by(is_student=True).all()
-    for student in all_students:
-        student_attendance = Attendance.query.filter(
-            Attendance.student_id == student.id,
-            Attendance.attendance_date >= month_start,
-            Attendance.attendance_date <= month_end
-        ).all()
-        
-        total_days = monthrange(today.year, today.month)[1]
-        present_days = len([a for a in student_attendance if a.status == 'present'])
-        percentage = (present_days / total_days * 100) if total_days > 0 else 0
-        
-        monthly_stats[student.id] = {
-            'present': present_days,
-            'total': total_days,
-            'percentage': round(percentage, 1)
-        }
+    # Roster and class counts only for the selected class; with no class picked the
+    # student filter just keeps the current selection
+    enrolled_students = attendance_report.class_rosters(selected_class_id) if selected_class_id else {}
+    class_stats = attendance_report.class_summary(stats_start, stats_end, selected_class_id) if selected_class_id else []
+    selected_student = None
+    if selected_student_id and not selected_class_id:
+        selected_student = db.session.get(User, selected_student_id)
+    
+    # Per-student counts for the students on this page and the selected class's roster
+    shown_ids = {att.student_id for att in daily.records if att.student_id}
+    shown_ids.update(student['id'] for student in enrolled_students.get(selected_class_id, []))
+    monthly_stats = attendance_report.student_summary(stats_start, stats_end, shown_ids)
     
     return render_template('admin_attendance.html',
-                         attendance_records=attendance_records,
+                         attendance_records=daily.records,
+                         daily=daily,
                          all_classes=all_classes,
                          enrolled_students=enrolled_students,
                          filter_date=filter_date,
                          selected_class_id=selected_class_id,
                          selected_student_id=selected_student_id,
-                         monthly_stats=monthly_stats)
+                         selected_student=selected_student,
+                         monthly_stats=monthly_stats,
+                         class_stats=class_stats,
+                         stats_start=stats_start,
+                         stats_end=stats_end,
+                         stats_label=stats_label)
 
 
 @bp.route('/admin/mark-attendance', methods=['POST'])
@@ -3074,7 +2591,8 @@ def admin_mark_attendance():
     existing = Attendance.query.filter_by(
         student_id=student_id,
         class_id=class_id,
-        attendance_date=attendance_date
+        attendance_date=attendance_date,
+        school_student_id=None
     ).first()
     
     if existing:
@@ -3102,6 +2620,113 @@ def admin_mark_attendance():
     return redirect(url_for('admin.admin_attendance', date=attendance_date_str, class_id=class_id))
 
 
+def _bulk_attendance_json(payload, statuses):
+    """
+    (class_id, date, school_mode, entries) from a bulk attendance JSON body;
+    raises ValueError describing the first malformed part
+    """
+    from datetime import date
+    
+    if not isinstance(payload, dict):
+        raise ValueError('The request body must be a JSON object.')
+    records = payload.get('records') or []
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise ValueError('records must be a list of objects.')
+    # Registered school students are named by school_student_id, in every record
+    school_mode = any('school_student_id' in record for record in records)
+    id_key = 'school_student_id' if school_mode else 'student_id'
+    entries = []
+    for record in records:
+        record_id, status = record.get(id_key), record.get('status', 'present')
+        # bool is an int subclass, but true/false are not ids
+        if type(record_id) is not int or not isinstance(status, str):
+            raise ValueError(f'Each record needs an integer {id_key} and a status ({", ".join(statuses)}).')
+        entries.append((record_id, status))
+    return payload.get('class_id'), payload.get('date') or date.today().isoformat(), school_mode, entries
+
+
+@bp.route('/admin/mark-attendance/bulk', methods=['POST'])
+@login_required
+def bulk_mark_attendance():
+    """
+    Mark attendance for a whole class roster in one request.
+
+    JSON body: {"class_id": 3, "date": "2026-10-17", "records": [{"student_id": 7, "status": "present"}, ...]}
+    or form fields class_id, attendance_date, status and repeated student_id (everyone gets that status).
+    For registered school students use school_student_id instead of student_id, in every record.
+    Admins and the class teacher may mark anyone in the class; a school admin may mark the
+    school students they registered. Returns per-student results.
+    """
+    from datetime import date
+    from ..services.attendance_marking import VALID_STATUSES, mark_class_attendance, mark_school_attendance
+    
+    payload = request.get_json(silent=True) if request.is_json else None
+    error = None
+    if payload is not None:
+        try:
+            class_id, date_str, school_mode, entries = _bulk_attendance_json(payload, VALID_STATUSES)
+        except ValueError as e:
+            class_id, date_str, school_mode, entries = None, None, False, []
+            error = str(e)
+    else:
+        class_id = request.form.get('class_id', type=int)
+        date_str = request.form.get('attendance_date') or date.today().isoformat()
+        status = request.form.get('status', 'present')
+        school_mode = 'school_student_id' in request.form
+        id_key = 'school_student_id' if school_mode else 'student_id'
+        entries = [(record_id, status) for record_id in request.form.getlist(id_key, type=int)]
+    
+    def respond(body, code=200):
+        if payload is not None:
+            return jsonify(body), code
+        flash(body.get('message') or body.get('error'), 'success' if body.get('success') else 'danger')
+        if school_mode and not current_user.is_admin:
+            return redirect(url_for('schools.school_dashboard'))
+        return redirect(url_for('admin.admin_attendance', date=date_str, class_id=class_id))
+    
+    if error:
+        return respond({'success': False, 'error': error}, 400)
+    
+    try:
+        class_id = int(class_id)
+        attendance_date = date.fromisoformat(date_str)
+    except (TypeError, ValueError):
+        return respond({'success': False, 'error': 'A valid class_id and date are required.'}, 400)
+    
+    # Admins and the class teacher may mark anyone; otherwise only a school admin's own students
+    school_admin_id = None
+    if not current_user.is_admin:
+        class_obj = GroupClass.query.get(class_id)
+        if not class_obj or class_obj.teacher_id != current_user.id:
+            if not school_mode:
+                return respond({'success': False, 'error': 'Access denied. Admin or class teacher privileges required.'}, 403)
+            school_admin_id = current_user.id
+    
+    if not entries:
+        return respond({'success': False, 'error': 'No students to mark.'}, 400)
+    
+    if school_mode:
+        results = mark_school_attendance(class_id, attendance_date, entries, current_user.id, school_admin_id)
+    else:
+        results = mark_class_attendance(class_id, attendance_date, entries, current_user.id)
+    saved = sum(1 for result in results if result['saved'])
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return respond({'success': False, 'error': f'Error marking attendance: {str(e)}'}, 500)
+    
+    return respond({
+        'success': True,
+        'class_id': class_id,
+        'date': attendance_date.isoformat(),
+        'saved': saved,
+        'failed': len(results) - saved,
+        'results': results,
+        'message': f'Attendance saved for {saved} of {len(results)} students.',
+    })
+
+
 @bp.route('/admin/registered-students')
 @login_required
 def admin_registered_students():
@@ -3401,40 +3026,31 @@ def admin_gallery_add():
         display_order = request.form.get('display_order', 0, type=int)
         input_method = request.form.get('input_method', 'url')
         
+        # Files come straight from the browser's Cloudinary upload, or are queued for it once the item is saved
+        from ..services.direct_upload import receive_upload
+        from ..services.upload_queue import attach_upload, UploadError
+        media_upload = None
+        thumbnail_upload = None
+        
         # Handle file upload if chosen
         if input_method == 'upload':
-            media_file = request.files.get('media_file')
-            if media_file and media_file.filename:
-                from ..services.cloudinary_service import cloudinary_service
-                
-                # Determine resource type
-                resource_type = 'video' if media_type == 'video' else 'image'
-                folder = f'gallery/{media_type}s'
-                
-                success, result = cloudinary_service.upload_file(
-                    media_file,
-                    folder=folder,
-                    resource_type=resource_type
-                )
-                
-                if success:
-                    media_url = result['url']
-                    flash(f'File uploaded successfully!', 'info')
-                else:
-                    flash(f'Upload failed: {result}', 'danger')
-                    return render_template('admin_gallery_form.html', action='add')
+            try:
+                media_upload = receive_upload('media_file', f'gallery_{media_type}')
+            except UploadError as e:
+                flash(f'Upload failed: {e}', 'danger')
+                return render_template('admin_gallery_form.html', action='add')
+            if media_upload:
+                media_url = media_upload.url
+                if media_upload.pending:
+                    flash(f'File received - it will be published to Cloudinary in the background.', 'info')
         
         # Handle thumbnail upload
-        thumbnail_file = request.files.get('thumbnail_file')
-        if thumbnail_file and thumbnail_file.filename:
-            from ..services.cloudinary_service import cloudinary_service
-            success, result = cloudinary_service.upload_file(
-                thumbnail_file,
-                folder='gallery/thumbnails',
-                resource_type='image'
-            )
-            if success:
-                thumbnail_url = result['url']
+        try:
+            thumbnail_upload = receive_upload('thumbnail_file', 'gallery_thumbnail')
+        except UploadError:
+            pass
+        if thumbnail_upload:
+            thumbnail_url = thumbnail_upload.url
         
         if not title:
             flash('Title is required.', 'danger')
@@ -3458,6 +3074,9 @@ def admin_gallery_add():
                 created_by=current_user.id
             )
             db.session.add(gallery_item)
+            attach_upload(media_upload and media_upload.pending, gallery_item, 'media_url')
+            attach_upload(thumbnail_upload and thumbnail_upload.pending, gallery_item, 'thumbnail_url')
+            invalidate_home_sections()
             db.session.commit()
             flash(f'{media_type.title()} added to gallery successfully!', 'success')
             return redirect(url_for('admin.admin_gallery'))
@@ -3486,27 +3105,20 @@ def admin_gallery_edit(item_id):
         item.display_order = request.form.get('display_order', 0, type=int)
         
         input_method = request.form.get('input_method', 'url')
+        from ..services.direct_upload import receive_upload
+        from ..services.upload_queue import attach_upload, UploadError
         
-        # Handle file upload if chosen
+        # Handle file upload if chosen (direct from the browser, or uploaded in the background after commit)
         if input_method == 'upload':
-            media_file = request.files.get('media_file')
-            if media_file and media_file.filename:
-                from ..services.cloudinary_service import cloudinary_service
-                
-                resource_type = 'video' if item.media_type == 'video' else 'image'
-                folder = f'gallery/{item.media_type}s'
-                
-                success, result = cloudinary_service.upload_file(
-                    media_file,
-                    folder=folder,
-                    resource_type=resource_type
-                )
-                
-                if success:
-                    item.media_url = result['url']
-                    flash(f'File uploaded successfully!', 'info')
-                else:
-                    flash(f'Upload failed: {result}', 'danger')
+            try:
+                media_upload = receive_upload('media_file', f'gallery_{item.media_type}')
+                if media_upload:
+                    item.media_url = media_upload.url
+                    attach_upload(media_upload.pending, item, 'media_url')
+                    if media_upload.pending:
+                        flash(f'File received - it will be published to Cloudinary in the background.', 'info')
+            except UploadError as e:
+                flash(f'Upload failed: {e}', 'danger')
         else:
             # Use URL from form
             new_url = request.form.get('media_url', '').strip()
@@ -3514,21 +3126,19 @@ def admin_gallery_edit(item_id):
                 item.media_url = new_url
         
         # Handle thumbnail
-        thumbnail_file = request.files.get('thumbnail_file')
-        if thumbnail_file and thumbnail_file.filename:
-            from ..services.cloudinary_service import cloudinary_service
-            success, result = cloudinary_service.upload_file(
-                thumbnail_file,
-                folder='gallery/thumbnails',
-                resource_type='image'
-            )
-            if success:
-                item.thumbnail_url = result['url']
+        try:
+            thumbnail_upload = receive_upload('thumbnail_file', 'gallery_thumbnail')
+        except UploadError:
+            thumbnail_upload = None
+        if thumbnail_upload:
+            item.thumbnail_url = thumbnail_upload.url
+            attach_upload(thumbnail_upload.pending, item, 'thumbnail_url')
         else:
             new_thumb = request.form.get('thumbnail_url', '').strip()
             item.thumbnail_url = new_thumb or None
         
         try:
+            invalidate_home_sections()
             db.session.commit()
             flash('Gallery item updated successfully!', 'success')
             return redirect(url_for('admin.admin_gallery'))
@@ -3550,6 +3160,7 @@ def admin_gallery_delete(item_id):
     item = HomeGallery.query.get_or_404(item_id)
     try:
         db.session.delete(item)
+        invalidate_home_sections()
         db.session.commit()
         flash('Gallery item deleted successfully!', 'success')
     except Exception as e:
@@ -3595,6 +3206,7 @@ def admin_gallery_import_project():
                 created_by=current_user.id
             )
             db.session.add(gallery_item)
+            invalidate_home_sections()
             db.session.commit()
             flash(f'Image from "{project.title}" added to gallery!', 'success')
             
@@ -3621,6 +3233,7 @@ def admin_gallery_import_project():
                 created_by=current_user.id
             )
             db.session.add(gallery_item)
+            invalidate_home_sections()
             db.session.commit()
             flash(f'Video from "{project.title}" added to gallery!', 'success')
         else:
@@ -3661,6 +3274,7 @@ def admin_gallery_reorder():
                 current_app.logger.error(f"Error updating item {item_id}: {e}")
                 continue
         
+        invalidate_home_sections()
         db.session.commit()
         return jsonify({'success': True, 'message': 'Display order updated successfully'})
         
@@ -3753,6 +3367,7 @@ def admin_victory_add():
                 created_by=current_user.id
             )
             db.session.add(victory)
+            invalidate_home_sections()
             db.session.commit()
             flash('Student victory added successfully!', 'success')
             return redirect(url_for('admin.admin_victories'))
@@ -3810,6 +3425,7 @@ def admin_victory_edit(victory_id):
             victory.achievement_date = None
         
         try:
+            invalidate_home_sections()
             db.session.commit()
             flash('Student victory updated successfully!', 'success')
             return redirect(url_for('admin.admin_victories'))
@@ -3831,6 +3447,7 @@ def admin_victory_delete(victory_id):
     victory = StudentVictory.query.get_or_404(victory_id)
     try:
         db.session.delete(victory)
+        invalidate_home_sections()
         db.session.commit()
         flash('Student victory deleted successfully!', 'success')
     except Exception as e:
@@ -3907,6 +3524,8 @@ def update_pricing(class_type):
             )
             db.session.add(pricing)
         
+        # Publish the change to the pricing snapshot cached by every worker
+        ClassPricing.invalidate_cache()
         db.session.commit()
         flash(f'{name} pricing updated successfully!', 'success')
     except Exception as e:
@@ -4914,15 +4533,17 @@ def admin_individual_classes():
         
         if not student_ids:
             flash('Please select at least one student.', 'danger')
-        elif not content and not request.files.get('material_file'):
+        elif not content and not request.files.get('material_file') and not request.form.get('material_file_upload'):
             flash('Please provide content or upload a file.', 'danger')
         else:
-            from ..services.cloudinary_service import CloudinaryService
+            from ..services.direct_upload import receive_upload
+            from ..services.upload_queue import attach_upload, UploadError
             from werkzeug.utils import secure_filename
             import re
             
             material_type = 'text'
             file_url = None
+            material_upload = None
             file_type = None
             file_name = None
             youtube_url = None
@@ -4933,35 +4554,26 @@ def admin_individual_classes():
                 youtube_url = f"https://www.youtube.com/watch?v={youtube_match.group(1)}"
                 material_type = 'youtube'
             
-            uploaded_file = request.files.get('material_file')
-            if uploaded_file and uploaded_file.filename:
-                file_name = secure_filename(uploaded_file.filename)
+            try:
+                material_upload = receive_upload('material_file', 'learning_material')
+            except UploadError as e:
+                flash(f'File upload failed: {e}', 'warning')
+            if material_upload:
+                file_name = secure_filename(material_upload.filename)
                 file_ext = file_name.lower().split('.')[-1] if '.' in file_name else ''
                 
                 if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg']:
-                    resource_type = 'image'
                     material_type = 'image'
                 elif file_ext in ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'mkv']:
-                    resource_type = 'video'
                     material_type = 'video'
                 elif file_ext in ['pdf']:
-                    resource_type = 'raw'
                     material_type = 'pdf'
                 else:
-                    resource_type = 'raw'
                     material_type = 'text'
                 
-                success, result = CloudinaryService.upload_file(
-                    file=uploaded_file,
-                    folder='learning_materials',
-                    resource_type=resource_type
-                )
-                
-                if success:
-                    file_url = result.get('url')
-                    file_type = result.get('format', file_ext)
-                else:
-                    flash(f'File upload failed: {result}', 'warning')
+                # Direct uploads are already on Cloudinary; queued ones swap every material's file_url in when done
+                file_url = material_upload.url
+                file_type = file_ext
             
             try:
                 shared_count = 0
@@ -4984,6 +4596,7 @@ def admin_individual_classes():
                             youtube_url=youtube_url
                         )
                         db.session.add(material)
+                        attach_upload(material_upload and material_upload.pending, material, 'file_url')
                         shared_count += 1
                 
                 db.session.commit()
@@ -5054,9 +4667,10 @@ def admin_individual_classes():
                     enrollment_id = enrollment.id
                     user_id = enrollment.user_id
                     
-                    # Delete related time selections
+                    # Delete related time selections; through the session, so their seat claims go too
                     from ..models.classes import StudentClassTimeSelection
-                    StudentClassTimeSelection.query.filter_by(enrollment_id=enrollment_id).delete()
+                    for selection in StudentClassTimeSelection.query.filter_by(enrollment_id=enrollment_id).all():
+                        db.session.delete(selection)
                     
                     # Delete related ID card if exists
                     from ..models.id_cards import IDCard
@@ -5263,15 +4877,17 @@ def admin_group_classes():
         
         if not class_ids:
             flash('Please select at least one group class.', 'danger')
-        elif not content and not request.files.get('material_file'):
+        elif not content and not request.files.get('material_file') and not request.form.get('material_file_upload'):
             flash('Please provide content or upload a file.', 'danger')
         else:
-            from ..services.cloudinary_service import CloudinaryService
+            from ..services.direct_upload import receive_upload
+            from ..services.upload_queue import attach_upload, UploadError
             from werkzeug.utils import secure_filename
             import re
             
             material_type = 'text'
             file_url = None
+            material_upload = None
             file_type = None
             file_name = None
             youtube_url = None
@@ -5282,35 +4898,26 @@ def admin_group_classes():
                 youtube_url = f"https://www.youtube.com/watch?v={youtube_match.group(1)}"
                 material_type = 'youtube'
             
-            uploaded_file = request.files.get('material_file')
-            if uploaded_file and uploaded_file.filename:
-                file_name = secure_filename(uploaded_file.filename)
+            try:
+                material_upload = receive_upload('material_file', 'learning_material')
+            except UploadError as e:
+                flash(f'File upload failed: {e}', 'warning')
+            if material_upload:
+                file_name = secure_filename(material_upload.filename)
                 file_ext = file_name.lower().split('.')[-1] if '.' in file_name else ''
                 
                 if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg']:
-                    resource_type = 'image'
                     material_type = 'image'
                 elif file_ext in ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'mkv']:
-                    resource_type = 'video'
                     material_type = 'video'
                 elif file_ext in ['pdf']:
-                    resource_type = 'raw'
                     material_type = 'pdf'
                 else:
-                    resource_type = 'raw'
                     material_type = 'text'
                 
-                success, result = CloudinaryService.upload_file(
-                    file=uploaded_file,
-                    folder='learning_materials',
-                    resource_type=resource_type
-                )
-                
-                if success:
-                    file_url = result.get('url')
-                    file_type = result.get('format', file_ext)
-                else:
-                    flash(f'File upload failed: {result}', 'warning')
+                # Direct uploads are already on Cloudinary; queued ones swap every material's file_url in when done
+                file_url = material_upload.url
+                file_type = file_ext
             
             try:
                 shared_count = 0
@@ -5332,6 +4939,7 @@ def admin_group_classes():
                             youtube_url=youtube_url
                         )
                         db.session.add(material)
+                        attach_upload(material_upload and material_upload.pending, material, 'file_url')
                         shared_count += 1
                 
                 db.session.commit()
@@ -5437,8 +5045,8 @@ def admin_group_class_detail(class_id):
                         # Generate Group System ID if not exists
                         try:
                             if not enrollment.group_system_id:
-                                from ..models.classes import generate_group_system_id
-                                enrollment.group_system_id = generate_group_system_id()
+                                from ..models.classes import assign_group_system_id
+                                assign_group_system_id(enrollment)
                         except Exception as e:
                             # Handle case where group_system_id column doesn't exist yet
                             if 'group_system_id' in str(e).lower() or 'column' in str(e).lower():
@@ -5580,15 +5188,17 @@ def admin_family_classes():
         
         if not enrollment_ids:
             flash('Please select at least one family class.', 'danger')
-        elif not content and not request.files.get('material_file'):
+        elif not content and not request.files.get('material_file') and not request.form.get('material_file_upload'):
             flash('Please provide content or upload a file.', 'danger')
         else:
-            from ..services.cloudinary_service import CloudinaryService
+            from ..services.direct_upload import receive_upload
+            from ..services.upload_queue import attach_upload, UploadError
             from werkzeug.utils import secure_filename
             import re
             
             material_type = 'text'
             file_url = None
+            material_upload = None
             file_type = None
             file_name = None
             youtube_url = None
@@ -5599,35 +5209,26 @@ def admin_family_classes():
                 youtube_url = f"https://www.youtube.com/watch?v={youtube_match.group(1)}"
                 material_type = 'youtube'
             
-            uploaded_file = request.files.get('material_file')
-            if uploaded_file and uploaded_file.filename:
-                file_name = secure_filename(uploaded_file.filename)
+            try:
+                material_upload = receive_upload('material_file', 'learning_material')
+            except UploadError as e:
+                flash(f'File upload failed: {e}', 'warning')
+            if material_upload:
+                file_name = secure_filename(material_upload.filename)
                 file_ext = file_name.lower().split('.')[-1] if '.' in file_name else ''
                 
                 if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg']:
-                    resource_type = 'image'
                     material_type = 'image'
                 elif file_ext in ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'mkv']:
-                    resource_type = 'video'
                     material_type = 'video'
                 elif file_ext in ['pdf']:
-                    resource_type = 'raw'
                     material_type = 'pdf'
                 else:
-                    resource_type = 'raw'
                     material_type = 'text'
                 
-                success, result = CloudinaryService.upload_file(
-                    file=uploaded_file,
-                    folder='learning_materials',
-                    resource_type=resource_type
-                )
-                
-                if success:
-                    file_url = result.get('url')
-                    file_type = result.get('format', file_ext)
-                else:
-                    flash(f'File upload failed: {result}', 'warning')
+                # Direct uploads are already on Cloudinary; queued ones swap every material's file_url in when done
+                file_url = material_upload.url
+                file_type = file_ext
             
             try:
                 shared_count = 0
@@ -5649,6 +5250,7 @@ def admin_family_classes():
                             youtube_url=youtube_url
                         )
                         db.session.add(material)
+                        attach_upload(material_upload and material_upload.pending, material, 'file_url')
                         shared_count += 1
                 
                 db.session.commit()
@@ -5890,7 +5492,8 @@ def admin_family_class_detail(enrollment_id):
 @login_required
 def upload_monthly_payment():
     """Route for students to upload monthly payment receipts"""
-    from ..services.cloudinary_service import CloudinaryService
+    from ..services.direct_upload import receive_upload
+    from ..services.upload_queue import attach_upload
     from werkzeug.utils import secure_filename
     from datetime import datetime
     
@@ -5921,37 +5524,30 @@ def upload_monthly_payment():
         return redirect(url_for('admin.student_dashboard'))
     
     # Handle file upload
-    uploaded_file = request.files.get('receipt_file')
-    if not uploaded_file or not uploaded_file.filename:
-        flash('Please upload a payment receipt.', 'danger')
-        return redirect(url_for('admin.student_dashboard'))
-    
     try:
-        file_name = secure_filename(uploaded_file.filename)
-        success, result = CloudinaryService.upload_file(
-            file=uploaded_file,
-            folder='monthly_payments',
-            resource_type='auto'
-        )
+        # Uploaded by the browser, or queued for Cloudinary with receipt_url swapped in when it's done
+        receipt_upload = receive_upload('receipt_file', 'monthly_payment')
+        if receipt_upload is None:
+            flash('Please upload a payment receipt.', 'danger')
+            return redirect(url_for('admin.student_dashboard'))
+        file_name = secure_filename(receipt_upload.filename)
         
-        if success and isinstance(result, dict) and result.get('url'):
-            # Create payment record
-            payment = MonthlyPayment(
-                user_id=current_user.id,
-                enrollment_id=enrollment_id,
-                class_type=enrollment.class_type,
-                payment_month=payment_month,
-                payment_year=payment_year,
-                amount=amount,
-                receipt_url=result.get('url'),
-                receipt_filename=file_name,
-                status='pending'
-            )
-            db.session.add(payment)
-            db.session.commit()
-            flash(f'Payment receipt for {payment.get_month_name()} {payment_year} uploaded successfully!', 'success')
-        else:
-            flash('Error uploading receipt. Please try again.', 'danger')
+        # Create payment record
+        payment = MonthlyPayment(
+            user_id=current_user.id,
+            enrollment_id=enrollment_id,
+            class_type=enrollment.class_type,
+            payment_month=payment_month,
+            payment_year=payment_year,
+            amount=amount,
+            receipt_url=receipt_upload.url,
+            receipt_filename=file_name,
+            status='pending'
+        )
+        db.session.add(payment)
+        attach_upload(receipt_upload.pending, payment, 'receipt_url')
+        db.session.commit()
+        flash(f'Payment receipt for {payment.get_month_name()} {payment_year} uploaded successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error uploading payment: {str(e)}', 'danger')
@@ -6014,6 +5610,93 @@ def reject_monthly_payment(payment_id):
     return redirect(referer)
 
 
+@bp.route('/admin/payment-arrears')
+@login_required
+def admin_payment_arrears():
+    """Completed enrollments that are behind on monthly payments"""
+    admin_check = require_admin()
+    if admin_check:
+        return admin_check
+    
+    from ..services.payment_ledger import CLASS_TYPES, arrears
+    class_type = request.args.get('class_type') or None
+    if class_type not in CLASS_TYPES:
+        class_type = None
+    
+    rows = list(arrears(datetime.now(), class_type=class_type))
+    totals = {
+        'enrollments': len(rows),
+        'overdue_months': sum(len(row.ledger.overdue) for row in rows),
+        'pending_months': sum(len(row.ledger.pending) for row in rows),
+    }
+    return render_template('admin_payment_arrears.html',
+        rows=rows,
+        totals=totals,
+        class_types=CLASS_TYPES,
+        class_type=class_type
+    )
+
+
+@bp.route('/admin/payment-arrears/export')
+@login_required
+def export_payment_arrears():
+    """Stream the arrears report as CSV, a chunk of enrollments at a time"""
+    admin_check = require_admin()
+    if admin_check:
+        return admin_check
+    
+    import csv
+    from io import StringIO
+    from flask import Response, stream_with_context
+    from ..services.payment_ledger import CLASS_TYPES, arrears
+    class_type = request.args.get('class_type') or None
+    if class_type not in CLASS_TYPES:
+        class_type = None
+    include_current = request.args.get('all') == '1'
+    now = datetime.now()
+    
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        
+        def line(values):
+            writer.writerow(values)
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return value
+        
+        yield line([
+            'Enrollment ID', 'Student Name', 'Student ID', 'Email', 'Class Type', 'Class',
+            'Enrollment Amount', 'Enrolled At', 'Paid Months', 'Pending Months', 'Overdue Months',
+            'Overdue', 'Pending',
+        ])
+        for row in arrears(now, class_type=class_type, overdue_only=not include_current):
+            ledger = row.ledger
+            yield line([
+                row.enrollment_id,
+                row.student_name,
+                row.student_id or '',
+                row.email or '',
+                row.class_type,
+                row.class_name,
+                row.amount,
+                ledger.enrolled_at.strftime('%Y-%m-%d'),
+                len(ledger.paid),
+                len(ledger.pending),
+                len(ledger.overdue),
+                '; '.join(entry.label for entry in ledger.overdue),
+                '; '.join(entry.label for entry in ledger.pending),
+            ])
+    
+    filename = f"payment_arrears_{class_type or 'all'}_{now.strftime('%Y%m%d_%H%M%S')}.csv"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
 @bp.route('/admin/schools', methods=['GET', 'POST'])
 @login_required
 def admin_schools():
@@ -6030,16 +5713,18 @@ def admin_schools():
         
         if not school_ids:
             flash('Please select at least one school.', 'danger')
-        elif not content and not request.files.get('material_file'):
+        elif not content and not request.files.get('material_file') and not request.form.get('material_file_upload'):
             flash('Please provide content or upload a file.', 'danger')
         else:
             # Process file upload and material creation (reuse logic from admin_dashboard)
-            from ..services.cloudinary_service import CloudinaryService
+            from ..services.direct_upload import receive_upload
+            from ..services.upload_queue import attach_upload, UploadError
             from werkzeug.utils import secure_filename
             import re
             
             material_type = 'text'
             file_url = None
+            material_upload = None
             file_type = None
             file_name = None
             youtube_url = None
@@ -6052,35 +5737,26 @@ def admin_schools():
                 material_type = 'youtube'
             
             # Handle file upload
-            uploaded_file = request.files.get('material_file')
-            if uploaded_file and uploaded_file.filename:
-                file_name = secure_filename(uploaded_file.filename)
+            try:
+                material_upload = receive_upload('material_file', 'learning_material')
+            except UploadError as e:
+                flash(f'File upload failed: {e}', 'warning')
+            if material_upload:
+                file_name = secure_filename(material_upload.filename)
                 file_ext = file_name.lower().split('.')[-1] if '.' in file_name else ''
                 
                 if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg']:
-                    resource_type = 'image'
                     material_type = 'image'
                 elif file_ext in ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'mkv']:
-                    resource_type = 'video'
                     material_type = 'video'
                 elif file_ext in ['pdf']:
-                    resource_type = 'raw'
                     material_type = 'pdf'
                 else:
-                    resource_type = 'raw'
                     material_type = 'text'
                 
-                success, result = CloudinaryService.upload_file(
-                    file=uploaded_file,
-                    folder='learning_materials',
-                    resource_type=resource_type
-                )
-                
-                if success:
-                    file_url = result.get('url')
-                    file_type = result.get('format', file_ext)
-                else:
-                    flash(f'File upload failed: {result}', 'warning')
+                # Direct uploads are already on Cloudinary; queued ones swap every material's file_url in when done
+                file_url = material_upload.url
+                file_type = file_ext
             
             # Share material to each selected school
             try:
@@ -6129,6 +5805,7 @@ def admin_schools():
                                 youtube_url=youtube_url
                             )
                             db.session.add(material)
+                            attach_upload(material_upload and material_upload.pending, material, 'file_url')
                             shared_count += 1
                 
                 db.session.commit()
@@ -6619,13 +6296,13 @@ def upload_profile_picture():
     
     try:
         from ..services.cloudinary_service import CloudinaryService
+        from ..services.storage import get_storage
         from datetime import datetime
         
-        # Upload to Cloudinary
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         public_id = f"profile_{current_user.id}_{timestamp}"
         
-        success, result = CloudinaryService.upload_file(
+        success, result = get_storage().upload_file(
             file=file,
             folder='profile_pictures',
             resource_type='image',
@@ -6715,12 +6392,13 @@ def upload_school_student_profile_picture():
     
     try:
         from ..services.cloudinary_service import CloudinaryService
+        from ..services.storage import get_storage
         from datetime import datetime
         
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         public_id = f"school_student_{student.id}_{timestamp}"
         
-        success, result = CloudinaryService.upload_file(
+        success, result = get_storage().upload_file(
             file=file,
             folder='profile_pictures',
             resource_type='image',
@@ -6826,6 +6504,10 @@ def admin_class_time_settings():
                 flash('Please fill in all required fields.', 'danger')
                 return redirect(url_for('admin.admin_class_time_settings'))
             
+            if not is_valid_timezone(timezone):
+                flash(f'Unknown timezone: {timezone}', 'danger')
+                return redirect(url_for('admin.admin_class_time_settings'))
+            
             if not class_types:
                 flash('Please select at least one class type.', 'danger')
                 return redirect(url_for('admin.admin_class_time_settings'))
@@ -6846,6 +6528,7 @@ def admin_class_time_settings():
                 
                 # Create time slots for each class type, day, and (if applicable) class_id combination
                 created_slots = []
+                new_class_times = []
                 
                 for class_type in class_types:
                     class_type = class_type.strip()
@@ -6899,10 +6582,13 @@ def admin_class_time_settings():
                                 created_by=current_user.id
                             )
                             db.session.add(class_time)
+                            new_class_times.append(class_time)
                             class_name = f" ({GroupClass.query.get(class_id).name})" if class_id and GroupClass.query.get(class_id) else ""
                             created_slots.append(f"{class_type.title()}{class_name} - {day}")
                 
                 if created_slots:
+                    db.session.flush()
+                    rebuild_class_time_windows(class_time.id for class_time in new_class_times)
                     db.session.commit()
                     slots_str = ', '.join(created_slots[:5])  # Show first 5
                     if len(created_slots) > 5:
@@ -6929,8 +6615,9 @@ def admin_class_time_settings():
                         for selection in selections:
                             db.session.delete(selection)
                         
-                        # Now delete the time slot
+                        # Now delete the time slot; its windows go with it
                         db.session.delete(class_time)
+                        live_status_cache.invalidate()
                         db.session.commit()
                         
                         if selection_count > 0:
@@ -6949,6 +6636,8 @@ def admin_class_time_settings():
                 class_time = ClassTime.query.get(time_id)
                 if class_time:
                     class_time.is_active = not class_time.is_active
+                    db.session.flush()
+                    rebuild_class_time_windows([class_time.id])
                     db.session.commit()
                     status = 'activated' if class_time.is_active else 'deactivated'
                     flash(f'Time slot {status} successfully.', 'success')
@@ -6990,10 +6679,18 @@ def admin_class_time_selections():
         return admin_check
     
     # Get all time selections
-    selections = StudentClassTimeSelection.query.order_by(
+    from sqlalchemy.orm import joinedload
+    from ..services.slot_booking import slot_availability
+    selections = StudentClassTimeSelection.query.options(
+        joinedload(StudentClassTimeSelection.user),
+        joinedload(StudentClassTimeSelection.class_time)
+    ).order_by(
         StudentClassTimeSelection.selected_at.desc()
     ).all()
     
+    # Occupancy of every selectable slot, same numbers the student time picker uses
+    availability = slot_availability()
+    
     # Get class times for display with timezone info
     for selection in selections:
         if selection.class_time:
@@ -7019,7 +6716,7 @@ def admin_class_time_selections():
         selection.student_id = selection.user.student_id if selection.user else 'N/A'
         selection.student_country = selection.user.timezone if selection.user and selection.user.timezone else 'Not set'
     
-    return render_template('admin_class_time_selections.html', selections=selections)
+    return render_template('admin_class_time_selections.html', selections=selections, availability=availability)
 
 
 @bp.route('/admin/live-class', methods=['GET', 'POST'])
@@ -7032,7 +6729,6 @@ def admin_live_class():
     
     try:
         from datetime import datetime, date, time as dt_time
-        import pytz
         
         # Get data for dropdowns based on class type
         # Individual: Get all students (users) with individual enrollments
@@ -7453,17 +7149,19 @@ def view_id_card(id_card_id):
         photo_file = request.files.get('photo')
         if photo_file and photo_file.filename:
             try:
-                from ..services.cloudinary_service import CloudinaryService
-                success, result = CloudinaryService.upload_file(photo_file, folder='id_cards', resource_type='image')
-                if success:
-                    photo_url = result.get('url')
-                    id_card.photo_url = photo_url
+                # Uploaded to Cloudinary in the background; both columns get the URL when it finishes
+                from ..services.upload_queue import queue_upload, attach_upload
+                photo_upload = queue_upload(photo_file, folder='id_cards', resource_type='image')
+                photo_url = photo_upload.placeholder
+                id_card.photo_url = photo_url
+                attach_upload(photo_upload, id_card, 'photo_url')
                 
                 # Update user profile picture if applicable
                 if id_card.entity_type in ['individual', 'group']:
                     user = User.query.get(id_card.entity_id)
                     if user:
                         user.profile_picture = photo_url
+                        attach_upload(photo_upload, user, 'profile_picture')
                 elif id_card.entity_type == 'school':
                     school = School.query.get(id_card.entity_id)
                     # TODO: Add school logo field to School model if needed
@@ -7637,3 +7335,20 @@ def admin_payment_settings():
                          money_transfer_receiver=money_transfer_receiver,
                          money_transfer_country=money_transfer_country,
                          money_transfer_phone=money_transfer_phone)
+
+
+@bp.route('/admin/perf')
+@login_required
+def admin_perf():
+    """Worst endpoints by p95 latency and SQL statements per request over the rolling window"""
+    admin_check = require_admin()
+    if admin_check:
+        return admin_check
+
+    from ..services.perf import worst_endpoints, endpoint_stats
+    worst = worst_endpoints()
+    return render_template('admin_perf.html',
+                         by_p95=worst['by_p95'],
+                         by_queries=worst['by_queries'],
+                         window_minutes=endpoint_stats.window_seconds // 60,
+                         slow_request_ms=current_app.config.get('PERF_SLOW_REQUEST_MS', 1000))
@@ -1,8 +1,15 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, redirect, send_file, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
-from ..services.cloudinary_service import cloudinary_service
+from ..models import PendingUpload
+from ..services.direct_upload import complete_upload, sign_upload
+from ..services.resumable_upload import (
+    ChunkError, TooManyUploads, append_chunk, cancel_upload, get_upload, start_upload, upload_state
+)
+from ..services.media import send_stored_file
+from ..services.storage import get_storage, local_storage
+from ..services.upload_queue import UploadError, UploadUnavailable
 
 bp = Blueprint('file_uploads', __name__)
 
@@ -16,7 +23,7 @@ def allowed_file(filename, allowed_extensions=None):
 @login_required
 def upload_file():
     """
-    Handle file uploads to Cloudinary.
+    Handle file uploads to the storage backend (Cloudinary or local disk).
     Expected form data:
     - file: The file to upload
     - folder: (optional) The folder in Cloudinary
@@ -36,8 +43,7 @@ def upload_file():
     folder = request.form.get('folder', 'misc')
     resource_type = request.form.get('resource_type', 'auto')
     
-    # Upload to Cloudinary
-    success, result = cloudinary_service.upload_file(
+    success, result = get_storage().upload_file(
         file=file,
         folder=folder,
         resource_type=resource_type
@@ -55,7 +61,7 @@ def upload_file():
 @login_required
 def delete_file():
     """
-    Delete a file from Cloudinary.
+    Delete a file from the storage backend.
     Expected JSON data:
     {
         "public_id": "folder/filename",
@@ -69,9 +75,132 @@ def delete_file():
     public_id = data['public_id']
     resource_type = data.get('resource_type', 'image')
     
-    success, message = cloudinary_service.delete_file(public_id, resource_type)
+    success, message = get_storage().delete_file(public_id, resource_type)
     
     if success:
         return jsonify({'message': message}), 200
     else:
         return jsonify({'error': message}), 500
+
+@bp.route('/direct-uploads/sign', methods=['POST'])
+def sign_direct_upload():
+    """
+    Signed parameters for uploading one file straight to Cloudinary
+    (see services/direct_upload.py). Expected JSON data:
+    {
+        "purpose": "gallery_image",
+        "filename": "photo.jpg"
+    }
+    Who may sign depends on the purpose, so there is no blanket login check.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        signed = sign_upload(data.get('purpose', ''), data.get('filename', ''))
+    except UploadUnavailable as e:
+        # 503 tells the browser to fall back to a chunked upload through us
+        return jsonify({'error': str(e)}), 503
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(signed), 200
+
+@bp.route('/direct-uploads/complete', methods=['POST'])
+def complete_direct_upload():
+    """
+    Verify a finished direct upload. Expected JSON data:
+    {
+        "ticket": "<ticket from /direct-uploads/sign>",
+        "response": { ...Cloudinary's upload response... }
+    }
+    Returns the token the form submits in place of the file.
+    """
+    data = request.get_json(silent=True) or {}
+    response = data.get('response')
+    if not data.get('ticket') or not isinstance(response, dict):
+        return jsonify({'error': 'Missing ticket or response'}), 400
+    try:
+        token, url = complete_upload(data['ticket'], response)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'token': token, 'url': url}), 200
+
+@bp.route('/resumable-uploads', methods=['POST'])
+def create_resumable_upload():
+    """
+    Open a chunked upload (see services/resumable_upload.py). Expected JSON data:
+    {
+        "purpose": "course_video",
+        "filename": "lesson.mp4",
+        "size": 734003200
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+    try:
+        upload = start_upload(data.get('purpose', ''), data.get('filename', ''), size)
+    except UploadUnavailable as e:
+        # 503 tells the browser to fall back to posting the file with the form
+        return jsonify({'error': str(e)}), 503
+    except TooManyUploads as e:
+        return jsonify({'error': str(e)}), 429
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(upload_state(upload)), 201
+
+@bp.route('/resumable-uploads/<token>', methods=['GET', 'PATCH', 'DELETE'])
+def resumable_upload(token):
+    """
+    GET reports the offset to resume from. PATCH appends the raw request body
+    at the offset given in the Upload-Offset header; a 409 carries the
+    offset to retry from. DELETE abandons the upload.
+    """
+    upload = get_upload(token)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    try:
+        if request.method == 'PATCH':
+            offset = request.headers.get('Upload-Offset', type=int)
+            if offset is None:
+                return jsonify({'error': 'Missing Upload-Offset header', 'offset': upload.received}), 400
+            append_chunk(upload, offset, request.stream, request.content_length)
+        elif request.method == 'DELETE':
+            cancel_upload(upload)
+            return jsonify({'message': 'Upload cancelled'}), 200
+    except ChunkError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), 409
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(upload_state(upload)), 200
+
+@bp.route('/uploads/<token>')
+def pending_upload(token):
+    """
+    Stand-in URL for a queued upload (see services/upload_queue.py): serves
+    the spooled file until the upload finishes, then redirects to Cloudinary.
+    No login, like the Cloudinary URL it replaces; the token is unguessable.
+    """
+    upload = PendingUpload.query.filter_by(token=token).first_or_404()
+    if upload.status == 'done' and upload.url:
+        response = redirect(upload.url)
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        return response
+    if not os.path.exists(upload.spool_path):
+        abort(404)
+    return send_file(upload.spool_path, download_name=upload.filename or None, conditional=True, max_age=0)
+
+@bp.route('/media/<path:key>')
+def media(key):
+    """
+    Files kept by the local storage backend (see services/storage.py).
+    No login, like the Cloudinary URLs they stand in for; keys are content
+    hashes. Blobs never change, so browsers may cache them for good.
+    """
+    stored = local_storage().stat(key)
+    if stored is None:
+        abort(404)
+    response = send_stored_file(stored, max_age=365 * 24 * 3600)
+    response.cache_control.immutable = True
+    return response
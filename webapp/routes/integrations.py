@@ -5,6 +5,8 @@ from flask import Blueprint, current_app, render_template, request, redirect, ur
 from flask_login import login_required, current_user
 import requests
 
+from ..services.perf import track
+
 bp = Blueprint('integrations', __name__)
 
 
@@ -52,7 +54,8 @@ def ai_assistant():
                 ],
                 'temperature': 0.7,
             }
-            resp = requests.post(api_url, headers=headers, data=json.dumps(data))
+            with track('http'):
+                resp = requests.post(api_url, headers=headers, data=json.dumps(data))
             resp.raise_for_status()
             answer = resp.json()['choices'][0]['message']['content']
             return render_template('ai_assistant.html', answer=answer, question=question)
@@ -113,7 +116,8 @@ def debug_whatsapp():
         debug_results.append(f'URL: {url}')
 
         try:
-            r = requests.post(url, headers=headers, json=payload, timeout=20)
+            with track('http'):
+                r = requests.post(url, headers=headers, json=payload, timeout=20)
             debug_results.append(f'Status: {r.status_code}')
             try:
                 debug_results.append(f'Response: {r.json()}')
@@ -2,7 +2,9 @@ import os
 from flask import Blueprint, current_app, render_template, redirect, url_for, send_from_directory, jsonify, request, flash, session
 from flask_login import login_required, current_user
 from ..services.mailer import send_bulk_email
-from ..models import HomeGallery, StudentVictory, StudentProject, ClassPricing, ClassTime, StudentClassTimeSelection, ClassEnrollment
+from ..services.homepage_cache import get_home_sections
+from ..services.slot_booking import book_class_time
+from ..models import ClassPricing, ClassTime, StudentClassTimeSelection, ClassEnrollment
 from ..routes.admin import require_id_card_viewed
 
 bp = Blueprint('main', __name__)
@@ -74,106 +76,13 @@ def index():
         if registered_school_student:
             return redirect(url_for('schools.school_student_dashboard'))
     
-    # Initialize empty lists for graceful degradation if tables don't exist
-    gallery_images = []
-    gallery_videos = []
-    featured_images = []
-    featured_videos = []
-    victories = []
-    featured_victories = []
-    projects_with_images = []
-    projects_with_videos = []
-    
-    try:
-        db.session.rollback()  # Ensure clean transaction state
-        # Get gallery images (from admin + student projects)
-        gallery_images = HomeGallery.query.filter_by(
-            is_active=True, 
-            media_type='image'
-        ).order_by(HomeGallery.display_order.asc(), HomeGallery.created_at.desc()).limit(12).all()
-        
-        # Get gallery videos
-        gallery_videos = HomeGallery.query.filter_by(
-            is_active=True, 
-            media_type='video'
-        ).order_by(HomeGallery.display_order.asc(), HomeGallery.created_at.desc()).limit(8).all()
-        
-        # Get featured items
-        featured_images = HomeGallery.query.filter_by(
-            is_active=True, 
-            media_type='image',
-            is_featured=True
-        ).limit(6).all()
-        
-        featured_videos = HomeGallery.query.filter_by(
-            is_active=True, 
-            media_type='video',
-            is_featured=True
-        ).limit(4).all()
-    except Exception as e:
-        # Table doesn't exist yet, rollback and continue with empty lists
-        db.session.rollback()
-        current_app.logger.warning(f"HomeGallery table may not exist: {e}")
-    
-    victories = []
-    featured_victories = []
+    # Gallery, videos and victories are identical for every visitor - served as cached fragments
     try:
-        # Get student victories - handle missing profile_picture column gracefully
-        from sqlalchemy.exc import ProgrammingError
-        try:
-            victories = StudentVictory.query.filter_by(is_active=True).order_by(
-                StudentVictory.display_order.asc(),
-                StudentVictory.achievement_date.desc()
-            ).limit(6).all()
-            
-            featured_victories = StudentVictory.query.filter_by(
-                is_active=True,
-                is_featured=True
-            ).limit(3).all()
-            
-            # Pre-load student relationships to catch errors early, but handle gracefully
-            for victory in victories + featured_victories:
-                try:
-                    # Try to access student to trigger lazy load and catch error early
-                    if hasattr(victory, 'student_id') and victory.student_id:
-                        _ = victory.student  # Trigger lazy load
-                except ProgrammingError as pe:
-                    if 'profile_picture' in str(pe):
-                        # Mark that student can't be loaded due to missing column
-                        victory._student_load_error = True
-                        current_app.logger.warning(f"profile_picture column missing for victory {victory.id}. Please run migration: /admin/add-profile-picture-column")
-        except ProgrammingError as pe:
-            # Check if it's the profile_picture column error
-            if 'profile_picture' in str(pe):
-                current_app.logger.warning("profile_picture column missing. Please run migration: /admin/add-profile-picture-column")
-                victories = []
-                featured_victories = []
-            else:
-                raise  # Re-raise if it's a different error
+        home_sections = get_home_sections()
     except Exception as e:
-        # Table doesn't exist yet, or other error, rollback and continue with empty lists
         db.session.rollback()
-        current_app.logger.warning(f"StudentVictory query error: {e}")
-        victories = []
-        featured_victories = []
-    
-    try:
-        # Also get projects with images/videos that aren't in gallery yet (fallback)
-        projects_with_images = StudentProject.query.filter(
-            StudentProject.is_active == True,
-            StudentProject.image_url.isnot(None),
-            StudentProject.image_url != ''
-        ).order_by(StudentProject.created_at.desc()).limit(12).all()
-        
-        projects_with_videos = StudentProject.query.filter(
-            StudentProject.is_active == True,
-            StudentProject.youtube_url.isnot(None),
-            StudentProject.youtube_url != ''
-        ).order_by(StudentProject.created_at.desc()).limit(8).all()
-    except Exception as e:
-        # Rollback and continue with empty lists
-        db.session.rollback()
-        current_app.logger.warning(f"Error fetching student projects: {e}")
+        current_app.logger.warning(f"Could not render homepage sections: {e}")
+        home_sections = {'gallery': '', 'videos': '', 'victories': ''}
     
     # Get class pricing - with rollback to clear any failed transactions
     try:
@@ -193,14 +102,7 @@ def index():
         contact_email = 'info@buxin.com'
     
     return render_template('index.html',
-        gallery_images=gallery_images,
-        gallery_videos=gallery_videos,
-        featured_images=featured_images,
-        featured_videos=featured_videos,
-        victories=victories,
-        featured_victories=featured_victories,
-        projects_with_images=projects_with_images,
-        projects_with_videos=projects_with_videos,
+        home_sections=home_sections,
         pricing_data=pricing_data,
         whatsapp_number=whatsapp_number,
         contact_email=contact_email,
@@ -501,70 +403,22 @@ def select_class_time():
     # Get student's timezone for display
     student_timezone = user.timezone if user.timezone else 'Asia/Kolkata'
     
-    # Check if student already has this exact time slot selected
-    existing_same_selection = StudentClassTimeSelection.query.filter_by(
-        enrollment_id=enrollment.id,
-        class_time_id=time_id
-    ).first()
-    
-    if existing_same_selection:
-        flash('You have already selected this time slot.', 'info')
-        return redirect(request.referrer or url_for('admin.student_dashboard'))
-    
-    # Check how many time slots the student has already selected for this enrollment
-    existing_selections = StudentClassTimeSelection.query.filter_by(
-        enrollment_id=enrollment.id
-    ).all()
-    
-    # Individual and Family classes allow maximum 2 time slots
-    if len(existing_selections) >= 2:
-        flash('You have already selected 2 time slots. Please remove one before selecting a new time.', 'warning')
-        return redirect(request.referrer or url_for('admin.student_dashboard'))
-    
-    # Check if this time slot is already booked by ANY student
-    # Individual and Family classes share the same time pool - once selected, it's unavailable for all
-    existing_booking = StudentClassTimeSelection.query.filter_by(
-        class_time_id=time_id
-    ).first()
-    
-    if existing_booking:
-        # Time slot is already taken - unavailable for everyone
-        flash(f'This time slot is already booked by another student. Please select a different time.', 'warning')
+    # Duplicate, 2-slot limit, capacity and shared-group checks happen inside one
+    # transaction against the claim table, so parallel bookings cannot double-book
+    try:
+        result = book_class_time(user_id, enrollment, class_time)
+        if result.error:
+            db.session.rollback()
+            flash(result.error, 'warning')
+            return redirect(request.referrer or url_for('admin.student_dashboard'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Time slot booking failed: {e}")
+        flash('This time slot could not be booked right now. Please try again.', 'warning')
         return redirect(request.referrer or url_for('admin.student_dashboard'))
     
-    # Also check shared slots - if any slot in the shared group is booked, all are unavailable
-    if class_time.shared_slot_group_id:
-        # Find all time slots in the same shared group
-        shared_slots = ClassTime.query.filter_by(
-            shared_slot_group_id=class_time.shared_slot_group_id,
-            day=class_time.day,
-            start_time=class_time.start_time,
-            end_time=class_time.end_time
-        ).all()
-        
-        # Check if any of the shared slots are already booked by ANY student
-        for shared_slot in shared_slots:
-            existing_booking = StudentClassTimeSelection.query.filter_by(
-                class_time_id=shared_slot.id
-            ).first()
-            
-            if existing_booking:
-                # Any slot in the shared group is booked - all are unavailable
-                flash(f'This time slot is already booked by another student. Please select a different time.', 'warning')
-                return redirect(request.referrer or url_for('admin.student_dashboard'))
-    
-    # Create new selection (student has less than 2 selections)
-    selection = StudentClassTimeSelection(
-        user_id=user_id,
-        enrollment_id=enrollment.id,
-        class_time_id=time_id,
-        class_type=class_time.class_type
-    )
-    db.session.add(selection)
-    db.session.commit()
-    
-    selection_count = len(existing_selections) + 1
-    flash(f'Time selected ({selection_count} of 2): {class_time.get_full_display(student_timezone)}', 'success')
+    flash(f'Time selected ({result.selection_count} of 2): {class_time.get_full_display(student_timezone)}', 'success')
     
     return redirect(request.referrer or url_for('admin.student_dashboard'))
 
@@ -635,10 +489,8 @@ def update_timezone():
         return redirect(request.referrer or url_for('admin.student_dashboard'))
     
     # Validate timezone
-    try:
-        import pytz
-        pytz.timezone(timezone)  # Will raise exception if invalid
-    except Exception:
+    from ..services.timezones import is_valid_timezone
+    if not is_valid_timezone(timezone):
         flash('Invalid timezone selected.', 'danger')
         return redirect(request.referrer or url_for('admin.student_dashboard'))
     
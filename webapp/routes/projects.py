@@ -7,6 +7,7 @@ from werkzeug.utils import secure_filename
 from ..extensions import db
 from ..models import User, RoboticsProjectSubmission
 from ..services.mailer import send_bulk_email
+from ..services.upload_queue import queue_upload, attach_upload
 
 bp = Blueprint('projects', __name__)
 
@@ -42,6 +43,7 @@ def submit_robotics_project():
 
         # Handle file uploads to Cloudinary if available
         uploaded_files = []
+        file_uploads = []
         project_files = request.files.getlist('project_files')
 
         for file in project_files:
@@ -59,39 +61,22 @@ def submit_robotics_project():
                 flash(f'File {file.filename} has an unsupported format. Allowed: {", ".join(allowed_extensions)}', 'warning')
                 continue
             try:
-                # Attempt Cloudinary upload if library is available
-                try:
-                    import cloudinary.uploader as uploader
-                except Exception:
-                    uploader = None
-                if uploader:
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    safe_filename = secure_filename(file.filename).replace('.', '_')
-                    public_id = f"robotics_project_{timestamp}_{safe_filename}"
-                    resource_type = 'image' if file_extension in ['jpg', 'jpeg', 'png'] else 'raw'
-                    result = uploader.upload(
-                        file,
-                        resource_type=resource_type,
-                        public_id=public_id,
-                        folder='robotics_projects',
-                        overwrite=True,
-                    )
-                    uploaded_files.append({
-                        'filename': file.filename,
-                        'url': result.get('secure_url'),
-                        'public_id': result.get('public_id'),
-                        'size': file_size,
-                        'type': file_extension,
-                    })
-                else:
-                    # Fallback: no upload, only record name/size
-                    uploaded_files.append({
-                        'filename': file.filename,
-                        'url': None,
-                        'public_id': None,
-                        'size': file_size,
-                        'type': file_extension,
-                    })
+                # Spooled now and uploaded to Cloudinary in the background; the URL in
+                # uploaded_files is a placeholder until then
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                safe_filename = secure_filename(file.filename).replace('.', '_')
+                public_id = f"robotics_project_{timestamp}_{safe_filename}"
+                resource_type = 'image' if file_extension in ['jpg', 'jpeg', 'png'] else 'raw'
+                upload = queue_upload(file, folder='robotics_projects', resource_type=resource_type,
+                                      public_id=public_id)
+                file_uploads.append(upload)
+                uploaded_files.append({
+                    'filename': file.filename,
+                    'url': upload.placeholder,
+                    'public_id': None,
+                    'size': file_size,
+                    'type': file_extension,
+                })
             except Exception as e:
                 print(f"Failed to upload {file.filename}: {e}")
                 flash(f'Failed to upload {file.filename}. Please try again.', 'warning')
@@ -113,6 +98,8 @@ def submit_robotics_project():
             uploaded_files=json.dumps(uploaded_files) if uploaded_files else None,
         )
         db.session.add(submission)
+        for upload in file_uploads:
+            attach_upload(upload, submission, 'uploaded_files')
         db.session.commit()
 
         # Confirmation email to submitter (best-effort)
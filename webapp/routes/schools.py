@@ -105,13 +105,8 @@ def register_school(class_id=None):
             
             db.session.flush()  # Get user.id
             
-            # Generate School System ID
-            from ..models.schools import generate_school_id
-            school_system_id = generate_school_id()
-            
             # Create school record (allow same school name and email for different classes)
             school = School(
-                school_system_id=school_system_id,
                 school_name=school_name,
                 school_email=school_email,
                 contact_phone=contact_phone,
@@ -123,7 +118,9 @@ def register_school(class_id=None):
                 status='pending',
                 payment_status='pending'
             )
-            db.session.add(school)
+            # Generate School System ID; the unique constraint settles concurrent registrations
+            from ..models.schools import add_school_with_system_id
+            school_system_id = add_school_with_system_id(school)
             db.session.commit()
             
             # Store data in session for payment flow
@@ -196,25 +193,23 @@ def school_payment():
         # Handle payment proof upload
         payment_method = request.form.get('payment_method', '')
         payment_proof_url = None
+        proof_upload = None
+        from ..services.direct_upload import receive_upload
+        from ..services.upload_queue import attach_upload
         
-        if 'payment_proof' in request.files:
-            file = request.files['payment_proof']
-            if file and file.filename:
-                from ..services.cloudinary_service import CloudinaryService
-                try:
-                    success, result = CloudinaryService.upload_file(
-                        file=file, 
-                        folder='payment_proofs',
-                        resource_type='auto'
-                    )
-                    if success and isinstance(result, dict) and result.get('url'):
-                        payment_proof_url = result['url']
-                except Exception as e:
-                    flash(f'Error uploading payment proof: {str(e)}', 'warning')
+        # Uploaded by the browser, or to Cloudinary in the background after commit
+        try:
+            received = receive_upload('payment_proof', 'payment_proof')
+            if received:
+                payment_proof_url = received.url
+                proof_upload = received.pending
+        except Exception as e:
+            flash(f'Error uploading payment proof: {str(e)}', 'warning')
         
         # Update school payment status
         school.payment_status = 'completed' if payment_proof_url else 'pending'
         school.payment_proof = payment_proof_url
+        attach_upload(proof_upload, school, 'payment_proof')
         
         # CRITICAL FIX: Always create enrollment record to link school to class
         # This is required for admin material sharing and school dashboard to work
@@ -233,6 +228,7 @@ def school_payment():
                     enrollment.payment_method = payment_method
                     enrollment.payment_proof = payment_proof_url
                     enrollment.amount = amount
+                    attach_upload(proof_upload, enrollment, 'payment_proof')
                 class_id = None  # Don't create new enrollment
             else:
                 # No enrollments exist - try to get class_id from form or URL
@@ -274,11 +270,13 @@ def school_payment():
                         status='pending'  # Will be set to 'completed' when admin approves the school
                     )
                     db.session.add(enrollment)
+                    attach_upload(proof_upload, enrollment, 'payment_proof')
                 else:
                     # Update existing enrollment with payment info
                     existing_enrollment.payment_method = payment_method
                     existing_enrollment.payment_proof = payment_proof_url
                     existing_enrollment.amount = amount
+                    attach_upload(proof_upload, existing_enrollment, 'payment_proof')
         
         db.session.commit()
         
@@ -489,18 +487,15 @@ def register_student_in_school():
         
         # Handle image upload
         student_image_url = None
+        image_upload = None
+        from ..services.upload_queue import queue_upload, attach_upload
         if 'student_image' in request.files:
             image_file = request.files['student_image']
             if image_file and image_file.filename:
-                from ..services.cloudinary_service import CloudinaryService
+                # Uploaded to Cloudinary in the background after commit
                 try:
-                    success, result = CloudinaryService.upload_file(
-                        file=image_file, 
-                        folder='student_photos',
-                        resource_type='auto'
-                    )
-                    if success and isinstance(result, dict) and result.get('url'):
-                        student_image_url = result['url']
+                    image_upload = queue_upload(image_file, folder='student_photos', resource_type='auto')
+                    student_image_url = image_upload.placeholder
                 except Exception as e:
                     flash(f'Error uploading image: {str(e)}', 'warning')
         
@@ -522,11 +517,13 @@ def register_student_in_school():
         )
         db.session.add(student)
         db.session.flush()  # Get ID without committing
+        attach_upload(image_upload, student, 'student_image_url')
         
         # Generate ID Card for the school student
         try:
             from ..models.id_cards import generate_school_student_id_card
             id_card = generate_school_student_id_card(student, school, current_user.id)
+            attach_upload(image_upload, id_card, 'photo_url')
             db.session.commit()
             flash(f'Student "{student_name}" registered successfully! Student System ID: {student_system_id}. ID Card generated.', 'success')
         except Exception as e:
@@ -882,48 +879,32 @@ def school_student_dashboard():
     
     attendance_records = {}
     monthly_stats = {}
+    today_attendance = {}
     
-    for cls in enrolled_classes:
-        # Get attendance for this student in this class
-        # Note: Attendance uses school admin's user_id as proxy, but we check notes field
-        from ..models.users import User
-        school = User.query.get(student.registered_by)
-        if school:
-            attendance = Attendance.query.filter(
-                Attendance.student_id == school.id,
-                Attendance.class_id == cls['id'],
-                Attendance.class_type == 'school',
-                Attendance.attendance_date >= month_start,
-                Attendance.attendance_date <= month_end,
-                Attendance.notes.like(f'%school_student_{student.id}%')
-            ).order_by(Attendance.attendance_date.desc()).all()
-            
-            attendance_records[cls['id']] = attendance
-            
-            # Calculate monthly stats
-            total_days = monthrange(today.year, today.month)[1]
-            present_days = len([a for a in attendance if a.status == 'present'])
-            percentage = (present_days / total_days * 100) if total_days > 0 else 0
-            monthly_stats[cls['id']] = {
-                'present': present_days,
-                'total': total_days,
-                'percentage': round(percentage, 1)
-            }
+    # Attendance rows are keyed by the SchoolStudent record of each class, so one
+    # indexed query covers the whole month for every class
+    record_ids = {cls['student_record'].id for cls in enrolled_classes}
+    month_rows = Attendance.query.filter(
+        Attendance.school_student_id.in_(record_ids),
+        Attendance.attendance_date >= month_start,
+        Attendance.attendance_date <= month_end
+    ).order_by(Attendance.attendance_date.desc()).all() if record_ids else []
     
-    # Get today's attendance
-    today_attendance = {}
+    total_days = monthrange(today.year, today.month)[1]
     for cls in enrolled_classes:
-        from ..models.users import User
-        school = User.query.get(student.registered_by)
-        if school:
-            att = Attendance.query.filter(
-                Attendance.student_id == school.id,
-                Attendance.class_id == cls['id'],
-                Attendance.class_type == 'school',
-                Attendance.attendance_date == today,
-                Attendance.notes.like(f'%school_student_{student.id}%')
-            ).first()
-            today_attendance[cls['id']] = att
+        record_id = cls['student_record'].id
+        attendance = [a for a in month_rows if a.school_student_id == record_id and a.class_id == cls['id']]
+        attendance_records[cls['id']] = attendance
+        today_attendance[cls['id']] = next((a for a in attendance if a.attendance_date == today), None)
+        
+        # Calculate monthly stats
+        present_days = len([a for a in attendance if a.status == 'present'])
+        percentage = (present_days / total_days * 100) if total_days > 0 else 0
+        monthly_stats[cls['id']] = {
+            'present': present_days,
+            'total': total_days,
+            'percentage': round(percentage, 1)
+        }
     
     # Get projects count (school students don't have User accounts, so count is 0 for now)
     # In the future, if projects are linked to school students, update this logic
@@ -932,63 +913,44 @@ def school_student_dashboard():
     # Live Class Logic - Check if current time matches class time for school students
     active_live_class = None
     from ..models.classes import ClassTime
-    import pytz
-    from datetime import datetime, time as dt_time
+    from ..services.class_schedule import live_class_time_ids
     
     # Get student's timezone (default to India if not set - school students don't have timezone preference yet)
     # In future, we can add timezone to SchoolStudent model or get from school admin
     student_timezone = 'Asia/Kolkata'  # Default timezone for school students
     
-    # Get current time in student's timezone
-    student_tz = pytz.timezone(student_timezone)
-    current_datetime = datetime.now(student_tz)
-    current_time = current_datetime.time()
-    current_day = current_datetime.strftime('%A')  # Monday, Tuesday, etc.
+    # Fixed school times, and which of them are in progress according to the precomputed UTC windows
+    fixed_times = ClassTime.query.filter_by(
+        class_type='school',
+        is_active=True
+    ).order_by(ClassTime.day, ClassTime.start_time).all() if enrolled_classes else []
+    try:
+        live_ids = live_class_time_ids(class_time.id for class_time in fixed_times)
+    except Exception:
+        live_ids = set()  # If the schedule can't be read, show no live class
     
     # Check each enrolled class for active live class
     for cls in enrolled_classes:
+        if active_live_class:
+            break
         enrollment = cls['enrollment']
-        class_type = 'school'  # School students are always in school classes
         
-        # Get fixed times for school class
-        fixed_times = ClassTime.query.filter_by(
-            class_type='school',
-            is_active=True
-        ).order_by(ClassTime.day, ClassTime.start_time).all()
-        
-        # Check if any fixed time matches current time for THIS specific class
+        # Check if any fixed time is live for THIS specific class
         for class_time in fixed_times:
             # Check if this time slot applies to this class
             # class_time.class_id can be None (general) or specific to a class
             if class_time.class_id is not None and class_time.class_id != cls['id']:
                 continue  # Skip if time slot is for a different class
             
-            try:
-                admin_tz = pytz.timezone(class_time.timezone)
-                today = current_datetime.date()
-                start_dt = admin_tz.localize(datetime.combine(today, class_time.start_time))
-                end_dt = admin_tz.localize(datetime.combine(today, class_time.end_time))
-                
-                start_dt_student = start_dt.astimezone(student_tz)
-                end_dt_student = end_dt.astimezone(student_tz)
-                
-                student_start_time = start_dt_student.time()
-                student_end_time = end_dt_student.time()
-                student_day = start_dt_student.strftime('%A')
-                
-                # Check if current day and time match
-                if (current_day == student_day and 
-                    student_start_time <= current_time <= student_end_time):
-                    class_obj = GroupClass.query.get(enrollment.class_id)
-                    if class_obj:
-                        active_live_class = {
-                            'enrollment': enrollment,
-                            'class_time': class_time,
-                            'class': class_obj
-                        }
-                        break  # Only one live class at a time
-            except Exception:
-                pass  # If conversion fails, skip
+            if class_time.id in live_ids:
+                class_obj = GroupClass.query.get(enrollment.class_id)
+                if class_obj:
+                    active_live_class = {
+                        'enrollment': enrollment,
+                        'class_time': class_time,
+                        'class': class_obj
+                    }
+                    break  # Only one live class at a time
     
     # Get ID card for school student
     from ..routes.admin import get_id_card_for_entity
@@ -1008,6 +970,30 @@ def school_student_dashboard():
                          id_card=student_id_card)
 
 
+@bp.route('/school-student/live-class-status')
+def school_student_live_class_status():
+    """Active live class for the session's school student, for dashboard polling"""
+    from flask import jsonify
+    from ..models.classes import SchoolStudent, ClassEnrollment
+    from ..routes.admin import live_status_response
+    from ..services.live_status import live_class_status
+    
+    student = SchoolStudent.query.get(session['school_student_id']) if 'school_student_id' in session else None
+    if not student:
+        return jsonify({'error': 'Not signed in'}), 401
+    
+    enrollment_ids = [row.enrollment_id for row in SchoolStudent.query.filter_by(
+        student_system_id=student.student_system_id,
+        school_name=student.school_name
+    ).all()]
+    enrollments = ClassEnrollment.query.filter(
+        ClassEnrollment.id.in_(enrollment_ids),
+        ClassEnrollment.status == 'completed'
+    ).order_by(ClassEnrollment.id).all() if enrollment_ids else []
+    # Same default timezone and type-wide school slots as school_student_dashboard
+    return live_status_response(live_class_status(enrollments, 'Asia/Kolkata', include_general=True))
+
+
 @bp.route('/school-student/logout')
 def school_student_logout():
     """Logout school student"""
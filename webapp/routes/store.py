@@ -1,5 +1,4 @@
-import os
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, send_from_directory
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, abort
 from flask_login import login_required, current_user
 
 from ..extensions import db
@@ -12,6 +11,8 @@ from ..models import (
     IndividualClass,
     GroupClass,
 )
+from ..services.media import grant_media, has_media_grant, send_stored_file
+from ..services.storage import list_files, stat_file, upload_path
 
 bp = Blueprint('store', __name__)
 
@@ -370,7 +371,6 @@ def register_class(class_type, class_id):
             address = request.form.get('address', '').strip()
         
         payment_method = request.form.get('payment_method', '').strip()
-        payment_proof = request.files.get('payment_proof')
         
         # Validate required fields
         if not payment_method:
@@ -458,9 +458,14 @@ def register_class(class_type, class_id):
                 if not user.class_type:
                     user.class_type = class_type
             
-            # Handle payment proof upload (REQUIRED - uploads to Cloudinary)
-            if not payment_proof or not payment_proof.filename:
-                flash('Payment receipt upload is required. Please upload your payment proof.', 'danger')
+            # Payment proof (REQUIRED): uploaded by the browser, or queued for Cloudinary after commit
+            from ..services.direct_upload import receive_upload
+            from ..services.upload_queue import attach_upload
+            try:
+                proof_upload = receive_upload('payment_proof', 'payment_proof')
+            except Exception as e:
+                current_app.logger.error(f"Payment proof upload failed: {e}")
+                flash('Failed to upload payment receipt. Please try again.', 'danger')
                 return render_template('register_class.html',
                     class_obj=class_obj,
                     class_type=class_type,
@@ -475,23 +480,8 @@ def register_class(class_type, class_id):
                     payment_methods=payment_methods
                 )
             
-            # Upload payment proof to Cloudinary (REQUIRED)
-            payment_proof_url = None
-            from ..services.cloudinary_service import CloudinaryService
-            try:
-                success, result = CloudinaryService.upload_file(
-                    file=payment_proof, 
-                    folder='payment_proofs',
-                    resource_type='auto'
-                )
-                if success and isinstance(result, dict) and result.get('url'):
-                    payment_proof_url = result['url']
-                else:
-                    error_msg = result if isinstance(result, str) else "Cloudinary upload returned no URL"
-                    raise Exception(error_msg)
-            except Exception as e:
-                current_app.logger.error(f"Payment proof upload failed: {e}")
-                flash('Failed to upload payment receipt. Please try again.', 'danger')
+            if proof_upload is None:
+                flash('Payment receipt upload is required. Please upload your payment proof.', 'danger')
                 return render_template('register_class.html',
                     class_obj=class_obj,
                     class_type=class_type,
@@ -532,13 +522,34 @@ def register_class(class_type, class_id):
                             payment_methods=payment_methods
                         )
                     raise
-            elif class_type == 'group':
-                from ..models.classes import generate_group_system_id
+            
+            # Create enrollment record
+            enrollment = ClassEnrollment(
+                user_id=user.id,
+                class_type=class_type,
+                class_id=class_id,
+                amount=amount,
+                customer_name=full_name,
+                customer_email=email,
+                customer_phone=phone,
+                customer_address=address,
+                payment_method=payment_method,
+                payment_proof=proof_upload.url,
+                status='pending',  # Pending until admin approval
+                family_system_id=family_system_id,
+                group_system_id=group_system_id
+            )
+            db.session.add(enrollment)
+            attach_upload(proof_upload.pending, enrollment, 'payment_proof')
+            if class_type == 'group':
+                from ..models.classes import assign_group_system_id
                 try:
-                    group_system_id = generate_group_system_id()
+                    # Flushes the enrollment; a GRO ID a concurrent registration took is replaced and retried
+                    assign_group_system_id(enrollment)
                 except Exception as e:
                     # Handle case where group_system_id column doesn't exist yet
                     if 'group_system_id' in str(e).lower() or 'column' in str(e).lower():
+                        db.session.rollback()
                         flash('Database migration required. Please contact administrator.', 'warning')
                         return render_template('register_class.html',
                             class_obj=class_obj,
@@ -555,23 +566,6 @@ def register_class(class_type, class_id):
                         )
                     raise
             
-            # Create enrollment record
-            enrollment = ClassEnrollment(
-                user_id=user.id,
-                class_type=class_type,
-                class_id=class_id,
-                amount=amount,
-                customer_name=full_name,
-                customer_email=email,
-                customer_phone=phone,
-                customer_address=address,
-                payment_method=payment_method,
-                payment_proof=payment_proof_url,
-                status='pending',  # Pending until admin approval
-                family_system_id=family_system_id,
-                group_system_id=group_system_id
-            )
-            db.session.add(enrollment)
             db.session.flush()  # Get enrollment.id without committing
             enrollment_id = enrollment.id
             db.session.commit()
@@ -826,7 +820,8 @@ def learn_course(course_id):
         'videos_with_missing_files': 0,
     }
 
-    video_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos')
+    # One listing for every video instead of a stat per video; reused until the folder changes
+    local_video_files = list_files(upload_path('videos'))
 
     for video in videos:
         playback_url = None
@@ -840,8 +835,7 @@ def learn_course(course_id):
             available = True
             debug_info['cloudinary_videos'] += 1
         elif getattr(video, 'video_filename', None):
-            video_path = os.path.join(video_folder, video.video_filename)
-            file_exists = os.path.exists(video_path)
+            file_exists = video.video_filename in local_video_files
             if file_exists:
                 playback_url = url_for('store.course_video', filename=video.video_filename)
                 source_type = 'local'
@@ -902,25 +896,56 @@ def learn_course(course_id):
     return render_template('learn_course.html', **context)
 
 
+def _may_fetch(folder, filename):
+    """Whether the current user may fetch a course video or material file"""
+    if getattr(current_user, 'is_admin', False):
+        return True
+    if folder == 'videos':
+        rows = db.session.query(CourseVideo.course_id, CourseVideo.is_preview).filter_by(video_filename=filename).all()
+        if any(is_preview for _, is_preview in rows):
+            return True
+        course_ids = {course_id for course_id, _ in rows}
+    else:
+        course_ids = {course_id for (course_id,) in
+                      db.session.query(CourseMaterial.course_id).filter_by(filename=filename)}
+    if not course_ids:
+        return False
+    return db.session.query(Purchase.id).filter(
+        Purchase.user_id == current_user.id,
+        Purchase.course_id.in_(course_ids),
+        Purchase.status == 'completed',
+    ).first() is not None
+
+
+def _send_course_file(folder, filename):
+    # Instead of login_required: a player's follow-up range requests are let
+    # through on the session's grant without loading the user
+    key = f'{folder}/{filename}'
+    if not has_media_grant(key):
+        if not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+        if not _may_fetch(folder, filename):
+            abort(403)
+        grant_media(key)
+    stored = stat_file(upload_path(folder), filename)
+    if stored is None:
+        abort(404)
+    return send_stored_file(stored, private=True)
+
+
 @bp.route('/course_video/<filename>')
-@login_required
 def course_video(filename):
-    video_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos')
-    return send_from_directory(video_dir, filename)
+    return _send_course_file('videos', filename)
 
 
 @bp.route('/course_video_bypass/<filename>')
-@login_required
 def course_video_bypass(filename):
-    video_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos')
-    return send_from_directory(video_dir, filename)
+    return _send_course_file('videos', filename)
 
 
 @bp.route('/course_material/<filename>')
-@login_required
 def course_material(filename):
-    material_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'materials')
-    return send_from_directory(material_dir, filename)
+    return _send_course_file('materials', filename)
 
 
 @bp.route('/admin/fix-course-images')
@@ -1076,6 +1101,50 @@ def admin_courses():
 
 
 
+@bp.route('/admin/add_video_to_course', methods=['POST'])
+@login_required
+def add_video_to_course():
+    """Add a lesson video; the browser uploads the file straight to Cloudinary"""
+    if not getattr(current_user, 'is_admin', False):
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.health'))
+
+    from werkzeug.utils import secure_filename
+    from ..services.direct_upload import receive_upload
+    from ..services.upload_queue import attach_upload, UploadError
+
+    course = Course.query.get_or_404(request.form.get('course_id', 0, type=int))
+    back = request.referrer or url_for('store.admin_courses')
+    title = request.form.get('video_title', '').strip()
+    if not title:
+        flash('Video title is required.', 'danger')
+        return redirect(back)
+
+    try:
+        video_upload = receive_upload('video_file', 'course_video')
+    except UploadError as e:
+        flash(f'Upload failed: {e}', 'danger')
+        return redirect(back)
+    if video_upload is None:
+        flash('Please choose a video file.', 'danger')
+        return redirect(back)
+
+    last_order = db.session.query(db.func.max(CourseVideo.order_index)).filter_by(course_id=course.id).scalar() or 0
+    video = CourseVideo(
+        course_id=course.id,
+        title=title,
+        video_filename=secure_filename(video_upload.filename) or 'video',
+        video_url=video_upload.url,
+        duration=request.form.get('video_duration', '').strip() or None,
+        order_index=last_order + 1,
+    )
+    db.session.add(video)
+    attach_upload(video_upload.pending, video, 'video_url')
+    db.session.commit()
+    flash(f'Video "{title}" added to {course.title}.', 'success')
+    return redirect(back)
+
+
 @bp.route('/admin/course_orders')
 @login_required
 def admin_course_orders():
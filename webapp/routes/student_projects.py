@@ -2,6 +2,7 @@ from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from flask_login import login_required, current_user
 from ..extensions import db
+from ..services.homepage_cache import invalidate_home_sections
 from ..models import StudentProject, ProjectLike, ProjectComment, User, ClassEnrollment
 
 bp = Blueprint('student_projects', __name__)
@@ -274,6 +275,7 @@ def create_project():
                 featured=False
             )
             db.session.add(project)
+            invalidate_home_sections()
             db.session.commit()
             flash('Project created successfully!', 'success')
             return redirect(url_for('student_projects.my_projects'))
@@ -518,6 +520,7 @@ def delete_project(project_id):
         
         # Delete the project (cascade will handle likes and comments)
         db.session.delete(project)
+        invalidate_home_sections()
         db.session.commit()
         
         flash(f'Project "{project_title}" deleted successfully.', 'success')
@@ -555,6 +558,7 @@ def toggle_project_status(project_id):
         else:
             project.is_active = bool(new_status)
         
+        invalidate_home_sections()
         db.session.commit()
         
         return jsonify({
@@ -587,6 +591,7 @@ def toggle_project_featured(project_id):
         else:
             project.featured = bool(new_featured)
         
+        invalidate_home_sections()
         db.session.commit()
         
         return jsonify({
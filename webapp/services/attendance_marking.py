@@ -0,0 +1,149 @@
+"""
+Bulk attendance marking for a whole class roster.
+
+Membership of every student is validated with one query and all rows are
+written with a single INSERT ... ON CONFLICT DO UPDATE, so marking 30
+students costs the same as marking one. Students with accounts upsert on
+the ``unique_attendance`` index ((student_id, class_id, attendance_date)
+WHERE school_student_id IS NULL); registered school students, whose rows
+are held by the school admin's user id, upsert on
+``unique_school_student_attendance`` ((school_student_id, class_id,
+attendance_date)).
+"""
+from __future__ import annotations
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..extensions import db
+from ..models import Attendance, ClassEnrollment, SchoolStudent
+
+VALID_STATUSES = ('present', 'absent', 'late')
+
+
+def _upsert(rows: List[dict], school_students: bool = False) -> None:
+    key = ['school_student_id' if school_students else 'student_id', 'class_id', 'attendance_date']
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for row in rows:
+            match = {column: row[column] for column in key}
+            if not school_students:
+                match['school_student_id'] = None
+            existing = Attendance.query.filter_by(**match).first()
+            if existing:
+                existing.status = row['status']
+                existing.marked_by = row['marked_by']
+            else:
+                db.session.add(Attendance(**row))
+        return
+
+    statement = insert(Attendance).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=key,
+        index_where=None if school_students else Attendance.school_student_id.is_(None),
+        set_={'status': statement.excluded.status, 'marked_by': statement.excluded.marked_by}
+    )
+    db.session.execute(statement)
+
+
+def mark_class_attendance(class_id: int, attendance_date: date, entries: Iterable[Tuple[int, str]],
+                          marked_by: int) -> List[Dict]:
+    """
+    Record ``(student_id, status)`` pairs for one class and date. Returns one
+    result per entry: ``{'student_id', 'status', 'saved', 'error'}``. Students
+    without a completed enrollment in the class and unknown statuses are
+    reported rather than raised; the caller commits.
+    """
+    entries = list(entries)
+    student_ids = {student_id for student_id, _ in entries if student_id}
+    class_types = dict(db.session.query(ClassEnrollment.user_id, ClassEnrollment.class_type).filter(
+        ClassEnrollment.class_id == class_id,
+        ClassEnrollment.status == 'completed',
+        ClassEnrollment.user_id.in_(student_ids)
+    ).all()) if student_ids else {}
+
+    results, rows, seen = [], [], set()
+    now = datetime.utcnow()
+    for student_id, status in entries:
+        result = {'student_id': student_id, 'status': status, 'saved': False, 'error': None}
+        results.append(result)
+        if status not in VALID_STATUSES:
+            result['error'] = f"Invalid status '{status}'"
+        elif student_id not in class_types:
+            result['error'] = 'Student is not enrolled in this class'
+        elif student_id in seen:
+            result['error'] = 'Duplicate entry for this student'
+        else:
+            seen.add(student_id)
+            result['saved'] = True
+            rows.append({
+                'student_id': student_id,
+                'class_id': class_id,
+                'class_type': class_types[student_id],
+                'attendance_date': attendance_date,
+                'status': status,
+                'marked_by': marked_by,
+                'created_at': now,
+            })
+
+    if rows:
+        _upsert(rows)
+    return results
+
+
+def mark_school_attendance(class_id: int, attendance_date: date, entries: Iterable[Tuple[int, str]],
+                           marked_by: int, school_admin_id: Optional[int] = None) -> List[Dict]:
+    """
+    Record ``(school_student_id, status)`` pairs for registered school
+    students of one class and date. A student counts when their school's
+    enrollment in the class is completed; with ``school_admin_id`` it must
+    also be that school admin's enrollment and registration. Returns one
+    result per entry: ``{'school_student_id', 'status', 'saved', 'error'}``;
+    the caller commits.
+    """
+    entries = list(entries)
+    school_student_ids = {school_student_id for school_student_id, _ in entries if school_student_id}
+    query = db.session.query(SchoolStudent.id, ClassEnrollment.user_id) \
+        .join(ClassEnrollment, ClassEnrollment.id == SchoolStudent.enrollment_id) \
+        .filter(SchoolStudent.id.in_(school_student_ids),
+                SchoolStudent.class_id == class_id,
+                ClassEnrollment.class_id == class_id,
+                ClassEnrollment.class_type == 'school',
+                ClassEnrollment.status == 'completed')
+    if school_admin_id is not None:
+        query = query.filter(ClassEnrollment.user_id == school_admin_id,
+                             SchoolStudent.registered_by == school_admin_id)
+    # The school admin's user id holds each row, as in the one-at-a-time marking
+    holders = dict(query.all()) if school_student_ids else {}
+
+    results, rows, seen = [], [], set()
+    now = datetime.utcnow()
+    for school_student_id, status in entries:
+        result = {'school_student_id': school_student_id, 'status': status, 'saved': False, 'error': None}
+        results.append(result)
+        if status not in VALID_STATUSES:
+            result['error'] = f"Invalid status '{status}'"
+        elif school_student_id not in holders:
+            result['error'] = 'Student is not registered in this class'
+        elif school_student_id in seen:
+            result['error'] = 'Duplicate entry for this student'
+        else:
+            seen.add(school_student_id)
+            result['saved'] = True
+            rows.append({
+                'student_id': holders[school_student_id],
+                'school_student_id': school_student_id,
+                'class_id': class_id,
+                'class_type': 'school',
+                'attendance_date': attendance_date,
+                'status': status,
+                'marked_by': marked_by,
+                'created_at': now,
+            })
+
+    if rows:
+        _upsert(rows, school_students=True)
+    return results
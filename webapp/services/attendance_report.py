@@ -0,0 +1,195 @@
+"""
+Set-based attendance reporting.
+
+Every report is a fixed number of SQL statements regardless of how many
+students, classes or attendance rows exist: status counts are computed with
+one GROUP BY aggregate and names are joined in the same statement. The
+admin attendance page also keeps the rows it loads bounded: the day's
+records come a page at a time, and rosters and per-student and per-class
+stats are computed only for the selected class and the students on
+screen, so it costs the same for 50 students or 5,000.
+"""
+from __future__ import annotations
+from calendar import monthrange
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, case, func, literal
+from sqlalchemy.orm import aliased
+
+from ..extensions import db
+from ..models import Attendance, ClassEnrollment, GroupClass, IndividualClass, SchoolStudent, User
+
+STATUSES = ('present', 'absent', 'late')
+DAILY_PAGE_SIZE = 50
+
+
+class DailyRecords(NamedTuple):
+    records: list  # this page's rows
+    page: int
+    pages: int
+    total: int  # rows for the day (and filters), across all pages
+    present: int
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.page < self.pages
+
+
+def month_range(day: date) -> Tuple[date, date]:
+    """First and last day of ``day``'s month"""
+    return date(day.year, day.month, 1), date(day.year, day.month, monthrange(day.year, day.month)[1])
+
+
+def _status_columns():
+    return [func.coalesce(func.sum(case((Attendance.status == status, 1), else_=0)), 0).label(status)
+            for status in STATUSES]
+
+
+def _full_name(user):
+    return func.coalesce(user.first_name, '') + literal(' ') + func.coalesce(user.last_name, '')
+
+
+def _class_name():
+    """Name of the class an attendance row belongs to; GroupClass ids win over IndividualClass ids"""
+    return func.coalesce(GroupClass.name, IndividualClass.name, literal('Unknown'))
+
+
+def _with_class_names(query):
+    return query.outerjoin(GroupClass, GroupClass.id == Attendance.class_id) \
+        .outerjoin(IndividualClass, IndividualClass.id == Attendance.class_id)
+
+
+def _counts(row, days: int) -> dict:
+    counts = {status: int(getattr(row, status) or 0) for status in STATUSES}
+    counts['recorded'] = sum(counts.values())
+    counts['total'] = days
+    counts['percentage'] = round(counts['present'] / days * 100, 1) if days > 0 else 0
+    return counts
+
+
+def student_summary(start: date, end: date, student_ids: Iterable[int],
+                    class_id: Optional[int] = None) -> Dict[int, dict]:
+    """
+    Present/absent/late counts for each of ``student_ids`` between ``start``
+    and ``end`` (inclusive), including students with no attendance at all.
+    ``percentage`` is present days over calendar days in the range. Rows a
+    school admin holds for registered school students are not counted.
+    """
+    student_ids = set(student_ids)
+    if not student_ids:
+        return {}
+    conditions = [Attendance.student_id == User.id,
+                  Attendance.school_student_id.is_(None),
+                  Attendance.attendance_date >= start,
+                  Attendance.attendance_date <= end]
+    if class_id:
+        conditions.append(Attendance.class_id == class_id)
+    rows = db.session.query(User.id, *_status_columns()) \
+        .outerjoin(Attendance, and_(*conditions)) \
+        .filter(User.is_student == True, User.id.in_(student_ids)) \
+        .group_by(User.id).all()
+    days = (end - start).days + 1
+    return {row.id: _counts(row, days) for row in rows}
+
+
+def class_summary(start: date, end: date, class_id: Optional[int] = None) -> List[dict]:
+    """
+    Per-class status counts and distinct students between ``start`` and
+    ``end``, for every class or only ``class_id``; ``percentage`` is the
+    share of recorded rows marked present.
+    """
+    filters = [Attendance.attendance_date >= start, Attendance.attendance_date <= end]
+    if class_id:
+        filters.append(Attendance.class_id == class_id)
+    rows = _with_class_names(db.session.query(
+        Attendance.class_id,
+        Attendance.class_type,
+        _class_name().label('class_name'),
+        func.count(func.distinct(Attendance.student_id)).label('students'),
+        *_status_columns()
+    )).filter(*filters).group_by(Attendance.class_id, Attendance.class_type, GroupClass.name, IndividualClass.name) \
+        .order_by(Attendance.class_id).all()
+    days = (end - start).days + 1
+    summary = []
+    for row in rows:
+        counts = _counts(row, days)
+        counts.update(class_id=row.class_id, class_type=row.class_type, class_name=row.class_name,
+                      students=row.students,
+                      percentage=round(counts['present'] / counts['recorded'] * 100, 1) if counts['recorded'] else 0)
+        summary.append(counts)
+    return summary
+
+
+def daily_records(day: date, class_id: Optional[int] = None, student_id: Optional[int] = None,
+                  page: int = 1, per_page: int = DAILY_PAGE_SIZE) -> DailyRecords:
+    """
+    One page of the attendance rows for a day, newest first, each with
+    ``class_name``, ``student_name`` and ``marker_name`` set from the same
+    query, plus the day's totals. School student rows are named after the
+    registered student.
+    """
+    filters = [Attendance.attendance_date == day]
+    if class_id:
+        filters.append(Attendance.class_id == class_id)
+    if student_id:
+        filters.append(Attendance.student_id == student_id)
+
+    total, present = db.session.query(
+        func.count(Attendance.id),
+        func.coalesce(func.sum(case((Attendance.status == 'present', 1), else_=0)), 0)
+    ).filter(*filters).one()
+    pages = max(1, -(-total // per_page))
+    page = min(max(page, 1), pages)
+
+    student = aliased(User)
+    marker = aliased(User)
+    query = _with_class_names(db.session.query(
+        Attendance,
+        _class_name().label('class_name'),
+        student.id.label('student_exists'),
+        func.coalesce(SchoolStudent.student_name, _full_name(student)).label('student_name'),
+        marker.id.label('marker_exists'),
+        _full_name(marker).label('marker_name'),
+    )).outerjoin(student, student.id == Attendance.student_id) \
+        .outerjoin(marker, marker.id == Attendance.marked_by) \
+        .outerjoin(SchoolStudent, SchoolStudent.id == Attendance.school_student_id) \
+        .filter(*filters)
+
+    records = []
+    rows = query.order_by(Attendance.created_at.desc(), Attendance.id.desc()) \
+        .limit(per_page).offset((page - 1) * per_page).all() if total else []
+    for att, class_name, student_exists, student_name, marker_exists, marker_name in rows:
+        att.class_name = class_name
+        att.student_name = student_name if student_exists else 'Unknown'
+        if att.marked_by:
+            att.marker_name = marker_name if marker_exists else 'Unknown'
+        else:
+            att.marker_name = 'System'
+        records.append(att)
+    return DailyRecords(records, page, pages, int(total), int(present or 0))
+
+
+def class_rosters(class_id: Optional[int] = None) -> Dict[int, List[dict]]:
+    """
+    {class_id: [{'id', 'name', 'username'}]} for completed enrollments in
+    every class or only ``class_id``, in one query
+    """
+    query = db.session.query(ClassEnrollment.class_id, User.id, User.first_name, User.last_name, User.username) \
+        .join(User, User.id == ClassEnrollment.user_id) \
+        .filter(ClassEnrollment.status == 'completed')
+    if class_id:
+        query = query.filter(ClassEnrollment.class_id == class_id)
+    rows = query.order_by(ClassEnrollment.id).all()
+    rosters = {}
+    for class_id, user_id, first_name, last_name, username in rows:
+        rosters.setdefault(class_id, []).append({
+            'id': user_id,
+            'name': f"{first_name} {last_name}",
+            'username': username
+        })
+    return rosters
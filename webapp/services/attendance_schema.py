@@ -0,0 +1,116 @@
+"""
+Schema upgrade for attendance rows of registered school students.
+
+School students have no User account, so their attendance rows are held by
+the school admin's ``student_id`` and used to name the student only in
+``notes`` ('school_student_<id>'). ``attendance.school_student_id`` now
+records it, and the per-user unique constraint became two unique indexes:
+``unique_attendance`` on (student_id, class_id, attendance_date) for rows
+without a school student, and ``unique_school_student_attendance`` on
+(school_student_id, class_id, attendance_date).
+
+``upgrade_attendance_table()`` makes that change idempotently: it adds the
+column, backfills it from the notes marker and swaps the constraint for the
+indexes, skipping whatever is already in place. The
+``add_attendance_school_student`` migration runs it, and so does
+``ensure_attendance_schema()``, which the deploy's ``db.create_all()`` step
+calls because create_all() never alters an existing table; it also adds the
+model's other indexes (such as ``ix_attendance_date``) for the same
+reason.
+"""
+from __future__ import annotations
+import re
+
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from ..extensions import db
+
+NOTES_MARKER = re.compile(r'school_student_(\d+)')
+USER_ROWS_ONLY = sa.text('school_student_id IS NULL')
+
+
+def _backfill(bind) -> int:
+    """Move the school student recorded in notes into ``school_student_id``; returns the rows updated"""
+    attendance = sa.table('attendance', sa.column('id'), sa.column('notes'), sa.column('class_type'),
+                          sa.column('school_student_id'))
+    school_student = sa.table('school_student', sa.column('id'))
+    known_ids = set(bind.execute(sa.select(school_student.c.id)).scalars())
+
+    updates = []
+    rows = bind.execute(sa.select(attendance.c.id, attendance.c.notes).where(
+        attendance.c.class_type == 'school',
+        attendance.c.school_student_id.is_(None),
+        attendance.c.notes.like('%school_student_%')
+    ))
+    for row_id, notes in rows:
+        match = NOTES_MARKER.search(notes or '')
+        if match and int(match.group(1)) in known_ids:
+            updates.append({'row_id': row_id, 'school_student_id': int(match.group(1))})
+    if updates:
+        bind.execute(
+            attendance.update().where(attendance.c.id == sa.bindparam('row_id'))
+            .values(school_student_id=sa.bindparam('school_student_id')),
+            updates
+        )
+    return len(updates)
+
+
+def upgrade_attendance_table(operations) -> bool:
+    """
+    Apply the change with ``operations`` (alembic's ``op`` or an
+    ``Operations``); True if anything was missing.
+    """
+    bind = operations.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if 'attendance' not in tables:
+        return False
+    columns = {column['name'] for column in inspector.get_columns('attendance')}
+    unique_constraints = {c['name'] for c in inspector.get_unique_constraints('attendance')}
+    changed = False
+
+    if 'school_student_id' not in columns or 'unique_attendance' in unique_constraints:
+        with operations.batch_alter_table('attendance') as batch_op:
+            if 'school_student_id' not in columns:
+                batch_op.add_column(sa.Column('school_student_id', sa.Integer(), nullable=True))
+                if 'school_student' in tables:
+                    batch_op.create_foreign_key('fk_attendance_school_student', 'school_student',
+                                                ['school_student_id'], ['id'])
+            # Several students of one school share the admin's student_id, so the
+            # old per-user constraint only applies to rows without a school student
+            if 'unique_attendance' in unique_constraints:
+                batch_op.drop_constraint('unique_attendance', type_='unique')
+        changed = True
+
+    # Rows marked after the column existed already carry it; this only picks up older ones
+    if 'school_student' in tables and _backfill(bind):
+        changed = True
+
+    indexes = {index['name'] for index in sa.inspect(bind).get_indexes('attendance')}
+    if 'unique_attendance' not in indexes:
+        operations.create_index('unique_attendance', 'attendance', ['student_id', 'class_id', 'attendance_date'],
+                                unique=True, postgresql_where=USER_ROWS_ONLY, sqlite_where=USER_ROWS_ONLY)
+        changed = True
+    if 'unique_school_student_attendance' not in indexes:
+        operations.create_index('unique_school_student_attendance', 'attendance',
+                                ['school_student_id', 'class_id', 'attendance_date'], unique=True)
+        changed = True
+    return changed
+
+
+def ensure_attendance_schema() -> bool:
+    """
+    Upgrade an ``attendance`` table made before school_student_id existed
+    and create any other index the model declares, in its own transaction
+    """
+    from ..models import Attendance
+    with db.engine.begin() as connection:
+        changed = upgrade_attendance_table(Operations(MigrationContext.configure(connection)))
+        existing = {index['name'] for index in sa.inspect(connection).get_indexes('attendance')}
+        for index in Attendance.__table__.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                changed = True
+        return changed
@@ -0,0 +1,92 @@
+"""
+Process-local caches that stay coherent across gunicorn workers.
+
+Each cache keeps its value in this process together with the version token it
+was loaded under. The token lives in a ``site_settings`` row keyed
+``_cache_version:<name>``. Writers call ``invalidate()`` inside their
+transaction to store a new token; every worker compares its token with the row
+at most once per poll interval and reloads when it changed. Values are also
+reloaded unconditionally once their TTL expires.
+"""
+from __future__ import annotations
+import secrets
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from flask import current_app, has_app_context
+
+from ..extensions import db
+
+VERSION_KEY_PREFIX = '_cache_version:'
+
+
+def _config(key: str, default: int) -> int:
+    if has_app_context():
+        return int(current_app.config.get(key, default))
+    return default
+
+
+class VersionedCache:
+    """A single cached value guarded by a cross-worker version token."""
+
+    def __init__(self, name: str, loader: Callable[[], Any],
+                 ttl_config_key: str = 'CACHE_DEFAULT_TTL', default_ttl: int = 300):
+        self.name = name
+        self.version_key = f"{VERSION_KEY_PREFIX}{name}"
+        self._loader = loader
+        self._ttl_config_key = ttl_config_key
+        self._default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._loaded = False
+        self._expires_at = 0.0
+        self._next_poll = 0.0
+
+    def _read_version(self) -> Optional[str]:
+        from ..models.site_settings import SiteSettings
+        return db.session.query(SiteSettings.setting_value).filter(
+            SiteSettings.setting_key == self.version_key
+        ).scalar()
+
+    def get(self) -> Any:
+        """Return the cached value, reloading it if it expired or another worker invalidated it"""
+        now = time.monotonic()
+        with self._lock:
+            fresh = self._loaded and now < self._expires_at
+            if fresh and now < self._next_poll:
+                return self._value
+
+            # Read the token before the data so a concurrent write is never masked
+            version = self._read_version()
+            self._next_poll = now + _config('CACHE_VERSION_POLL_INTERVAL', 5)
+            if fresh and version == self._version:
+                return self._value
+
+            value = self._loader()
+            self._value = value
+            self._version = version
+            self._loaded = True
+            self._expires_at = now + _config(self._ttl_config_key, self._default_ttl)
+            return value
+
+    def clear(self) -> None:
+        """Drop the value held by this process only"""
+        with self._lock:
+            self._loaded = False
+            self._value = None
+
+    def invalidate(self) -> None:
+        """
+        Store a new version token in the current transaction and drop the local
+        value. The caller commits; other workers reload on their next poll.
+        """
+        from ..models.site_settings import SiteSettings
+        token = secrets.token_hex(8)
+        row = SiteSettings.query.filter_by(setting_key=self.version_key).first()
+        if row:
+            row.setting_value = token
+        else:
+            db.session.add(SiteSettings(setting_key=self.version_key, setting_value=token))
+        self.clear()
@@ -0,0 +1,210 @@
+"""
+Materialized weekly class schedule.
+
+Every active ClassTime is stored as ClassTimeWindow rows holding its start
+and end as minutes since Monday 00:00 UTC. A slot keeps its local wall-clock
+time across DST changes, so it moves against UTC twice a year in zones like
+Europe/London; each such move starts a new row that applies to the
+occurrences starting from that point (``effective_from``/``effective_until``).
+Deciding whether a slot is live is then one indexed range lookup on the
+current minute of the UTC week instead of localizing every slot into the
+viewer's timezone on each request.
+
+Windows are rebuilt by ``rebuild_class_time_windows()`` whenever slots are
+added or toggled in admin_class_time_settings; ``flask rebuild-class-schedule``
+rebuilds all of them. The deploy's ``db.create_all()`` step calls
+``ensure_class_time_windows()``, which builds them when the table is empty.
+"""
+from __future__ import annotations
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import pytz
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from ..extensions import db
+from ..models import ClassTime, ClassTimeWindow
+from .cache import VersionedCache
+from .timezones import get_timezone
+
+# Per-enrollment live status (services/live_status.py); reset on every rebuild
+live_status_cache = VersionedCache('class_schedule', dict, ttl_config_key='LIVE_STATUS_CACHE_TTL',
+                                   default_ttl=3600)
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MINUTES_PER_WEEK = 7 * 24 * 60
+
+
+class WeeklyWindow(NamedTuple):
+    start_minute: int
+    end_minute: int
+    effective_from: Optional[datetime]
+    effective_until: Optional[datetime]
+
+
+def week_minute(moment: datetime) -> int:
+    """Minutes since Monday 00:00 for a naive UTC datetime"""
+    return moment.weekday() * 1440 + moment.hour * 60 + moment.minute
+
+
+def _occurrence(tz, local_day: date, start: time, end: time):
+    """Naive UTC start and end of the slot on ``local_day``; an end at or before the start is the next day"""
+    start_at = tz.localize(datetime.combine(local_day, start))
+    end_day = local_day + timedelta(days=1) if end <= start else local_day
+    end_at = tz.localize(datetime.combine(end_day, end))
+    return (start_at.astimezone(pytz.utc).replace(tzinfo=None),
+            end_at.astimezone(pytz.utc).replace(tzinfo=None))
+
+
+def weekly_windows(day: str, start: time, end: time, timezone: str,
+                   since: Optional[datetime] = None) -> List[WeeklyWindow]:
+    """
+    UTC weekly windows for a slot held every ``day`` from ``start`` to
+    ``end`` in ``timezone``, from the week before ``since`` (default: now)
+    onwards. Only the weeks around the zone's DST transitions are localized;
+    the last window is open-ended. Raises ``pytz.UnknownTimeZoneError``.
+    """
+    if day not in DAYS:
+        return []
+    tz = get_timezone(timezone)
+    transitions = getattr(tz, '_utc_transition_times', [])
+    first_day = ((since or datetime.utcnow()) - timedelta(days=7)).date()
+    local_day = first_day + timedelta(days=(DAYS.index(day) - first_day.weekday()) % 7)
+
+    windows: List[WeeklyWindow] = []
+    while True:
+        start_at, end_at = _occurrence(tz, local_day, start, end)
+        start_minute = week_minute(start_at)
+        end_minute = start_minute + int((end_at - start_at).total_seconds() // 60)
+        changed = not windows or (windows[-1].start_minute, windows[-1].end_minute) != (start_minute, end_minute)
+        if changed:
+            if windows:
+                # Any cut-off between the previous occurrence and this one works; take the midweek point
+                windows[-1] = windows[-1]._replace(effective_until=start_at - timedelta(days=3))
+            windows.append(WeeklyWindow(start_minute, end_minute, start_at if windows else None, None))
+
+        # Occurrences keep the same UTC offset until the next transition, so skip straight to it.
+        # The occurrence on a transition day can itself be shifted (a wall-clock time the change
+        # skips over), so after any change the following week is checked too.
+        index = bisect_right(transitions, start_at)
+        if index >= len(transitions):
+            return windows
+        weeks = 1 if changed else max(1, (transitions[index] - start_at).days // 7)
+        local_day += timedelta(weeks=weeks)
+
+
+def rebuild_class_time_windows(class_time_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Replace the windows of the given ClassTime ids (every slot when None);
+    inactive and deleted slots end up with none. Returns the number of rows
+    written. The caller commits.
+    """
+    delete = ClassTimeWindow.query
+    slots = ClassTime.query.filter(ClassTime.is_active == True)
+    if class_time_ids is not None:
+        class_time_ids = set(class_time_ids)
+        if not class_time_ids:
+            return 0
+        delete = delete.filter(ClassTimeWindow.class_time_id.in_(class_time_ids))
+        slots = slots.filter(ClassTime.id.in_(class_time_ids))
+    delete.delete(synchronize_session=False)
+
+    rows = []
+    for class_time in slots.all():
+        try:
+            windows = weekly_windows(class_time.day, class_time.start_time, class_time.end_time,
+                                     class_time.timezone)
+        except pytz.UnknownTimeZoneError:
+            current_app.logger.warning('ClassTime %s has unknown timezone %r; not scheduled',
+                                       class_time.id, class_time.timezone)
+            continue
+        rows.extend({'class_time_id': class_time.id, 'class_type': class_time.class_type,
+                     'class_id': class_time.class_id, **window._asdict()} for window in windows)
+    if rows:
+        db.session.execute(ClassTimeWindow.__table__.insert(), rows)
+    live_status_cache.invalidate()
+    return len(rows)
+
+
+def ensure_class_time_windows() -> int:
+    """
+    Build every slot's windows if there are none yet, e.g. when create_all()
+    made the table before the migration could backfill it. Returns the
+    number of rows written. The caller commits.
+    """
+    if db.session.query(ClassTimeWindow.id).first() is not None:
+        return 0
+    return rebuild_class_time_windows()
+
+
+def live_windows(now: Optional[datetime] = None, class_time_ids: Optional[Iterable[int]] = None,
+                 class_type: Optional[str] = None) -> List[ClassTimeWindow]:
+    """Windows covering ``now`` (naive UTC, default: current time), optionally limited to slots or a class type"""
+    now = now or datetime.utcnow()
+    minute = week_minute(now)
+    query = ClassTimeWindow.query.filter(
+        or_(and_(ClassTimeWindow.start_minute <= minute, ClassTimeWindow.end_minute > minute),
+            and_(ClassTimeWindow.start_minute <= minute + MINUTES_PER_WEEK,
+                 ClassTimeWindow.end_minute > minute + MINUTES_PER_WEEK)),
+        or_(ClassTimeWindow.effective_from.is_(None), ClassTimeWindow.effective_from <= now)
+    )
+    if class_time_ids is not None:
+        class_time_ids = set(class_time_ids)
+        if not class_time_ids:
+            return []
+        query = query.filter(ClassTimeWindow.class_time_id.in_(class_time_ids))
+    if class_type:
+        query = query.filter(ClassTimeWindow.class_type == class_type)
+
+    live = []
+    for window in query.all():
+        # The window only applies if this occurrence started inside its DST period
+        started_at = now.replace(second=0, microsecond=0) - \
+            timedelta(minutes=(minute - window.start_minute) % MINUTES_PER_WEEK)
+        if (window.effective_from is None or window.effective_from <= started_at) and \
+                (window.effective_until is None or started_at < window.effective_until):
+            live.append(window)
+    return live
+
+
+def live_class_time_ids(class_time_ids: Iterable[int], now: Optional[datetime] = None) -> Set[int]:
+    """The subset of ``class_time_ids`` whose slot is in progress at ``now``"""
+    return {window.class_time_id for window in live_windows(now, class_time_ids=class_time_ids)}
+
+
+def schedule_state(class_time_ids: Iterable[int], now: Optional[datetime] = None
+                   ) -> Tuple[Set[int], Optional[datetime]]:
+    """
+    ``(live ids, next change)`` for a set of slots at ``now`` (naive UTC): the
+    ids in progress and the earliest later moment any of them starts or
+    ends, or None if none is scheduled. One query on ``class_time_id``.
+    """
+    now = now or datetime.utcnow()
+    class_time_ids = set(class_time_ids)
+    if not class_time_ids:
+        return set(), None
+    week_start = datetime.combine(now.date() - timedelta(days=now.weekday()), time())
+    windows = ClassTimeWindow.query.filter(
+        ClassTimeWindow.class_time_id.in_(class_time_ids),
+        or_(ClassTimeWindow.effective_from.is_(None),
+            ClassTimeWindow.effective_from <= now + timedelta(weeks=1)),
+        or_(ClassTimeWindow.effective_until.is_(None),
+            ClassTimeWindow.effective_until > now - timedelta(weeks=1))
+    ).all()
+
+    live, next_change = set(), None
+    for window in windows:
+        for week in (-1, 0, 1):
+            started_at = week_start + timedelta(weeks=week, minutes=window.start_minute)
+            if (window.effective_from is not None and started_at < window.effective_from) or \
+                    (window.effective_until is not None and started_at >= window.effective_until):
+                continue
+            ends_at = started_at + timedelta(minutes=window.end_minute - window.start_minute)
+            if started_at <= now < ends_at:
+                live.add(window.class_time_id)
+            for moment in (started_at, ends_at):
+                if moment > now and (next_change is None or moment < next_change):
+                    next_change = moment
+    return live, next_change
@@ -5,8 +5,11 @@ import os
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
+import cloudinary.utils
 from werkzeug.datastructures import FileStorage
 
+from .perf import track
+
 class CloudinaryService:
     @staticmethod
     def is_available() -> bool:
@@ -23,7 +26,7 @@ class CloudinaryService:
 
     @staticmethod
     def upload_file(
-        file: Union[FileStorage, BinaryIO], 
+        file: Union[FileStorage, BinaryIO, str], 
         folder: str = "", 
         resource_type: str = "auto",
         public_id: Optional[str] = None
@@ -32,7 +35,7 @@ class CloudinaryService:
         Upload a file to Cloudinary.
         
         Args:
-            file: File to upload (FileStorage or file-like object)
+            file: File to upload (FileStorage, file-like object or local path)
             folder: Cloudinary folder path
             resource_type: Type of resource ('image', 'video', 'raw', 'auto')
             public_id: Optional public ID for the file
@@ -44,15 +47,16 @@ class CloudinaryService:
             return False, "Cloudinary is not properly configured"
 
         try:
-            upload_result = cloudinary.uploader.upload(
-                file,
-                folder=folder,
-                resource_type=resource_type,
-                public_id=public_id,
-                use_filename=True,
-                unique_filename=True,
-                overwrite=True
-            )
+            with track('cloudinary'):
+                upload_result = cloudinary.uploader.upload(
+                    file,
+                    folder=folder,
+                    resource_type=resource_type,
+                    public_id=public_id,
+                    use_filename=True,
+                    unique_filename=True,
+                    overwrite=True
+                )
             return True, {
                 'url': upload_result.get('secure_url'),
                 'public_id': upload_result.get('public_id'),
@@ -83,7 +87,8 @@ class CloudinaryService:
             return False, "Cloudinary is not properly configured"
 
         try:
-            result = cloudinary.uploader.destroy(public_id, resource_type=resource_type)
+            with track('cloudinary'):
+                result = cloudinary.uploader.destroy(public_id, resource_type=resource_type)
             if result.get('result') == 'ok':
                 return True, "File deleted successfully"
             return False, result.get('result', 'Unknown error')
@@ -92,6 +97,34 @@ class CloudinaryService:
             current_app.logger.error(error_msg)
             return False, error_msg
 
+    @staticmethod
+    def sign_upload_params(params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sign upload ``params`` so a browser can upload straight to Cloudinary.
+
+        Returns the params with ``signature`` and ``api_key`` added; the
+        browser must send exactly these fields along with the file.
+        """
+        config = cloudinary.config()
+        signed = dict(params)
+        signed['signature'] = cloudinary.utils.api_sign_request(params, config.api_secret)
+        signed['api_key'] = config.api_key
+        return signed
+
+    @staticmethod
+    def upload_url(resource_type: str = "auto") -> str:
+        """Cloudinary's upload endpoint for ``resource_type``"""
+        return cloudinary.utils.cloudinary_api_url('upload', resource_type=resource_type)
+
+    @staticmethod
+    def verify_upload_response(public_id: str, version: Any, signature: str) -> bool:
+        """Check the signature Cloudinary put on an upload response the browser passed on"""
+        try:
+            return cloudinary.utils.verify_api_response_signature(public_id, version, signature)
+        except Exception as e:
+            current_app.logger.error(f"Error verifying Cloudinary signature: {e}")
+            return False
+
     @staticmethod
     def get_cloudinary_url(public_id: str, **transformations) -> Optional[str]:
         """Generate a Cloudinary URL with optional transformations."""
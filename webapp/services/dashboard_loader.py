@@ -0,0 +1,368 @@
+"""
+Batched data assembly for the student dashboard.
+
+Every collection the dashboard needs is fetched with a set-based query keyed
+by the IDs of the student's enrollments, so the number of round trips stays
+fixed no matter how many classes, classmates or attendance rows are involved.
+"""
+from __future__ import annotations
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from ..models import (
+    User,
+    Purchase,
+    ClassEnrollment,
+    StudentProject,
+    IndividualClass,
+    GroupClass,
+    Attendance,
+    SchoolStudent,
+    FamilyMember,
+    LearningMaterial,
+    ClassTime,
+    StudentClassTimeSelection,
+)
+from .payment_ledger import enrollment_ledgers
+from .slot_booking import slot_availability
+
+# Maximum number of SQL statements a student dashboard render may issue,
+# including the login/session lookups and template context processors.
+# verify_dashboard_queries.py enforces this against a seeded database.
+DASHBOARD_QUERY_BUDGET = 30
+
+SHARED_CLASS_TYPES = ('group', 'family', 'school')
+SELECTABLE_CLASS_TYPES = ('individual', 'family')
+PAYMENT_MONTHS_SHOWN = 15
+
+
+def _group_by(rows, key):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[key(row)].append(row)
+    return grouped
+
+
+def _student_entry(student: User) -> Dict[str, Any]:
+    return {
+        'id': student.id,
+        'name': f"{student.first_name} {student.last_name}",
+        'username': student.username,
+        'type': 'user'
+    }
+
+
+def load_enrolled_classes(enrollments: List[ClassEnrollment]) -> List[Dict[str, Any]]:
+    """Resolve the class object for every enrollment with at most two queries."""
+    class_ids = {e.class_id for e in enrollments}
+    if not class_ids:
+        return []
+
+    group_classes = {c.id: c for c in GroupClass.query.filter(GroupClass.id.in_(class_ids)).all()}
+    missing_ids = class_ids - set(group_classes)
+    individual_classes = {}
+    if missing_ids:
+        individual_classes = {
+            c.id: c for c in IndividualClass.query.filter(IndividualClass.id.in_(missing_ids)).all()
+        }
+
+    enrolled_classes = []
+    for enrollment in enrollments:
+        # Try GroupClass first (unified), then IndividualClass (legacy)
+        class_obj = group_classes.get(enrollment.class_id) or individual_classes.get(enrollment.class_id)
+        if class_obj:
+            enrolled_classes.append({
+                'id': class_obj.id,
+                'name': class_obj.name,
+                'description': class_obj.description,
+                'class_type': enrollment.class_type,
+                'enrollment': enrollment,
+                'class_obj': class_obj
+            })
+    return enrolled_classes
+
+
+def load_roster(user: User, enrolled_classes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Load classmates, registered family members and registered school students
+    for every shared class in a fixed number of queries.
+    """
+    user_id = user.id
+    shared = [c for c in enrolled_classes if c['class_type'] in SHARED_CLASS_TYPES]
+    group_family = [c for c in shared if c['class_type'] in ('group', 'family')]
+    family = [c for c in shared if c['class_type'] == 'family']
+    school = [c for c in shared if c['class_type'] == 'school']
+
+    # Classmates: every completed enrollment in the same (class_id, class_type)
+    classmate_enrollments = []
+    if group_family:
+        classmate_enrollments = ClassEnrollment.query.filter(
+            ClassEnrollment.class_id.in_({c['id'] for c in group_family}),
+            ClassEnrollment.class_type.in_({c['class_type'] for c in group_family}),
+            ClassEnrollment.status == 'completed'
+        ).all()
+    classmate_ids = {e.user_id for e in classmate_enrollments}
+    classmates = {}
+    if classmate_ids:
+        classmates = {u.id: u for u in User.query.filter(User.id.in_(classmate_ids)).all()}
+    enrollments_by_class = _group_by(classmate_enrollments, lambda e: (e.class_id, e.class_type))
+
+    members_by_key = {}
+    if family:
+        members = FamilyMember.query.filter(
+            FamilyMember.enrollment_id.in_({c['enrollment'].id for c in family})
+        ).order_by(FamilyMember.id).all()
+        members_by_key = _group_by(members, lambda m: (m.class_id, m.enrollment_id))
+
+    school_students_by_key = {}
+    if school:
+        school_students = SchoolStudent.query.filter(
+            SchoolStudent.enrollment_id.in_({c['enrollment'].id for c in school}),
+            SchoolStudent.registered_by == user_id
+        ).order_by(SchoolStudent.student_name).all()
+        school_students_by_key = _group_by(school_students, lambda s: (s.class_id, s.enrollment_id))
+
+    class_students = {}
+    all_students_for_attendance = {}
+    registered_students = {}
+    registered_family = {}
+
+    for cls in shared:
+        key = (cls['id'], cls['enrollment'].id)
+        if cls['class_type'] == 'school':
+            # The school admin is listed as a classmate, but attendance is only
+            # ever taken for the SchoolStudent records registered by this admin
+            school_students = school_students_by_key.get(key, [])
+            class_students[cls['id']] = [_student_entry(user)] if cls['enrollment'].user_id == user_id else []
+            all_students_for_attendance[cls['id']] = [{
+                'id': f"school_student_{s.id}",
+                'name': s.student_name,
+                'username': None,
+                'type': 'school_student',
+                'school_student_id': s.id,
+                'school_name': s.school_name
+            } for s in school_students]
+            registered_students[cls['id']] = school_students
+            continue
+
+        students = []
+        for enr in enrollments_by_class.get((cls['id'], cls['class_type']), []):
+            student = classmates.get(enr.user_id)
+            if student:
+                students.append(_student_entry(student))
+        class_students[cls['id']] = students
+
+        attendance_students = list(students)
+        if cls['class_type'] == 'family':
+            members = members_by_key.get(key, [])
+            for member in members:
+                attendance_students.append({
+                    'id': f"family_member_{member.id}",
+                    'name': member.member_name,
+                    'username': None,
+                    'type': 'family_member',
+                    'family_member_id': member.id,
+                    'relationship': member.relationship
+                })
+            registered_family[cls['id']] = members
+        all_students_for_attendance[cls['id']] = attendance_students
+
+    return {
+        'class_students': class_students,
+        'all_students_for_attendance': all_students_for_attendance,
+        'registered_students': registered_students,
+        'registered_family': registered_family,
+    }
+
+
+def load_attendance(user: User, enrolled_classes: List[Dict[str, Any]],
+                    class_students: Dict[int, list], registered_students: Dict[int, list],
+                    today: date) -> Dict[str, Any]:
+    """Load the whole month of attendance for every enrolled class in one query."""
+    user_id = user.id
+    month_start = date(today.year, today.month, 1)
+    total_days = monthrange(today.year, today.month)[1]
+    month_end = date(today.year, today.month, total_days)
+
+    rows = []
+    if enrolled_classes:
+        rows = Attendance.query.filter(
+            Attendance.class_id.in_({c['id'] for c in enrolled_classes}),
+            Attendance.attendance_date >= month_start,
+            Attendance.attendance_date <= month_end
+        ).order_by(Attendance.attendance_date.desc()).all()
+    rows_by_class = _group_by(rows, lambda a: a.class_id)
+
+    attendance_records = {}
+    monthly_stats = {}
+    all_class_attendance = {}
+    today_attendance = {}
+    all_students_today_attendance = {}
+
+    for cls in enrolled_classes:
+        class_rows = rows_by_class.get(cls['id'], [])
+        # Rows a school admin holds for their registered students are not their own attendance
+        own_rows = [a for a in class_rows if a.student_id == user_id and a.school_student_id is None]
+        attendance_records[cls['id']] = own_rows
+        today_attendance[cls['id']] = next((a for a in own_rows if a.attendance_date == today), None)
+
+        present_days = len([a for a in own_rows if a.status == 'present'])
+        percentage = (present_days / total_days * 100) if total_days > 0 else 0
+        monthly_stats[cls['id']] = {
+            'present': present_days,
+            'total': total_days,
+            'percentage': round(percentage, 1)
+        }
+
+        if cls['class_type'] not in SHARED_CLASS_TYPES:
+            continue
+
+        class_today_attendance = {}
+        if cls['class_type'] == 'school':
+            # Only rows held by this school admin belong to this school; each
+            # registered student's row is keyed by school_student_id
+            school_rows = [a for a in class_rows if a.student_id == user_id and a.class_type == 'school']
+            all_class_attendance[cls['id']] = school_rows
+            today_by_school_student = {a.school_student_id: a for a in school_rows
+                                       if a.attendance_date == today and a.school_student_id}
+            for reg_student in registered_students.get(cls['id'], []):
+                att = today_by_school_student.get(reg_student.id)
+                if att:
+                    class_today_attendance[f'school_student_{reg_student.id}'] = att
+        else:
+            all_class_attendance[cls['id']] = class_rows
+            today_by_student = {a.student_id: a for a in class_rows if a.attendance_date == today}
+            for student in class_students.get(cls['id'], []):
+                if student['type'] == 'user' and student['id'] in today_by_student:
+                    class_today_attendance[student['id']] = today_by_student[student['id']]
+        all_students_today_attendance[cls['id']] = class_today_attendance
+
+    return {
+        'attendance_records': attendance_records,
+        'monthly_stats': monthly_stats,
+        'all_class_attendance': all_class_attendance,
+        'today_attendance': today_attendance,
+        'all_students_today_attendance': all_students_today_attendance,
+    }
+
+
+def load_materials(user: User, enrolled_classes: List[Dict[str, Any]]) -> List[LearningMaterial]:
+    """Load materials shared to any of the student's classes in one query."""
+    if not enrolled_classes:
+        return []
+
+    conditions = []
+    for cls in enrolled_classes:
+        if cls['class_type'] == 'individual':
+            conditions.append(LearningMaterial.class_id == f"student_{user.id}")
+        if cls['class_type'] in ('individual', 'group', 'school', 'family'):
+            conditions.append(
+                (LearningMaterial.class_type == cls['class_type']) & (LearningMaterial.actual_class_id == cls['id'])
+            )
+    if not conditions:
+        return []
+
+    materials = LearningMaterial.query.filter(or_(*conditions)).all()
+    return sorted(materials, key=lambda x: x.created_at, reverse=True)
+
+
+def load_class_times(enrollments: List[ClassEnrollment]) -> Dict[str, Any]:
+    """
+    Load the time slots, the student's own selections and slot availability for
+    every enrollment with a fixed number of queries.
+    """
+    class_times_by_type = {}
+    student_time_selections = {}
+    if not enrollments:
+        return {'class_times_by_type': class_times_by_type, 'student_time_selections': student_time_selections}
+
+    class_types = {e.class_type for e in enrollments}
+    fixed_types = class_types - set(SELECTABLE_CLASS_TYPES)
+    times = ClassTime.query.filter(
+        ClassTime.class_type.in_(fixed_types),
+        ClassTime.is_active == True
+    ).order_by(ClassTime.day, ClassTime.start_time).all() if fixed_types else []
+
+    # Individual and Family classes share one time pool: a slot is gone for everyone
+    # once its seats (or those of its shared group) are booked by ANY student
+    selectable_types = class_types & set(SELECTABLE_CLASS_TYPES)
+    availability = slot_availability(selectable_types) if selectable_types else []
+
+    selections = StudentClassTimeSelection.query.options(
+        joinedload(StudentClassTimeSelection.class_time)
+    ).filter(
+        StudentClassTimeSelection.enrollment_id.in_({e.id for e in enrollments})
+    ).order_by(StudentClassTimeSelection.selected_at).all()
+    selections_by_enrollment = _group_by(selections, lambda s: s.enrollment_id)
+
+    for enrollment in enrollments:
+        class_type = enrollment.class_type
+        times_key = f"{class_type}_{enrollment.class_id}" if class_type in ['group', 'school'] else class_type
+        enrollment_selections = selections_by_enrollment.get(enrollment.id, [])
+        if enrollment_selections:
+            student_time_selections[enrollment.id] = enrollment_selections
+
+        if times_key in class_times_by_type:
+            continue
+
+        if class_type in SELECTABLE_CLASS_TYPES:
+            selected_ids = {s.class_time_id for s in enrollment_selections}
+            class_times_by_type[times_key] = [
+                slot.class_time for slot in availability
+                if slot.class_time.class_type == class_type and slot.available
+                and slot.class_time.id not in selected_ids
+            ]
+        elif class_type in ['group', 'school']:
+            # Each group/school class has its own slots - no general times
+            class_times_by_type[times_key] = [
+                t for t in times if t.class_type == class_type and t.class_id == enrollment.class_id
+            ]
+        else:
+            class_times_by_type[times_key] = [t for t in times if t.class_type == class_type]
+
+    return {'class_times_by_type': class_times_by_type, 'student_time_selections': student_time_selections}
+
+
+def load_monthly_payments(enrollments: List[ClassEnrollment], now: datetime) -> Dict[str, Any]:
+    """
+    Payment ledger for every enrollment from one receipt query, trimmed to
+    the months the dashboard shows: the latest PAYMENT_MONTHS_SHOWN up to
+    and including next month.
+    """
+    ledgers = enrollment_ledgers(enrollments, now, months_ahead=1)
+    return {'payment_ledgers': {
+        enrollment_id: ledger._replace(months=ledger.months[-PAYMENT_MONTHS_SHOWN:])
+        for enrollment_id, ledger in ledgers.items()
+    }}
+
+
+def load_student_dashboard(user: User, enrollments: List[ClassEnrollment], today: date) -> Dict[str, Any]:
+    """
+    Assemble the template context for the student dashboard.
+
+    The caller passes the student's completed enrollments (it already needs
+    them to gate access); everything else is loaded here with set-based
+    queries keyed by the enrollment and class IDs.
+    """
+    context = {
+        'purchases': Purchase.query.filter_by(user_id=user.id, status='completed').all(),
+        'projects': StudentProject.query.filter_by(student_id=user.id).all(),
+        'enrollments': enrollments,
+    }
+
+    enrolled_classes = load_enrolled_classes(enrollments)
+    context['enrolled_classes'] = enrolled_classes
+
+    roster = load_roster(user, enrolled_classes)
+    context.update(roster)
+    context.update(load_attendance(
+        user, enrolled_classes, roster['class_students'], roster['registered_students'], today
+    ))
+    context['materials'] = load_materials(user, enrolled_classes)
+    context.update(load_class_times(enrollments))
+    return context
@@ -0,0 +1,244 @@
+"""
+Browser-direct signed uploads to Cloudinary.
+
+The background queue (upload_queue.py) keeps the transfer to Cloudinary off
+the request, but the file itself still arrives through a gunicorn worker.
+For large media the browser now sends the bytes straight to Cloudinary:
+
+1. ``POST /api/direct-uploads/sign`` with a purpose and file name. The
+   purpose (UPLOAD_PURPOSES) fixes the folder, resource type, accepted
+   formats and who may upload; the response carries Cloudinary's signed
+   upload parameters for a public ID we choose, plus a ticket recording
+   what was signed.
+2. The browser uploads to Cloudinary (in chunks for large files).
+3. ``POST /api/direct-uploads/complete`` with the ticket and Cloudinary's
+   response. The response signature and public ID are checked against the
+   ticket and the URL is rebuilt server-side. A file over the purpose's
+   ``max_size``, or a video where only some formats are accepted, is
+   deleted from Cloudinary and refused. Otherwise the browser gets back an
+   upload token, which it submits with the form as ``<field>_upload`` in
+   place of the file.
+
+Routes call ``receive_upload()``, which accepts either that token or the
+file itself (queued as before), so forms keep working without JavaScript.
+Chunked uploads (resumable_upload.py) hand the form the same kind of token.
+"""
+from __future__ import annotations
+import os
+import re
+import secrets
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import cloudinary.utils
+from flask import current_app, request
+from flask_login import current_user
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.utils import secure_filename
+
+from ..extensions import db
+from ..models import PendingUpload
+from .cloudinary_service import CloudinaryService
+from .storage import get_storage
+from .upload_queue import UploadError, UploadUnavailable, queue_upload, release_upload
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg'}
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'mkv'}
+
+RECEIPT_MAX_SIZE = 10 * 1024 * 1024
+# A receipt is a photo or a PDF (no SVG: it can carry script)
+RECEIPT_FORMATS = ('jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff', 'heic', 'heif', 'pdf')
+
+_TICKET_SALT = 'direct-upload-ticket'
+_TOKEN_SALT = 'direct-upload-token'
+
+
+class UploadPurpose(NamedTuple):
+    folder: str
+    resource_types: Tuple[str, ...]  # one type is always used; several are chosen by file extension
+    access: str  # 'admin', 'user' (logged in) or 'public'
+    max_size: Optional[int] = None  # largest upload in bytes; None for RESUMABLE_UPLOAD_MAX_SIZE (chunked) or any (direct)
+    formats: Optional[Tuple[str, ...]] = None  # accepted file extensions; None for any
+
+
+UPLOAD_PURPOSES: Dict[str, UploadPurpose] = {
+    'gallery_image': UploadPurpose('gallery/images', ('image',), 'admin'),
+    'gallery_video': UploadPurpose('gallery/videos', ('video',), 'admin'),
+    'gallery_thumbnail': UploadPurpose('gallery/thumbnails', ('image',), 'admin'),
+    'learning_material': UploadPurpose('learning_materials', ('image', 'video', 'raw'), 'admin'),
+    'course_video': UploadPurpose('course_videos', ('video',), 'admin'),
+    # Receipts are a photo or a PDF; the small cap keeps anonymous uploads from filling the spool
+    # disk or the Cloudinary account
+    'monthly_payment': UploadPurpose('monthly_payments', ('auto',), 'user', RECEIPT_MAX_SIZE, RECEIPT_FORMATS),
+    # Class and school registration take a receipt before the payer has an account
+    'payment_proof': UploadPurpose('payment_proofs', ('auto',), 'public', RECEIPT_MAX_SIZE, RECEIPT_FORMATS),
+}
+
+
+class ReceivedUpload(NamedTuple):
+    url: str  # final Cloudinary URL, or the placeholder of a queued upload
+    filename: str
+    resource_type: str
+    pending: Optional[PendingUpload]  # the queued upload to attach_upload(), None for direct uploads
+
+
+def _serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+
+
+def _max_age() -> int:
+    return int(current_app.config.get('DIRECT_UPLOAD_MAX_AGE', 6 * 3600))
+
+
+def current_user_id() -> Optional[int]:
+    return current_user.id if current_user and current_user.is_authenticated else None
+
+
+def get_purpose(name: str) -> UploadPurpose:
+    """The purpose called ``name`` if the current user may upload for it"""
+    purpose = UPLOAD_PURPOSES.get(name)
+    if purpose is None:
+        raise UploadError('Unknown upload purpose')
+    if purpose.access != 'public' and current_user_id() is None:
+        raise UploadError('Please log in to upload files')
+    if purpose.access == 'admin' and not getattr(current_user, 'is_admin', False):
+        raise UploadError('Admin privileges required')
+    return purpose
+
+
+def resource_type_for(purpose: UploadPurpose, filename: str) -> str:
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if purpose.formats and ext not in purpose.formats:
+        raise UploadError(f"File type not allowed; use {', '.join(purpose.formats)}")
+    if len(purpose.resource_types) == 1:
+        return purpose.resource_types[0]
+    if ext in IMAGE_EXTENSIONS and 'image' in purpose.resource_types:
+        return 'image'
+    if ext in VIDEO_EXTENSIONS and 'video' in purpose.resource_types:
+        return 'video'
+    if 'raw' in purpose.resource_types:
+        return 'raw'
+    raise UploadError('File type not allowed')
+
+
+def sign_upload(purpose_name: str, filename: str) -> Dict[str, Any]:
+    """Signed Cloudinary upload parameters and the ticket to complete them with"""
+    purpose = get_purpose(purpose_name)
+    if not get_storage().direct_uploads or not CloudinaryService.is_available():
+        raise UploadUnavailable('Files are not stored on Cloudinary')
+    if not current_app.config.get('DIRECT_UPLOADS', True):
+        raise UploadUnavailable('Direct uploads are turned off')
+
+    filename = secure_filename(filename or '') or 'upload'
+    resource_type = resource_type_for(purpose, filename)
+    stem, ext = os.path.splitext(filename)
+    # Cloudinary keeps the extension as part of a raw file's public ID
+    public_id = f"{purpose.folder}/{stem[:60]}_{secrets.token_hex(8)}{ext if resource_type == 'raw' else ''}"
+    upload_params = {'public_id': public_id, 'timestamp': int(time.time())}
+    if purpose.formats:
+        # Signed, so Cloudinary itself refuses any other format whatever the browser claims
+        upload_params['allowed_formats'] = ','.join(purpose.formats)
+    params = CloudinaryService.sign_upload_params(upload_params)
+    ticket = _serializer().dumps({
+        'purpose': purpose_name,
+        'public_id': public_id,
+        'resource_type': resource_type,
+        'filename': filename,
+        'user': current_user_id(),
+    }, salt=_TICKET_SALT)
+    return {
+        'upload_url': CloudinaryService.upload_url(resource_type),
+        'params': params,
+        'ticket': ticket,
+    }
+
+
+def issue_upload_token(purpose_name: str, filename: str, resource_type: str, url: Optional[str] = None,
+                       pending_upload_id: Optional[int] = None) -> str:
+    """Token a form submits as ``<field>_upload``: a finished upload's ``url``, or a staged PendingUpload"""
+    return _serializer().dumps({
+        'purpose': purpose_name,
+        'url': url,
+        'pending': pending_upload_id,
+        'filename': filename,
+        'resource_type': resource_type,
+        'user': current_user_id(),
+    }, salt=_TOKEN_SALT)
+
+
+def complete_upload(ticket: str, response: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Check Cloudinary's upload ``response`` against ``ticket``; returns the
+    upload token for the form and the uploaded file's URL.
+    """
+    try:
+        signed = _serializer().loads(ticket, salt=_TICKET_SALT, max_age=_max_age())
+    except (BadSignature, SignatureExpired):
+        raise UploadError('Upload ticket is invalid or expired')
+    if signed['user'] != current_user_id():
+        raise UploadError('Upload ticket belongs to another user')
+
+    public_id = response.get('public_id')
+    version = response.get('version')
+    resource_type = response.get('resource_type')
+    if public_id != signed['public_id']:
+        raise UploadError('Uploaded file does not match the signed upload')
+    if signed['resource_type'] not in ('auto', resource_type) or resource_type not in ('image', 'video', 'raw'):
+        raise UploadError('Uploaded file has the wrong type')
+    if not CloudinaryService.verify_upload_response(public_id, version, response.get('signature') or ''):
+        raise UploadError('Cloudinary response signature is invalid')
+    purpose = UPLOAD_PURPOSES[signed['purpose']]
+    size = response.get('bytes')
+    problem = None
+    if purpose.formats and resource_type == 'video':
+        problem = 'Uploaded file has the wrong type'
+    elif purpose.max_size and not isinstance(size, int):
+        problem = 'Upload response is missing the file size'
+    elif purpose.max_size and size > purpose.max_size:
+        problem = f'File is larger than {purpose.max_size // 1024 ** 2}MB'
+    if problem:
+        # The file is already stored; don't keep what the form will never use
+        CloudinaryService.delete_file(public_id, resource_type=resource_type)
+        raise UploadError(problem)
+
+    # Only the public ID and version are signed, so the URL is rebuilt rather than taken from the browser
+    url = cloudinary.utils.cloudinary_url(public_id, resource_type=resource_type, type='upload',
+                                          version=version, secure=True)[0]
+    extension = str(response.get('format') or '')
+    if resource_type != 'raw' and re.fullmatch(r'[A-Za-z0-9]{1,10}', extension):
+        url = f"{url}.{extension}"
+
+    return issue_upload_token(signed['purpose'], signed['filename'], resource_type, url=url), url
+
+
+def receive_upload(field: str, purpose_name: str) -> Optional[ReceivedUpload]:
+    """
+    The file a form posted as ``field``: a direct upload token in
+    ``<field>_upload``, or else the file itself, queued for storage in
+    ``purpose_name``'s folder. None when neither was sent. Raises
+    UploadError for a bad token or a file that could not be queued.
+    """
+    purpose = get_purpose(purpose_name)
+    token = request.form.get(f'{field}_upload', '').strip()
+    if token:
+        try:
+            data = _serializer().loads(token, salt=_TOKEN_SALT, max_age=_max_age())
+        except (BadSignature, SignatureExpired):
+            raise UploadError('Upload token is invalid or expired')
+        if data['purpose'] != purpose_name or data['user'] != current_user_id():
+            raise UploadError('Upload token does not belong to this form')
+        if not data.get('pending'):
+            return ReceivedUpload(data['url'], data['filename'], data['resource_type'], None)
+        upload = db.session.get(PendingUpload, data['pending'])
+        if upload is None or upload.status == 'failed':
+            raise UploadError('The uploaded file is no longer available')
+        release_upload(upload)
+        url = upload.url if upload.status == 'done' and upload.url else upload.placeholder
+        return ReceivedUpload(url, data['filename'], data['resource_type'], upload)
+
+    file = request.files.get(field)
+    if not file or not file.filename:
+        return None
+    resource_type = resource_type_for(purpose, file.filename)
+    upload = queue_upload(file, folder=purpose.folder, resource_type=resource_type)
+    return ReceivedUpload(upload.placeholder, file.filename, resource_type, upload)
@@ -0,0 +1,106 @@
+"""
+Cached HTML fragments for the public homepage.
+
+The gallery, videos and victories sections are the same for every visitor and
+only change when an admin edits the gallery, victories or projects. They are
+rendered once per worker, kept in a VersionedCache and re-rendered after
+``invalidate_home_sections()`` is called from those admin routes.
+"""
+from __future__ import annotations
+from typing import Dict
+
+from flask import current_app, render_template
+from markupsafe import Markup
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import selectinload
+
+from ..extensions import db
+from ..models import HomeGallery, StudentVictory, StudentProject
+from .cache import VersionedCache
+from .upload_queue import on_complete
+
+
+def _load_gallery():
+    gallery = {'gallery_images': [], 'gallery_videos': []}
+    try:
+        for media_type, limit in (('image', 12), ('video', 8)):
+            gallery[f'gallery_{media_type}s'] = HomeGallery.query.options(
+                selectinload(HomeGallery.source_project).selectinload(StudentProject.student)
+            ).filter_by(
+                is_active=True,
+                media_type=media_type
+            ).order_by(HomeGallery.display_order.asc(), HomeGallery.created_at.desc()).limit(limit).all()
+    except Exception as e:
+        # Table doesn't exist yet, rollback and continue with empty lists
+        db.session.rollback()
+        current_app.logger.warning(f"HomeGallery table may not exist: {e}")
+    return gallery
+
+
+def _load_victories():
+    try:
+        return StudentVictory.query.options(selectinload(StudentVictory.student)).filter_by(is_active=True).order_by(
+            StudentVictory.display_order.asc(),
+            StudentVictory.achievement_date.desc()
+        ).limit(6).all()
+    except ProgrammingError as pe:
+        db.session.rollback()
+        if 'profile_picture' in str(pe):
+            current_app.logger.warning("profile_picture column missing. Please run migration: /admin/add-profile-picture-column")
+        else:
+            current_app.logger.warning(f"StudentVictory query error: {pe}")
+    except Exception as e:
+        # Table doesn't exist yet, or other error, rollback and continue with empty list
+        db.session.rollback()
+        current_app.logger.warning(f"StudentVictory query error: {e}")
+    return []
+
+
+def _load_projects():
+    # Projects with images/videos are the fallback when the gallery is empty
+    projects = {'projects_with_images': [], 'projects_with_videos': []}
+    try:
+        for key, column, limit in (('projects_with_images', StudentProject.image_url, 12),
+                                   ('projects_with_videos', StudentProject.youtube_url, 8)):
+            projects[key] = StudentProject.query.options(selectinload(StudentProject.student)).filter(
+                StudentProject.is_active == True,
+                column.isnot(None),
+                column != ''
+            ).order_by(StudentProject.created_at.desc()).limit(limit).all()
+    except Exception as e:
+        # Rollback and continue with empty lists
+        db.session.rollback()
+        current_app.logger.warning(f"Error fetching student projects: {e}")
+    return projects
+
+
+def render_home_sections() -> Dict[str, Markup]:
+    """Query the homepage content and render the gallery, videos and victories fragments"""
+    db.session.rollback()  # Ensure clean transaction state
+    context = {}
+    context.update(_load_gallery())
+    context.update(_load_projects())
+    context['victories'] = _load_victories()
+    return {
+        'gallery': Markup(render_template('partials/home_gallery.html', **context)),
+        'videos': Markup(render_template('partials/home_videos.html', **context)),
+        'victories': Markup(render_template('partials/home_victories.html', getattr=getattr, **context)),
+    }
+
+
+_home_sections_cache = VersionedCache('home_sections', render_home_sections, ttl_config_key='HOMEPAGE_CACHE_TTL',
+                                      default_ttl=600)
+
+
+def get_home_sections() -> Dict[str, Markup]:
+    """Return the cached homepage fragments, rendering them if needed"""
+    return _home_sections_cache.get()
+
+
+def invalidate_home_sections() -> None:
+    """Mark the homepage fragments stale for every worker; call before the admin change is committed"""
+    _home_sections_cache.invalidate()
+
+
+# Gallery files uploaded in the background change the cached fragments when their URL is swapped in
+on_complete('home_gallery', invalidate_home_sections)
@@ -0,0 +1,182 @@
+"""
+Allocation of human-readable system IDs.
+
+Sequential IDs (STU-00001, FAM-00001) come from a PostgreSQL sequence, or on
+other databases from a row in ``id_counter`` that is incremented with an
+UPDATE, which holds the row (SQLite: database) write lock until the caller
+commits. Either way a new ID costs one statement instead of a scan of every
+existing ID. The ``add_id_sequences`` migration seeds both from current data;
+a counter that is missing anyway, or a sequence that is missing or behind
+the existing IDs, is seeded the first time a worker uses it.
+
+Random IDs (GRO-8KD29A, SCH-9F3A21) are drawn in batches: every candidate is
+checked with a single IN query and the first free one is used. Rows whose
+ID column is unique can be inserted with ``add_with_random_id()``, which
+retries with a fresh ID if a concurrent insert took it first.
+"""
+from __future__ import annotations
+import secrets
+import string
+from typing import Iterable, Optional
+
+from sqlalchemy import event, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+
+# kind -> (prefix, PostgreSQL sequence name)
+SEQUENTIAL_IDS = {
+    'student': ('STU', 'student_system_id_seq'),
+    'family': ('FAM', 'family_system_id_seq'),
+}
+
+# Random-ID alphabet without the look-alikes 0/O and 1/I
+READABLE_ALPHABET = ''.join(c for c in string.ascii_uppercase + string.digits if c not in '0O1I')
+
+# Sequences known to exist and be seeded; a check only counts once its transaction commits
+_ready_sequences = set()
+_CHECKED_KEY = 'id_allocator_checked_sequences'
+
+
+def _id_column(kind: str):
+    from ..models import User, ClassEnrollment
+    return User.student_id if kind == 'student' else ClassEnrollment.family_system_id
+
+
+def max_id_number(values: Iterable[Optional[str]], prefix: str) -> int:
+    """Highest number among IDs shaped ``<prefix>-<digits>``; other values are ignored"""
+    highest = 0
+    for value in values:
+        if not value or not value.startswith(f'{prefix}-'):
+            continue
+        number = value[len(prefix) + 1:]
+        if number.isdigit():
+            highest = max(highest, int(number))
+    return highest
+
+
+def _current_max(kind: str) -> int:
+    prefix, _ = SEQUENTIAL_IDS[kind]
+    column = _id_column(kind)
+    rows = db.session.execute(select(column).where(column.like(f'{prefix}-%'))).scalars()
+    return max_id_number(rows, prefix)
+
+
+def _ensure_sequence(kind: str, sequence: str) -> None:
+    """Create the sequence if it is missing and move it past the highest existing ID"""
+    if sequence in _ready_sequences or sequence in db.session.info.get(_CHECKED_KEY, ()):
+        return
+    exists = db.session.execute(text('SELECT to_regclass(CAST(:name AS text))'), {'name': sequence}).scalar()
+    if exists:
+        last_value, is_called = db.session.execute(text(f'SELECT last_value, is_called FROM {sequence}')).one()
+        upcoming = last_value + 1 if is_called else last_value
+    else:
+        db.session.execute(text(f'CREATE SEQUENCE IF NOT EXISTS {sequence}'))
+        upcoming = 1
+    current = _current_max(kind)
+    if upcoming <= current:
+        # setval(..., false) makes the next nextval() return exactly current + 1
+        db.session.execute(text('SELECT setval(CAST(:name AS regclass), :value, false)'),
+                           {'name': sequence, 'value': current + 1})
+    db.session.info.setdefault(_CHECKED_KEY, set()).add(sequence)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _remember_sequences(session):
+    _ready_sequences.update(session.info.pop(_CHECKED_KEY, ()))
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_sequences(session, transaction):
+    # A rollback also undoes a CREATE SEQUENCE, so check again in the next transaction
+    if transaction.parent is None:
+        session.info.pop(_CHECKED_KEY, None)
+
+
+def _next_from_counter(kind: str) -> int:
+    from ..models import IdCounter
+    bump = update(IdCounter).where(IdCounter.name == kind).values(value=IdCounter.value + 1)
+    if db.session.execute(bump).rowcount == 0:
+        # First use without the migration: seed the counter from existing IDs
+        try:
+            with db.session.begin_nested():
+                db.session.add(IdCounter(name=kind, value=_current_max(kind) + 1))
+        except IntegrityError:
+            # Another request seeded it first
+            db.session.execute(bump)
+    return db.session.execute(select(IdCounter.value).where(IdCounter.name == kind)).scalar_one()
+
+
+def next_number(kind: str) -> int:
+    """Reserve the next number for ``kind`` ('student' or 'family')"""
+    _, sequence = SEQUENTIAL_IDS[kind]
+    if db.engine.dialect.name == 'postgresql':
+        _ensure_sequence(kind, sequence)
+        return db.session.execute(select(db.Sequence(sequence).next_value())).scalar_one()
+    return _next_from_counter(kind)
+
+
+def next_sequential_id(kind: str) -> str:
+    """Allocate the next ``STU-xxxxx`` / ``FAM-xxxxx`` ID"""
+    prefix, _ = SEQUENTIAL_IDS[kind]
+    column = _id_column(kind)
+    while True:
+        system_id = f"{prefix}-{next_number(kind):05d}"
+        # IDs edited by hand can sit ahead of the counter; skip over them
+        if db.session.execute(select(column).where(column == system_id).limit(1)).first() is None:
+            return system_id
+
+
+def sync_sequential_id(kind: str) -> None:
+    """Realign the counter with the highest existing ID, e.g. after IDs were renumbered"""
+    from ..models import IdCounter
+    _, sequence = SEQUENTIAL_IDS[kind]
+    current = _current_max(kind)
+    if db.engine.dialect.name == 'postgresql':
+        _ensure_sequence(kind, sequence)
+        # setval(..., false) makes the next nextval() return exactly current + 1
+        db.session.execute(text('SELECT setval(CAST(:name AS regclass), :value, false)'), {'name': sequence, 'value': current + 1})
+        return
+    counter = db.session.get(IdCounter, kind)
+    if counter:
+        counter.value = current
+    else:
+        db.session.add(IdCounter(name=kind, value=current))
+
+
+def random_system_id(prefix: str, column, length: int = 6, alphabet: str = READABLE_ALPHABET,
+                     batch: int = 8) -> str:
+    """
+    Return an unused ``<prefix>-<random code>`` for ``column``, checking a
+    whole batch of candidates per query (one round trip in practice).
+    """
+    while True:
+        candidates = list(dict.fromkeys(
+            f"{prefix}-{''.join(secrets.choice(alphabet) for _ in range(length))}" for _ in range(batch)
+        ))
+        taken = set(db.session.execute(select(column).where(column.in_(candidates))).scalars())
+        for candidate in candidates:
+            if candidate not in taken:
+                return candidate
+
+
+def add_with_random_id(instance, attribute: str, prefix: str, column, attempts: int = 5, **options) -> str:
+    """
+    Give ``instance`` a random ID, add it and flush inside a savepoint. The
+    column's unique constraint catches a concurrent request that picked the
+    same ID; the insert (or, for a row that already exists, the update) is
+    then retried with a new one.
+    """
+    for attempt in range(attempts):
+        system_id = random_system_id(prefix, column, **options)
+        try:
+            with db.session.begin_nested():
+                # Set inside the savepoint: begin_nested() flushes pending changes before it starts
+                setattr(instance, attribute, system_id)
+                db.session.add(instance)
+                db.session.flush()
+            return system_id
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+    return system_id
@@ -0,0 +1,134 @@
+"""
+Width-bounded image variants and the template helpers that use them.
+
+Gallery images, project photos, ID photos and profile pictures used to be
+sent at full upload size, even into 150px avatars and homepage grid tiles.
+``image_variants()`` maps a stored image URL to copies bounded to each
+IMAGE_VARIANT_WIDTHS width:
+
+* Cloudinary images get transformation URLs from
+  ``CloudinaryService.get_cloudinary_url`` (``c_limit`` so small images
+  aren't upscaled, with automatic format and quality). Cloudinary derives
+  each one on first request and keeps it on its CDN.
+* Local images (storage.py) get the copies LocalStorage made when the
+  file was stored, as recorded in its metadata.
+
+Other URLs (external links, queued uploads' placeholders, images that
+already carry a transformation) have no variants and render as before.
+
+Templates use ``responsive_image(url, width, sizes)`` for the ``src``,
+``srcset`` and ``sizes`` attributes of an ``<img>``. ``image_variant(url,
+width)`` gives one URL, e.g. for a PDF, and ``image_srcset(url)`` gives
+just the ``srcset`` value.
+"""
+from __future__ import annotations
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote
+
+from flask import current_app
+from markupsafe import Markup
+
+from .cloudinary_service import CloudinaryService
+from .storage import DEFAULT_VARIANT_WIDTHS, local_storage
+
+VARIANT_CACHE_SIZE = 4096
+
+_CLOUDINARY_IMAGE = re.compile(r'^https?://res\.cloudinary\.com/(?P<cloud>[^/]+)/image/upload/(?P<path>[^?#]+)$')
+_TRANSFORMATION = re.compile(r'^[a-z]{1,3}_[^,/]+(,[a-z]{1,3}_[^,/]+)*$')
+_VERSION = re.compile(r'^v\d+$')
+
+_variant_cache: Dict[Tuple[str, Tuple[int, ...]], Dict[int, str]] = {}
+_variant_lock = threading.Lock()
+
+
+def _widths() -> Tuple[int, ...]:
+    return tuple(sorted(current_app.config.get('IMAGE_VARIANT_WIDTHS', DEFAULT_VARIANT_WIDTHS)))
+
+
+def _cloudinary_variants(url: str, widths: Tuple[int, ...]) -> Dict[int, str]:
+    match = _CLOUDINARY_IMAGE.match(url)
+    if not match:
+        return {}
+    segments = match.group('path').split('/')
+    if len(segments) > 1 and _TRANSFORMATION.match(segments[0]):
+        # Already transformed (cropped, resized...); bounding it again could undo that
+        return {}
+    version = segments.pop(0)[1:] if len(segments) > 1 and _VERSION.match(segments[0]) else None
+    public_id, ext = os.path.splitext('/'.join(segments))
+    variants = {}
+    for width in widths:
+        variant = CloudinaryService.get_cloudinary_url(
+            public_id, width=width, crop='limit', quality='auto', fetch_format='auto',
+            version=version, format=ext.lstrip('.') or None, cloud_name=match.group('cloud'), secure=True,
+        )
+        if variant:
+            variants[width] = variant
+    return variants
+
+
+def _local_variants(url: str) -> Dict[int, str]:
+    storage = local_storage()
+    if not url.startswith(storage.url_prefix):
+        return {}
+    metadata = storage.metadata(unquote(url[len(storage.url_prefix):]))
+    if not metadata or not metadata.get('variants'):
+        return {}
+    variants = {int(width): storage.get_url(key) for width, key in metadata['variants'].items()}
+    # The original is the widest candidate
+    variants[int(metadata['width'])] = url
+    return variants
+
+
+def image_variants(url: Optional[str]) -> Dict[int, str]:
+    """Width -> URL of each bounded copy of the image at ``url``; empty when it has none"""
+    if not url:
+        return {}
+    widths = _widths()
+    cache_key = (url, widths)
+    with _variant_lock:
+        cached = _variant_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    variants = _cloudinary_variants(url, widths) or _local_variants(url)
+    with _variant_lock:
+        if len(_variant_cache) >= VARIANT_CACHE_SIZE:
+            _variant_cache.clear()
+        _variant_cache[cache_key] = variants
+    return variants
+
+
+def image_variant(url: Optional[str], width: int) -> Optional[str]:
+    """The narrowest copy at least ``width`` pixels wide, or ``url`` itself"""
+    variants = image_variants(url)
+    for candidate in sorted(variants):
+        if candidate >= width:
+            return variants[candidate]
+    return url
+
+
+def image_srcset(url: Optional[str]) -> str:
+    """A ``srcset`` value listing every copy of the image, '' when it has none"""
+    return ', '.join(f"{variant} {width}w" for width, variant in sorted(image_variants(url).items()))
+
+
+def responsive_image(url: Optional[str], width: int, sizes: Optional[str] = None) -> Markup:
+    """
+    ``src``, ``srcset`` and ``sizes`` attributes for an ``<img>``. ``width``
+    is the widest the image is shown, in CSS pixels; it picks the ``src``
+    and is the default ``sizes``.
+    """
+    attrs = Markup('src="{}"').format(image_variant(url, width) or '')
+    srcset = image_srcset(url)
+    if srcset:
+        attrs += Markup(' srcset="{}" sizes="{}"').format(srcset, sizes or f"{width}px")
+    return attrs
+
+
+def init_app(app) -> None:
+    """Make the helpers available to every template"""
+    app.add_template_global(responsive_image)
+    app.add_template_global(image_variant)
+    app.add_template_global(image_srcset)
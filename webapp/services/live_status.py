@@ -0,0 +1,146 @@
+"""
+Live-class status for dashboard polling.
+
+``live_class_status()`` answers "is one of these enrollments in a live class
+right now" without the rest of the dashboard. The answer for each enrollment
+is cached in this worker until the next moment any of its slots starts or
+ends (capped at LIVE_STATUS_CACHE_MAX_AGE seconds), so a poll between
+boundaries costs the caller's enrollment lookup plus one query for the
+student's current time selections, which are part of the cache key: booking
+or removing a slot never has to write anything to reach other workers. The
+cache is reset on every worker when the schedule is rebuilt.
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app
+
+from ..extensions import db
+from ..models import ClassEnrollment, ClassTime, GroupClass, IndividualClass, StudentClassTimeSelection
+from .class_schedule import live_status_cache, schedule_state
+
+SELECTABLE_CLASS_TYPES = ('individual', 'family')
+MAX_ENTRIES = 5000
+
+
+def _candidate_times(enrollments: List[ClassEnrollment], include_general: bool) -> Dict[int, List[ClassTime]]:
+    """
+    Slots that can make each enrollment live, in dashboard order: the
+    student's own selections for Individual/Family, the class's fixed slots
+    for Group/School (plus the type-wide slots without a class when
+    ``include_general``, as on the school-student dashboard).
+    """
+    candidates = {e.id: [] for e in enrollments}
+    selectable = [e for e in enrollments if e.class_type in SELECTABLE_CLASS_TYPES]
+    fixed = [e for e in enrollments if e.class_type not in SELECTABLE_CLASS_TYPES]
+
+    if selectable:
+        by_id = {e.id: e for e in selectable}
+        rows = db.session.query(StudentClassTimeSelection.enrollment_id, ClassTime) \
+            .join(ClassTime, ClassTime.id == StudentClassTimeSelection.class_time_id) \
+            .filter(StudentClassTimeSelection.enrollment_id.in_(by_id)) \
+            .order_by(StudentClassTimeSelection.selected_at).all()
+        for enrollment_id, class_time in rows:
+            if class_time.class_id is None or class_time.class_id == by_id[enrollment_id].class_id:
+                candidates[enrollment_id].append(class_time)
+
+    if fixed:
+        times = ClassTime.query.filter(
+            ClassTime.class_type.in_({e.class_type for e in fixed}),
+            ClassTime.is_active == True
+        ).order_by(ClassTime.day, ClassTime.start_time).all()
+        for enrollment in fixed:
+            candidates[enrollment.id] = [
+                t for t in times if t.class_type == enrollment.class_type and
+                (t.class_id == enrollment.class_id or (include_general and t.class_id is None))
+            ]
+    return candidates
+
+
+def _class_names(enrollments: List[ClassEnrollment]) -> Dict[int, Optional[str]]:
+    """Class name per enrollment, or None when the class is gone or a GroupClass of another type"""
+    class_ids = {e.class_id for e in enrollments}
+    groups = {row.id: row for row in db.session.query(GroupClass.id, GroupClass.name, GroupClass.class_type)
+              .filter(GroupClass.id.in_(class_ids))}
+    individuals = dict(db.session.query(IndividualClass.id, IndividualClass.name)
+                       .filter(IndividualClass.id.in_(class_ids)))
+    names = {}
+    for enrollment in enrollments:
+        group = groups.get(enrollment.class_id)
+        if group:
+            names[enrollment.id] = group.name if group.class_type == enrollment.class_type else None
+        else:
+            names[enrollment.id] = individuals.get(enrollment.class_id)
+    return names
+
+
+def _compute(enrollments: List[ClassEnrollment], timezone: str, include_general: bool,
+             now: datetime) -> Dict[int, dict]:
+    """Fresh cache entries ``{'live': payload or None, 'expires_at'}`` for ``enrollments``"""
+    candidates = _candidate_times(enrollments, include_general)
+    max_age = timedelta(seconds=int(current_app.config.get('LIVE_STATUS_CACHE_MAX_AGE', 300)))
+    names = None
+    entries = {}
+    for enrollment in enrollments:
+        times = candidates[enrollment.id]
+        live_ids, next_change = schedule_state((t.id for t in times), now)
+        live = None
+        live_time = next((t for t in times if t.id in live_ids), None)
+        if live_time:
+            if names is None:
+                names = _class_names(enrollments)
+            if names.get(enrollment.id):
+                live = {
+                    'enrollment_id': enrollment.id,
+                    'class_type': enrollment.class_type,
+                    'class_id': enrollment.class_id,
+                    'class_name': names[enrollment.id],
+                    'class_time_id': live_time.id,
+                    'day': live_time.day,
+                    'display_time': live_time.get_display_time(timezone),
+                }
+        expires_at = now + max_age
+        if next_change and next_change < expires_at:
+            expires_at = next_change
+        entries[enrollment.id] = {'live': live, 'expires_at': expires_at}
+    return entries
+
+
+def live_class_status(enrollments: Iterable[ClassEnrollment], timezone: str = 'Asia/Kolkata',
+                      include_general: bool = False, now: Optional[datetime] = None) -> dict:
+    """
+    ``{'live', 'live_class', 'next_change_at'}`` for the first of
+    ``enrollments`` with a class in progress. ``next_change_at`` (naive
+    UTC) is when the answer may next change; clients can poll then.
+    """
+    now = now or datetime.utcnow()
+    enrollments = list(enrollments)
+    cache = live_status_cache.get()
+
+    selected = {}
+    selectable_ids = [e.id for e in enrollments if e.class_type in SELECTABLE_CLASS_TYPES]
+    if selectable_ids:
+        for enrollment_id, class_time_id in db.session.query(
+                StudentClassTimeSelection.enrollment_id, StudentClassTimeSelection.class_time_id
+        ).filter(StudentClassTimeSelection.enrollment_id.in_(selectable_ids)):
+            selected.setdefault(enrollment_id, set()).add(class_time_id)
+    keys = {e.id: (e.id, timezone, include_general, frozenset(selected.get(e.id, ()))) for e in enrollments}
+
+    stale = [e for e in enrollments if keys[e.id] not in cache or cache[keys[e.id]]['expires_at'] <= now]
+    if stale:
+        if len(cache) > MAX_ENTRIES:
+            for cache_key in [k for k, entry in cache.items() if entry['expires_at'] <= now]:
+                cache.pop(cache_key, None)
+        for enrollment_id, entry in _compute(stale, timezone, include_general, now).items():
+            cache[keys[enrollment_id]] = entry
+
+    live_class = None
+    next_change_at = None
+    for enrollment in enrollments:
+        entry = cache[keys[enrollment.id]]
+        if next_change_at is None or entry['expires_at'] < next_change_at:
+            next_change_at = entry['expires_at']
+        if live_class is None and entry['live']:
+            live_class = entry['live']
+    return {'live': live_class is not None, 'live_class': live_class, 'next_change_at': next_change_at}
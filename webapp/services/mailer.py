@@ -3,6 +3,8 @@ import smtplib
 from email.message import EmailMessage
 from flask import current_app
 
+from .perf import track
+
 
 def send_bulk_email(users: Iterable, subject: str, message: str) -> int:
     """Send plain-text emails to a list of user-like objects with an email attribute.
@@ -20,29 +22,30 @@ def send_bulk_email(users: Iterable, subject: str, message: str) -> int:
 
     sent_count = 0
     try:
-        server = smtplib.SMTP(smtp_host, smtp_port, timeout=20)
-        if use_tls:
-            server.starttls()
-        server.login(username, password)
+        with track('smtp'):
+            server = smtplib.SMTP(smtp_host, smtp_port, timeout=20)
+            if use_tls:
+                server.starttls()
+            server.login(username, password)
 
-        for u in users:
-            recipient = getattr(u, 'email', None)
-            if not recipient:
-                continue
+            for u in users:
+                recipient = getattr(u, 'email', None)
+                if not recipient:
+                    continue
+                try:
+                    msg = EmailMessage()
+                    msg['Subject'] = subject
+                    msg['From'] = default_sender
+                    msg['To'] = recipient
+                    msg.set_content(message)
+                    server.send_message(msg)
+                    sent_count += 1
+                except Exception:
+                    continue
             try:
-                msg = EmailMessage()
-                msg['Subject'] = subject
-                msg['From'] = default_sender
-                msg['To'] = recipient
-                msg.set_content(message)
-                server.send_message(msg)
-                sent_count += 1
+                server.quit()
             except Exception:
-                continue
-        try:
-            server.quit()
-        except Exception:
-            pass
+                pass
     except Exception:
         return 0
     return sent_count
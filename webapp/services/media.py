@@ -0,0 +1,167 @@
+"""
+Serving stored media files.
+
+``send_stored_file()`` answers conditional and byte-range requests itself.
+Seeking in a video, or resuming a PDF, fetches just the span asked for, and
+revalidating a cached copy costs a 304. The file goes to the server as an
+open descriptor positioned at the range start. gunicorn's file wrapper
+hands it to ``sendfile()`` for exactly Content-Length bytes, so the bytes
+never pass through Python. Servers without a file wrapper get the span
+read a buffer at a time.
+
+With STORAGE_SENDFILE set to 'x-sendfile' or 'x-accel-redirect' the
+response only names the file. The front server (Apache/lighttpd or nginx)
+then sends it, ranges and revalidation included.
+
+Course files need a purchase, and a video player sends a burst of range
+requests for every seek. ``has_media_grant()`` / ``grant_media()`` remember
+in the session which files the logged-in user was allowed to fetch, for
+MEDIA_GRANT_TTL seconds. Only the first request for a file loads the user
+and checks the database.
+"""
+from __future__ import annotations
+import os
+import time
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from flask import current_app, request, session
+from werkzeug.datastructures import ContentRange
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified
+from werkzeug.utils import send_file
+
+from .storage import COPY_BUFFER_SIZE, StoredFile
+
+_GRANTS_KEY = 'media_grants'
+MAX_GRANTS = 32
+
+
+def has_media_grant(key: str) -> bool:
+    """Whether the logged-in user was allowed ``key`` within MEDIA_GRANT_TTL"""
+    grants = session.get(_GRANTS_KEY)
+    user_id = session.get('_user_id')
+    if not grants or user_id is None or grants.get('user') != user_id:
+        return False
+    return grants.get('files', {}).get(key, 0) > time.time()
+
+
+def grant_media(key: str) -> None:
+    """Remember that the logged-in user may fetch ``key``"""
+    user_id = session.get('_user_id')
+    if user_id is None:
+        return
+    now = time.time()
+    grants = session.get(_GRANTS_KEY)
+    files = dict(grants['files']) if grants and grants.get('user') == user_id else {}
+    files = {name: expires for name, expires in files.items() if expires > now}
+    files[key] = now + int(current_app.config.get('MEDIA_GRANT_TTL', 3600))
+    if len(files) > MAX_GRANTS:
+        # The session is a cookie; keep the grants that last longest
+        files = dict(sorted(files.items(), key=lambda item: item[1])[-MAX_GRANTS:])
+    session[_GRANTS_KEY] = {'user': user_id, 'files': files}
+
+
+def _accel_uri(path: str) -> Optional[str]:
+    root = os.path.abspath(current_app.config.get('STORAGE_SENDFILE_ROOT') or os.path.dirname(current_app.root_path))
+    relative = os.path.relpath(path, root)
+    if relative.startswith(os.pardir):
+        return None
+    prefix = (current_app.config.get('STORAGE_ACCEL_PREFIX') or '/_protected/').rstrip('/') + '/'
+    return prefix + quote(relative.replace(os.sep, '/'))
+
+
+def _requested_range(stored: StoredFile) -> Optional[Tuple[int, int]]:
+    """The single byte range to send, or None for the whole file. Raises 416 for an unsatisfiable one."""
+    requested = request.range
+    if requested is None or requested.units != 'bytes' or len(requested.ranges) != 1:
+        return None
+    # An If-Range that no longer matches means the client's partial copy is stale
+    if 'If-Range' in request.headers and is_resource_modified(
+            request.environ, etag=stored.etag, last_modified=_last_modified(stored), ignore_if_range=False):
+        return None
+    span = requested.range_for_length(stored.size)
+    if span is None:
+        raise RequestedRangeNotSatisfiable(length=stored.size)
+    return span
+
+
+def _last_modified(stored: StoredFile) -> datetime:
+    return datetime.fromtimestamp(int(stored.mtime), timezone.utc)
+
+
+def _read_span(file, length: int) -> Iterator[bytes]:
+    try:
+        while length > 0:
+            block = file.read(min(COPY_BUFFER_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def _set_validators(response, stored: StoredFile, max_age: Optional[int], private: bool) -> None:
+    response.set_etag(stored.etag)
+    response.last_modified = _last_modified(stored)
+    response.accept_ranges = 'bytes'
+    if max_age:
+        response.cache_control.max_age = max_age
+        response.cache_control.no_cache = None
+    else:
+        response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    elif max_age:
+        response.cache_control.public = True
+
+
+def send_stored_file(stored: StoredFile, max_age: Optional[int] = None, private: bool = False):
+    """
+    Respond with ``stored``, honouring If-None-Match / If-Modified-Since,
+    Range and If-Range. ``private`` keeps shared caches from storing it.
+    """
+    mode = (current_app.config.get('STORAGE_SENDFILE') or '').lower()
+    accel_uri = _accel_uri(stored.path) if mode == 'x-accel-redirect' else None
+    offload = mode == 'x-sendfile' or accel_uri is not None
+
+    if not offload and not is_resource_modified(request.environ, etag=stored.etag,
+                                                last_modified=_last_modified(stored)):
+        response = current_app.response_class(status=304)
+        _set_validators(response, stored, max_age, private)
+        return response
+
+    span = None if offload else _requested_range(stored)
+    file = None
+    if not offload:
+        file = open(stored.path, 'rb')
+        if span is not None:
+            file.seek(span[0])
+
+    response = send_file(
+        stored.path if file is None else file,
+        request.environ,
+        mimetype=stored.mime_type,
+        download_name=stored.filename,
+        conditional=False,
+        use_x_sendfile=offload,
+        response_class=current_app.response_class,
+    )
+    _set_validators(response, stored, max_age, private)
+    if accel_uri is not None:
+        del response.headers['X-Sendfile']
+        response.headers['X-Accel-Redirect'] = accel_uri
+    if offload:
+        return response
+
+    start, stop = span if span is not None else (0, stored.size)
+    response.content_length = stop - start
+    if span is not None:
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, stored.size)
+    if 'wsgi.file_wrapper' not in request.environ:
+        # werkzeug's fallback wrapper would read on to the end of the file
+        response.response = _read_span(file, stop - start)
+    return response
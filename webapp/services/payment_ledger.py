@@ -0,0 +1,189 @@
+"""
+Monthly payment ledger for class enrollments.
+
+Every completed enrollment owes one receipt per calendar month from the
+month it was enrolled in. The ledger lays those months out with a status
+each: ``paid`` (the enrollment month, or a verified receipt), ``pending``
+(a receipt awaiting review), ``overdue`` (an earlier month with no receipt,
+or only a rejected one) or ``due`` (the current or a coming month that is
+not paid yet).
+
+Receipts for any number of enrollments are read with one statement over the
+(enrollment_id, payment_year, payment_month) index, so the student dashboard
+and the admin arrears report cost the same per enrollment; the report walks
+enrollments in keyset-paginated chunks so it can be streamed as CSV.
+"""
+from __future__ import annotations
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, literal
+
+from ..extensions import db
+from ..models import ClassEnrollment, GroupClass, IndividualClass, MonthlyPayment, User
+
+MONTH_NAMES = ['', 'January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+LEDGER_STATUSES = ('paid', 'pending', 'overdue', 'due')
+CLASS_TYPES = ('individual', 'group', 'family', 'school')
+REPORT_CHUNK_SIZE = 500
+
+# When one month has several receipts (e.g. a rejected one and its re-upload) the best one counts
+_RECEIPT_RANK = {'verified': 3, 'pending': 2, 'rejected': 1}
+
+
+class LedgerMonth(NamedTuple):
+    year: int
+    month: int
+    status: str  # one of LEDGER_STATUSES
+    receipt_status: Optional[str]  # verified, pending, rejected, or None when nothing was uploaded
+    is_enrollment_month: bool
+
+    @property
+    def month_name(self) -> str:
+        return MONTH_NAMES[self.month]
+
+    @property
+    def label(self) -> str:
+        return f"{self.month_name} {self.year}"
+
+
+class EnrollmentLedger(NamedTuple):
+    enrollment_id: int
+    enrolled_at: datetime
+    months: List[LedgerMonth]
+
+    def _with_status(self, status: str) -> List[LedgerMonth]:
+        return [entry for entry in self.months if entry.status == status]
+
+    @property
+    def paid(self) -> List[LedgerMonth]:
+        return self._with_status('paid')
+
+    @property
+    def pending(self) -> List[LedgerMonth]:
+        return self._with_status('pending')
+
+    @property
+    def overdue(self) -> List[LedgerMonth]:
+        return self._with_status('overdue')
+
+
+class ArrearsRow(NamedTuple):
+    enrollment_id: int
+    user_id: int
+    student_name: str
+    student_id: Optional[str]
+    email: Optional[str]
+    class_type: str
+    class_name: str
+    amount: float
+    ledger: EnrollmentLedger
+
+
+def add_months(year: int, month: int, count: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + count
+    return index // 12, index % 12 + 1
+
+
+def receipt_statuses(enrollment_ids: Iterable[int]) -> Dict[int, Dict[Tuple[int, int], str]]:
+    """``{enrollment_id: {(year, month): receipt status}}`` for ``enrollment_ids``, in one query"""
+    ids = set(enrollment_ids)
+    statuses = {enrollment_id: {} for enrollment_id in ids}
+    if not ids:
+        return statuses
+    rows = db.session.query(
+        MonthlyPayment.enrollment_id, MonthlyPayment.payment_year, MonthlyPayment.payment_month,
+        MonthlyPayment.status
+    ).filter(MonthlyPayment.enrollment_id.in_(ids)).all()
+    for enrollment_id, year, month, status in rows:
+        months = statuses[enrollment_id]
+        if _RECEIPT_RANK.get(status, 0) >= _RECEIPT_RANK.get(months.get((year, month)), 0):
+            months[(year, month)] = status
+    return statuses
+
+
+def build_ledger(enrollment_id: int, enrolled_at: Optional[datetime], receipts: Dict[Tuple[int, int], str],
+                 now: datetime, months_ahead: int = 0) -> EnrollmentLedger:
+    """
+    Ledger from the enrollment month through ``months_ahead`` months after
+    ``now``'s month. ``receipts`` is one entry of ``receipt_statuses()``.
+    """
+    enrolled_at = enrolled_at or now
+    first = (enrolled_at.year, enrolled_at.month)
+    current = (now.year, now.month)
+    last = add_months(now.year, now.month, months_ahead)
+
+    months = []
+    year, month = first
+    while (year, month) <= last:
+        receipt = receipts.get((year, month))
+        is_enrollment_month = (year, month) == first
+        if is_enrollment_month or receipt == 'verified':
+            status = 'paid'
+        elif receipt == 'pending':
+            status = 'pending'
+        elif (year, month) < current:
+            status = 'overdue'
+        else:
+            status = 'due'
+        months.append(LedgerMonth(year, month, status, receipt, is_enrollment_month))
+        year, month = add_months(year, month, 1)
+    return EnrollmentLedger(enrollment_id, enrolled_at, months)
+
+
+def enrollment_ledgers(enrollments: Sequence[ClassEnrollment], now: datetime,
+                       months_ahead: int = 0) -> Dict[int, EnrollmentLedger]:
+    """Ledger per enrollment id for ``enrollments``, with one query for all of their receipts"""
+    receipts = receipt_statuses(e.id for e in enrollments)
+    return {e.id: build_ledger(e.id, e.enrolled_at, receipts[e.id], now, months_ahead) for e in enrollments}
+
+
+def _class_name():
+    """Enrollment's class name: a GroupClass of the same type, else the IndividualClass of an individual enrollment"""
+    return func.coalesce(GroupClass.name, IndividualClass.name, literal('Unknown'))
+
+
+def arrears(now: datetime, class_type: Optional[str] = None, overdue_only: bool = True,
+            chunk_size: int = REPORT_CHUNK_SIZE) -> Iterator[ArrearsRow]:
+    """
+    Ledger of every completed enrollment (of ``class_type`` when given),
+    oldest enrollment first; with ``overdue_only`` only those behind on at
+    least one month. Enrollments are read ``chunk_size`` at a time by id, so
+    the caller can stream rows without the whole table in memory.
+    """
+    last_id = 0
+    while True:
+        query = db.session.query(
+            ClassEnrollment.id, ClassEnrollment.user_id, ClassEnrollment.class_type, ClassEnrollment.amount,
+            ClassEnrollment.enrolled_at, User.first_name, User.last_name, User.student_id, User.email,
+            _class_name().label('class_name')
+        ).join(User, User.id == ClassEnrollment.user_id) \
+            .outerjoin(GroupClass, and_(GroupClass.id == ClassEnrollment.class_id,
+                                        GroupClass.class_type == ClassEnrollment.class_type)) \
+            .outerjoin(IndividualClass, and_(IndividualClass.id == ClassEnrollment.class_id,
+                                             ClassEnrollment.class_type == 'individual')) \
+            .filter(ClassEnrollment.status == 'completed', ClassEnrollment.id > last_id)
+        if class_type:
+            query = query.filter(ClassEnrollment.class_type == class_type)
+        rows = query.order_by(ClassEnrollment.id).limit(chunk_size).all()
+        if not rows:
+            return
+
+        receipts = receipt_statuses(row.id for row in rows)
+        for row in rows:
+            ledger = build_ledger(row.id, row.enrolled_at, receipts[row.id], now)
+            if overdue_only and not ledger.overdue:
+                continue
+            yield ArrearsRow(
+                enrollment_id=row.id,
+                user_id=row.user_id,
+                student_name=f"{row.first_name or ''} {row.last_name or ''}".strip() or 'Unknown',
+                student_id=row.student_id,
+                email=row.email,
+                class_type=row.class_type,
+                class_name=row.class_name,
+                amount=row.amount,
+                ledger=ledger,
+            )
+        last_id = rows[-1].id
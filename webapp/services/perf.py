@@ -0,0 +1,229 @@
+"""
+Per-request performance instrumentation.
+
+Counts SQL statements and database time through SQLAlchemy cursor events,
+template render time through Flask's template signals and outbound
+Cloudinary/SMTP/HTTP time through ``track()``. Every response gets a
+``Server-Timing`` header, requests slower than ``PERF_SLOW_REQUEST_MS`` are
+logged as a single JSON line, and per-endpoint samples are kept in a rolling
+window that ``/admin/perf`` summarises.
+
+Samples live in this process only, so with several gunicorn workers the
+admin page shows the worker that served it.
+"""
+from __future__ import annotations
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Outbound services timed with track(); also the Server-Timing metric names
+EXTERNAL_CATEGORIES = ('cloudinary', 'smtp', 'http')
+
+HEALTH_ENDPOINTS = ('health.health_check', 'main.health')
+HEALTH_PATHS = ('/health', '/status', '/ping')
+
+
+def _is_health_request() -> bool:
+    return request.endpoint in HEALTH_ENDPOINTS or \
+        request.path.startswith('/api/health') or \
+        request.path in HEALTH_PATHS
+
+
+class RequestStats:
+    """Timings accumulated while one request is handled (all in seconds)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.external: Dict[str, float] = defaultdict(float)
+        self._template_starts: List[float] = []
+
+    def server_timing(self, total: float) -> str:
+        metrics = [f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries"',
+                   f'tpl;dur={self.template_time * 1000:.1f}']
+        for category in EXTERNAL_CATEGORIES:
+            if category in self.external:
+                metrics.append(f'{category};dur={self.external[category] * 1000:.1f}')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Stats for the request being handled, or None outside an instrumented request"""
+    if not has_request_context():
+        return None
+    return g.get('_perf_stats')
+
+
+@contextmanager
+def track(category: str):
+    """Add the time spent in the block to the current request's ``category`` bucket"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.external[category] += time.perf_counter() - started
+
+
+class EndpointWindow:
+    """Rolling per-endpoint samples of (timestamp, duration ms, query count)."""
+
+    def __init__(self, window_seconds: int = 900, max_samples: int = 2000):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, duration_ms: float, query_count: int) -> None:
+        now = time.time()
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.max_samples)
+            samples.append((now, duration_ms, query_count))
+
+    def summary(self) -> List[dict]:
+        """One row per endpoint seen within the window"""
+        cutoff = time.time() - self.window_seconds
+        rows = []
+        with self._lock:
+            for endpoint, samples in list(self._samples.items()):
+                while samples and samples[0][0] < cutoff:
+                    samples.popleft()
+                if not samples:
+                    del self._samples[endpoint]
+                    continue
+                durations = sorted(sample[1] for sample in samples)
+                queries = [sample[2] for sample in samples]
+                rows.append({
+                    'endpoint': endpoint,
+                    'requests': len(samples),
+                    'p50_ms': _percentile(durations, 50),
+                    'p95_ms': _percentile(durations, 95),
+                    'max_ms': durations[-1],
+                    'avg_queries': sum(queries) / len(queries),
+                    'max_queries': max(queries),
+                })
+        return rows
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+endpoint_stats = EndpointWindow()
+
+
+def worst_endpoints(limit: int = 15) -> Dict[str, List[dict]]:
+    """Endpoints in the current window ranked by p95 latency and by queries per request"""
+    rows = endpoint_stats.summary()
+    return {
+        'by_p95': sorted(rows, key=lambda row: row['p95_ms'], reverse=True)[:limit],
+        'by_queries': sorted(rows, key=lambda row: (row['max_queries'], row['avg_queries']), reverse=True)[:limit],
+    }
+
+
+# SQLAlchemy / template listeners - registered once per process, active only inside instrumented requests
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('_perf_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    starts = conn.info.get('_perf_query_start')
+    if stats is None or not starts:
+        return
+    stats.query_count += 1
+    stats.db_time += time.perf_counter() - starts.pop()
+
+
+def _before_render(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats._template_starts.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats._template_starts:
+        started = stats._template_starts.pop()
+        # Only count the outermost render so nested render_template calls are not double counted
+        if not stats._template_starts:
+            stats.template_time += time.perf_counter() - started
+
+
+_listeners_installed = False
+
+
+def _install_listeners() -> None:
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render)
+    template_rendered.connect(_after_render)
+    _listeners_installed = True
+
+
+def init_app(app) -> None:
+    """Wire the request hooks into the app; register before other before_request hooks"""
+    if not app.config.get('PERF_INSTRUMENTATION', True):
+        return
+    _install_listeners()
+    endpoint_stats.window_seconds = int(app.config.get('PERF_WINDOW_SECONDS', 900))
+
+    @app.before_request
+    def start_request_timer():
+        if _is_health_request():
+            return None
+        g._perf_stats = RequestStats()
+
+    @app.after_request
+    def record_request_timing(response):
+        stats = current_stats()
+        if stats is None:
+            return response
+        g._perf_stats = None
+        total = time.perf_counter() - stats.started
+        duration_ms = total * 1000
+        endpoint = request.endpoint or '<unmatched>'
+
+        response.headers['Server-Timing'] = stats.server_timing(total)
+        endpoint_stats.record(endpoint, duration_ms, stats.query_count)
+
+        if duration_ms >= current_app.config.get('PERF_SLOW_REQUEST_MS', 1000):
+            current_app.logger.warning('Slow request %s', json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 1),
+                'queries': stats.query_count,
+                'db_ms': round(stats.db_time * 1000, 1),
+                'template_ms': round(stats.template_time * 1000, 1),
+                'external_ms': {name: round(seconds * 1000, 1) for name, seconds in stats.external.items()},
+            }))
+        return response
@@ -0,0 +1,254 @@
+"""
+Chunked, resumable uploads.
+
+Course videos and large materials used to arrive in one multipart POST: a
+dropped connection restarted the upload from scratch and a worker was held
+for the whole transfer. Instead the browser opens a ResumableUpload for the
+file's size and sends it in chunks, each tagged with the offset it starts
+at. Chunks are streamed onto the spool file a buffer at a time, so memory
+use doesn't grow with the file, and a client that loses its connection asks
+for the current offset and carries on from there.
+
+When the last byte arrives the spool file becomes a staged PendingUpload and
+the client gets the same kind of upload token a direct upload gives
+(direct_upload.py). Submitting the form releases the upload to the
+background queue (upload_queue.py), which hands it to the storage backend.
+
+An upload belongs to the user who opened it. Receipts can be uploaded
+before the payer has an account; those anonymous uploads belong to the
+session that opened them instead. Each purpose caps the file size
+(``UploadPurpose.max_size``, else RESUMABLE_UPLOAD_MAX_SIZE), and at most
+ANONYMOUS_UPLOAD_LIMIT anonymous uploads may be receiving at once, so new
+sessions can't keep opening spool files.
+
+``sweep_abandoned()`` removes uploads idle for RESUMABLE_UPLOAD_EXPIRY
+seconds and staged files that no form ever claimed.
+"""
+from __future__ import annotations
+import os
+import secrets
+import shutil
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Optional
+
+import sqlalchemy as sa
+from flask import current_app, session
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import secure_filename
+
+from ..extensions import db
+from ..models import PendingUpload, ResumableUpload
+from .direct_upload import UPLOAD_PURPOSES, current_user_id, get_purpose, issue_upload_token, resource_type_for
+from .storage import get_storage
+from .upload_queue import UploadError, UploadUnavailable, inline_uploads, spool_dir
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+_SESSION_KEY = 'resumable_uploads'
+MAX_SESSION_UPLOADS = 8
+ANONYMOUS_UPLOAD_LIMIT = 100  # across all sessions; each is at most the purpose's max_size
+
+
+class TooManyUploads(UploadError):
+    """The server-wide cap on open anonymous uploads is reached"""
+
+
+class ChunkError(UploadError):
+    """A chunk was not stored; the client should resume from ``offset``"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+def _config(key: str, default: int) -> int:
+    return int(current_app.config.get(key, default))
+
+
+def start_upload(purpose_name: str, filename: str, size: int) -> ResumableUpload:
+    """Open an upload of ``size`` bytes and create its empty spool file"""
+    purpose = get_purpose(purpose_name)
+    if not get_storage().is_available():
+        raise UploadUnavailable('File storage is not available')
+    if inline_uploads():
+        # Chunks are kept in the spool between requests
+        raise UploadUnavailable('Chunked uploads need a writable spool directory')
+    max_size = _config('RESUMABLE_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+    if purpose.max_size:
+        max_size = min(max_size, purpose.max_size)
+    if size <= 0 or size > max_size:
+        raise UploadError(f'File size must be between 1 byte and {max_size // 1024 ** 2}MB')
+    resource_type_for(purpose, filename or '')  # reject types the purpose doesn't take before any bytes arrive
+    if current_user_id() is None:
+        # A session cookie is free to discard, so the per-session list alone doesn't bound anonymous uploads
+        receiving = ResumableUpload.query.filter_by(created_by=None, status='receiving').count()
+        if receiving >= _config('ANONYMOUS_UPLOAD_LIMIT', ANONYMOUS_UPLOAD_LIMIT):
+            raise TooManyUploads('Too many uploads are in progress; please try again in a few minutes')
+
+    token = secrets.token_hex(16)
+    directory = os.path.join(spool_dir(), token)
+    path = os.path.join(directory, secure_filename(filename or '') or 'upload')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        open(path, 'wb').close()
+    except OSError as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise UploadError(f'Could not store the upload: {e}') from e
+
+    upload = ResumableUpload(
+        token=token,
+        purpose=purpose_name,
+        filename=filename,
+        size=size,
+        received=0,
+        spool_path=path,
+        created_by=current_user_id(),
+    )
+    db.session.add(upload)
+    db.session.commit()
+    if upload.created_by is None:
+        # The session cookie keeps the last few; older anonymous uploads can no longer be resumed
+        session[_SESSION_KEY] = (session.get(_SESSION_KEY) or [])[-(MAX_SESSION_UPLOADS - 1):] + [token]
+    return upload
+
+
+def get_upload(token: str) -> Optional[ResumableUpload]:
+    """The upload called ``token`` if the current user, or for an anonymous upload this session, opened it"""
+    upload = ResumableUpload.query.filter_by(token=token).first()
+    if upload is None:
+        return None
+    if upload.created_by is None:
+        return upload if token in (session.get(_SESSION_KEY) or []) else None
+    return upload if upload.created_by == current_user_id() else None
+
+
+def _copy(stream: BinaryIO, target: BinaryIO, length: int) -> int:
+    written = 0
+    while written < length:
+        block = stream.read(min(COPY_BUFFER_SIZE, length - written))
+        if not block:
+            break
+        target.write(block)
+        written += len(block)
+    return written
+
+
+def append_chunk(upload: ResumableUpload, offset: int, stream: BinaryIO, length: Optional[int]) -> ResumableUpload:
+    """
+    Write ``length`` bytes from ``stream`` at ``offset``, which must be the
+    number of bytes received so far. The last chunk stages the file.
+    """
+    if upload.status != 'receiving':
+        raise ChunkError('Upload is already complete', upload.received)
+    if offset != upload.received:
+        raise ChunkError('Chunk does not start at the current offset', upload.received)
+    if not length or length < 0 or offset + length > upload.size:
+        raise ChunkError('Chunk length is missing or runs past the end of the file', upload.received)
+
+    try:
+        # Bytes past ``received`` are a cut-short earlier attempt; this chunk writes over them
+        with open(upload.spool_path, 'r+b') as target:
+            target.seek(offset)
+            written = _copy(stream, target, length)
+    except ClientDisconnected:
+        written = -1
+    except OSError as e:
+        raise UploadError(f'Could not store the upload: {e}') from e
+    if written != length:
+        raise ChunkError('Chunk was cut short', upload.received)
+
+    # A retried chunk can race the original; only one of them moves the offset on
+    db.session.execute(
+        sa.update(ResumableUpload)
+        .where(ResumableUpload.id == upload.id, ResumableUpload.received == offset)
+        .values(received=offset + length, updated_at=datetime.utcnow())
+    )
+    db.session.commit()
+    db.session.refresh(upload)
+    if upload.status == 'receiving' and upload.received == upload.size:
+        _stage(upload)
+    return upload
+
+
+def _stage(upload: ResumableUpload) -> None:
+    # Two requests can both see the last byte arrive; the one that flips the status stages the file
+    claimed = db.session.execute(
+        sa.update(ResumableUpload)
+        .where(ResumableUpload.id == upload.id, ResumableUpload.status == 'receiving')
+        .values(status='complete')
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        db.session.refresh(upload)
+        return
+
+    purpose = UPLOAD_PURPOSES[upload.purpose]
+    with open(upload.spool_path, 'r+b') as spool:
+        spool.truncate(upload.size)
+    pending = PendingUpload(
+        token=upload.token,
+        spool_path=upload.spool_path,
+        filename=upload.filename,
+        folder=purpose.folder,
+        resource_type=resource_type_for(purpose, upload.filename or ''),
+        status='staged',
+        created_by=upload.created_by,
+    )
+    db.session.add(pending)
+    db.session.flush()
+    upload.pending_upload_id = pending.id
+    db.session.commit()
+
+
+def cancel_upload(upload: ResumableUpload) -> None:
+    """Drop an upload that is still receiving, and its spool file"""
+    if upload.status != 'receiving':
+        raise UploadError('Upload is already complete')
+    shutil.rmtree(os.path.dirname(upload.spool_path), ignore_errors=True)
+    db.session.delete(upload)
+    db.session.commit()
+
+
+def upload_state(upload: ResumableUpload) -> Dict[str, Any]:
+    """What the client needs to carry on, plus the form's upload token once the file is complete"""
+    state = {
+        'token': upload.token,
+        'offset': upload.received,
+        'size': upload.size,
+        'status': upload.status,
+        'chunk_size': _config('RESUMABLE_CHUNK_SIZE', 5 * 1024 ** 2),
+    }
+    if upload.status == 'complete':
+        purpose = UPLOAD_PURPOSES[upload.purpose]
+        state['upload_token'] = issue_upload_token(
+            upload.purpose, secure_filename(upload.filename or '') or 'upload',
+            resource_type_for(purpose, upload.filename or ''), pending_upload_id=upload.pending_upload_id
+        )
+    return state
+
+
+def sweep_abandoned(now: Optional[datetime] = None) -> int:
+    """
+    Delete uploads idle for RESUMABLE_UPLOAD_EXPIRY seconds, with their
+    spool files, and staged files no form claimed in that time. Returns
+    how many were removed.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=_config('RESUMABLE_UPLOAD_EXPIRY', 24 * 3600))
+    removed = 0
+
+    for upload in ResumableUpload.query.filter(ResumableUpload.updated_at < cutoff).all():
+        # A complete upload's spool file belongs to its PendingUpload now
+        if upload.status == 'receiving':
+            shutil.rmtree(os.path.dirname(upload.spool_path), ignore_errors=True)
+            removed += 1
+        db.session.delete(upload)
+
+    for pending in PendingUpload.query.filter(PendingUpload.status == 'staged',
+                                              PendingUpload.created_at < cutoff).all():
+        shutil.rmtree(os.path.dirname(pending.spool_path), ignore_errors=True)
+        ResumableUpload.query.filter_by(pending_upload_id=pending.id).delete(synchronize_session=False)
+        db.session.delete(pending)
+        removed += 1
+
+    db.session.commit()
+    return removed
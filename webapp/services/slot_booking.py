@@ -0,0 +1,203 @@
+"""
+Contention-safe booking of Individual/Family time slots.
+
+A booking is a StudentClassTimeSelection plus a ClassTimeClaim row for one
+seat of the slot. Claims are keyed by ``slot_key()``: every slot of a
+shared group at the same day and time gets the same key, so the unique
+(slot_key, seat) index is what stops two students - or two class types -
+from taking the same seat, even when their requests arrive at the same
+moment. A slot has ``max_capacity`` seats (one when unset).
+
+The per-enrollment rules (no duplicates, at most two slots) are checked
+with the enrollment row locked FOR UPDATE, which serializes concurrent
+bookings by the same student on PostgreSQL.
+
+``slot_availability()`` reports bookings, capacity and shared-group
+occupancy for every active slot in a single aggregate query; the dashboard
+time picker and the admin selections page both render from it.
+
+``backfill_claims()`` gives every selection that has no claim yet its seat.
+The deploy's ``db.create_all()`` step runs it, because create_all() makes
+the claim table before the migration that would backfill it.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import and_, exists, func
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import ClassEnrollment, ClassTime, ClassTimeClaim, StudentClassTimeSelection
+
+MAX_SELECTIONS_PER_ENROLLMENT = 2
+SELECTABLE_CLASS_TYPES = ('individual', 'family')
+
+
+class BookingResult(NamedTuple):
+    selection: Optional[StudentClassTimeSelection]
+    error: Optional[str]
+    selection_count: int = 0
+
+
+class SlotAvailability(NamedTuple):
+    class_time: ClassTime
+    booked: int  # bookings of this slot
+    group_booked: int  # bookings across its shared group at the same day and time (== booked when not shared)
+    capacity: int
+
+    @property
+    def available(self) -> bool:
+        return self.group_booked < self.capacity
+
+
+def slot_key(class_time: ClassTime) -> str:
+    """Claim key shared by every slot that competes for the same seats"""
+    if class_time.shared_slot_group_id:
+        return (f"{class_time.shared_slot_group_id}|{class_time.day}|"
+                f"{class_time.start_time.strftime('%H:%M')}|{class_time.end_time.strftime('%H:%M')}")
+    return f"time:{class_time.id}"
+
+
+def slot_capacity(class_time: ClassTime) -> int:
+    return class_time.max_capacity if class_time.max_capacity and class_time.max_capacity > 0 else 1
+
+
+def _claim(key: str, seat: int, selection_id: int) -> bool:
+    """Insert the claim unless the seat is taken; True if this booking got it"""
+    values = {'slot_key': key, 'seat': seat, 'selection_id': selection_id, 'created_at': datetime.utcnow()}
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.add(ClassTimeClaim(**values))
+        except IntegrityError:
+            return False
+        return True
+
+    statement = insert(ClassTimeClaim).values(**values).on_conflict_do_nothing(index_elements=['slot_key', 'seat'])
+    return db.session.execute(statement).rowcount == 1
+
+
+def book_class_time(user_id: int, enrollment: ClassEnrollment, class_time: ClassTime) -> BookingResult:
+    """
+    Book ``class_time`` for ``enrollment``. On success the selection and its
+    claim are flushed and the caller commits; on failure ``error`` says why
+    and the caller rolls back.
+    """
+    locked = ClassEnrollment.query.filter_by(id=enrollment.id).with_for_update().first()
+    if not locked:
+        return BookingResult(None, 'Enrollment not found.')
+
+    selected_ids = [row[0] for row in db.session.query(StudentClassTimeSelection.class_time_id).filter_by(
+        enrollment_id=enrollment.id
+    ).all()]
+    if class_time.id in selected_ids:
+        return BookingResult(None, 'You have already selected this time slot.', len(selected_ids))
+    if len(selected_ids) >= MAX_SELECTIONS_PER_ENROLLMENT:
+        return BookingResult(None, 'You have already selected 2 time slots. '
+                                   'Please remove one before selecting a new time.', len(selected_ids))
+
+    key = slot_key(class_time)
+    taken = {row[0] for row in db.session.query(ClassTimeClaim.seat).filter_by(slot_key=key).all()}
+    free_seats = [seat for seat in range(1, slot_capacity(class_time) + 1) if seat not in taken]
+    if free_seats:
+        selection = StudentClassTimeSelection(
+            user_id=user_id,
+            enrollment_id=enrollment.id,
+            class_time_id=class_time.id,
+            class_type=class_time.class_type
+        )
+        db.session.add(selection)
+        db.session.flush()
+        for seat in free_seats:
+            # A seat another booking took after we looked is skipped, not an error
+            if _claim(key, seat, selection.id):
+                return BookingResult(selection, None, len(selected_ids) + 1)
+
+    return BookingResult(None, 'This time slot is already booked by another student. '
+                               'Please select a different time.', len(selected_ids))
+
+
+def backfill_claims() -> int:
+    """
+    Claim a seat for every selection that has none, oldest first, and drop
+    claims whose selection is gone. Slots that are already over-booked get
+    extra seats, so nobody else can book them. Returns the number of claims
+    added. The caller commits.
+    """
+    ClassTimeClaim.query.filter(
+        ~exists().where(StudentClassTimeSelection.id == ClassTimeClaim.selection_id)
+    ).delete(synchronize_session=False)
+
+    missing = db.session.query(StudentClassTimeSelection, ClassTime) \
+        .join(ClassTime, ClassTime.id == StudentClassTimeSelection.class_time_id) \
+        .outerjoin(ClassTimeClaim, ClassTimeClaim.selection_id == StudentClassTimeSelection.id) \
+        .filter(ClassTimeClaim.id.is_(None)) \
+        .order_by(StudentClassTimeSelection.selected_at, StudentClassTimeSelection.id).all()
+    if not missing:
+        return 0
+
+    keys = {slot_key(class_time) for _, class_time in missing}
+    taken = defaultdict(set)
+    for key, seat in db.session.query(ClassTimeClaim.slot_key, ClassTimeClaim.seat).filter(
+            ClassTimeClaim.slot_key.in_(keys)):
+        taken[key].add(seat)
+    for selection, class_time in missing:
+        key = slot_key(class_time)
+        seat = 1
+        while seat in taken[key]:
+            seat += 1
+        taken[key].add(seat)
+        db.session.add(ClassTimeClaim(slot_key=key, seat=seat, selection_id=selection.id,
+                                      created_at=selection.selected_at or datetime.utcnow()))
+    return len(missing)
+
+
+def slot_availability(class_types: Iterable[str] = SELECTABLE_CLASS_TYPES) -> List[SlotAvailability]:
+    """
+    Every active slot of ``class_types`` with its booking counts, ordered by
+    class type, day and start time, from one statement: per-slot and
+    per-shared-group counts are GROUP BY subqueries joined onto ClassTime.
+    """
+    per_slot = db.session.query(
+        StudentClassTimeSelection.class_time_id.label('class_time_id'),
+        func.count(StudentClassTimeSelection.id).label('booked')
+    ).group_by(StudentClassTimeSelection.class_time_id).subquery()
+
+    # Shared siblings may be inactive or of another class type; their bookings still count
+    per_group = db.session.query(
+        ClassTime.shared_slot_group_id.label('group_id'),
+        ClassTime.day.label('day'),
+        ClassTime.start_time.label('start_time'),
+        ClassTime.end_time.label('end_time'),
+        func.count(StudentClassTimeSelection.id).label('booked')
+    ).join(StudentClassTimeSelection, StudentClassTimeSelection.class_time_id == ClassTime.id) \
+        .filter(ClassTime.shared_slot_group_id.isnot(None)) \
+        .group_by(ClassTime.shared_slot_group_id, ClassTime.day, ClassTime.start_time, ClassTime.end_time) \
+        .subquery()
+
+    rows = db.session.query(
+        ClassTime,
+        func.coalesce(per_slot.c.booked, 0),
+        per_group.c.booked
+    ).outerjoin(per_slot, per_slot.c.class_time_id == ClassTime.id) \
+        .outerjoin(per_group, and_(
+            per_group.c.group_id == ClassTime.shared_slot_group_id,
+            per_group.c.day == ClassTime.day,
+            per_group.c.start_time == ClassTime.start_time,
+            per_group.c.end_time == ClassTime.end_time
+        )).filter(
+            ClassTime.class_type.in_(set(class_types)),
+            ClassTime.is_active == True
+        ).order_by(ClassTime.class_type, ClassTime.day, ClassTime.start_time).all()
+
+    return [SlotAvailability(class_time, booked,
+                             (group_booked or 0) if class_time.shared_slot_group_id else booked,
+                             slot_capacity(class_time))
+            for class_time, booked, group_booked in rows]
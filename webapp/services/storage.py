@@ -0,0 +1,368 @@
+"""
+Pluggable file storage.
+
+Uploads used to go to Cloudinary unconditionally, so dev and test setups
+without Cloudinary credentials could not store anything and course media
+fell back to ad-hoc folders. ``get_storage()`` now returns one of two
+backends with CloudinaryService's interface (``is_available``,
+``upload_file``, ``delete_file``, ``get_url``):
+
+* CloudinaryStorage hands everything to CloudinaryService.
+* LocalStorage keeps files on disk under STORAGE_LOCAL_ROOT. Files are
+  content-addressed (``ab/<sha256><ext>``), so an identical upload is
+  stored once, and a JSON sidecar records size, MIME type and original
+  name at upload time, so serving a file never has to work them out.
+  Its URLs point at ``/api/media/<key>``.
+
+STORAGE_BACKEND picks the backend ('cloudinary' or 'local'); by default
+Cloudinary is used when it is configured and local disk otherwise.
+
+Local files are served by media.py.
+"""
+from __future__ import annotations
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from typing import Any, BinaryIO, Dict, NamedTuple, Optional, Set, Tuple, Union
+from urllib.parse import quote
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+from .cloudinary_service import CloudinaryService
+
+COPY_BUFFER_SIZE = 64 * 1024
+METADATA_CACHE_SIZE = 4096
+DEFAULT_VARIANT_WIDTHS = (160, 320, 640, 1280)
+# Formats Pillow can write back as they came; GIFs and SVGs are served as uploaded
+VARIANT_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp'}
+
+_metadata_cache: Dict[str, Dict[str, Any]] = {}
+_listing_cache: Dict[str, Tuple[int, Set[str]]] = {}
+_listing_lock = threading.Lock()
+
+
+class StoredFile(NamedTuple):
+    path: str
+    size: int
+    mime_type: str
+    mtime: float
+    etag: str
+    filename: str
+
+
+class StorageBackend:
+    """What every backend provides; results have the same shape as CloudinaryService's"""
+
+    name = ''
+    # Whether browsers can upload straight to the backend (see direct_upload.py)
+    direct_uploads = False
+
+    def is_available(self) -> bool:
+        raise NotImplementedError
+
+    def upload_file(self, file: Union[FileStorage, BinaryIO, str], folder: str = '', resource_type: str = 'auto',
+                    public_id: Optional[str] = None) -> Tuple[bool, Union[Dict[str, Any], str]]:
+        raise NotImplementedError
+
+    def delete_file(self, public_id: str, resource_type: str = 'image') -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    def get_url(self, public_id: str, **transformations) -> Optional[str]:
+        raise NotImplementedError
+
+
+class CloudinaryStorage(StorageBackend):
+    name = 'cloudinary'
+    direct_uploads = True
+
+    def is_available(self) -> bool:
+        return CloudinaryService.is_available()
+
+    def upload_file(self, file, folder='', resource_type='auto', public_id=None):
+        return CloudinaryService.upload_file(file, folder=folder, resource_type=resource_type, public_id=public_id)
+
+    def delete_file(self, public_id, resource_type='image'):
+        return CloudinaryService.delete_file(public_id, resource_type)
+
+    def get_url(self, public_id, **transformations):
+        return CloudinaryService.get_cloudinary_url(public_id, **transformations)
+
+
+def _resource_type(mime_type: str) -> str:
+    kind = mime_type.split('/', 1)[0]
+    return kind if kind in ('image', 'video') else 'raw'
+
+
+def _read_metadata(path: str) -> Optional[Dict[str, Any]]:
+    # Blobs never change once written, so neither does their metadata
+    metadata = _metadata_cache.get(path)
+    if metadata is None:
+        try:
+            with open(path, encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if len(_metadata_cache) >= METADATA_CACHE_SIZE:
+            _metadata_cache.clear()
+        _metadata_cache[path] = metadata
+    return metadata
+
+
+class LocalStorage(StorageBackend):
+    """
+    Content-addressed files under ``root``. The public ID is the storage
+    key, e.g. ``3f/3fa2...e1.mp4``. Identical files share one blob, so
+    deleting a key removes it for everything that refers to it.
+    """
+
+    name = 'local'
+
+    def __init__(self, root: str, url_prefix: str = '/api/media/'):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+
+    def is_available(self) -> bool:
+        try:
+            os.makedirs(self.root, exist_ok=True)
+        except OSError as e:
+            current_app.logger.error(f"Local storage at {self.root} is not writable: {e}")
+            return False
+        return os.access(self.root, os.W_OK)
+
+    def path_for(self, key: str) -> Optional[str]:
+        """Absolute path of ``key``, or None if it points outside the root"""
+        return safe_join(self.root, key)
+
+    def upload_file(self, file, folder='', resource_type='auto', public_id=None):
+        """
+        Store ``file`` under its SHA-256. ``folder`` and ``public_id`` are
+        kept in the metadata only; the content decides where it lives.
+        Images also get width-bounded copies (see ``_make_variants``).
+        """
+        if isinstance(file, str):
+            filename = os.path.basename(file)
+        else:
+            filename = getattr(file, 'filename', None) or os.path.basename(getattr(file, 'name', '') or '')
+        filename = secure_filename(filename or '') or 'upload'
+
+        try:
+            source = open(file, 'rb') if isinstance(file, str) else getattr(file, 'stream', file)
+            try:
+                key, metadata = self._store(source, filename, {'folder': folder, 'public_id': public_id})
+            finally:
+                if isinstance(file, str):
+                    source.close()
+        except OSError as e:
+            error_msg = f"Error storing file: {e}"
+            current_app.logger.error(error_msg)
+            return False, error_msg
+
+        mime_type = metadata['mime_type']
+        return True, {
+            'url': self.get_url(key),
+            'public_id': key,
+            'format': os.path.splitext(key)[1].lstrip('.') or None,
+            'resource_type': _resource_type(mime_type) if resource_type == 'auto' else resource_type,
+            'bytes': metadata['size'],
+            'width': metadata.get('width'),
+            'height': metadata.get('height'),
+        }
+
+    def _store(self, source: BinaryIO, filename: str, extra: Dict[str, Any],
+               variants: bool = True) -> Tuple[str, Dict[str, Any]]:
+        ext = os.path.splitext(filename)[1].lower()
+        incoming = os.path.join(self.root, '.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=incoming)
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                while True:
+                    block = source.read(COPY_BUFFER_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    target.write(block)
+                    size += len(block)
+
+            sha = digest.hexdigest()
+            key = f"{sha[:2]}/{sha}{ext}"
+            path = self.path_for(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.unlink(temp_path)
+            else:
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        # An identical file is already here, sidecar and variants included
+        metadata = _read_metadata(path + '.json')
+        if metadata is None:
+            mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            metadata = {
+                'sha256': sha,
+                'size': size,
+                'mime_type': mime_type,
+                'filename': filename,
+                'created_at': time.time(),
+                **extra,
+            }
+            if variants:
+                metadata.update(self._make_variants(path, mime_type, filename))
+            fd, temp_path = tempfile.mkstemp(dir=incoming)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path + '.json')
+        return key, metadata
+
+    def _make_variants(self, path: str, mime_type: str, filename: str) -> Dict[str, Any]:
+        """
+        The image's dimensions and a copy of it at each IMAGE_VARIANT_WIDTHS
+        width narrower than the original, stored as blobs of their own.
+        Nothing for other files, or when Pillow isn't installed.
+        """
+        if mime_type not in VARIANT_MIME_TYPES:
+            return {}
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            return {}
+
+        stem, ext = os.path.splitext(filename)
+        try:
+            with Image.open(path) as original:
+                image_format = original.format
+                image = ImageOps.exif_transpose(original)
+                width, height = image.size
+                if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                variants = {}
+                for target in sorted(current_app.config.get('IMAGE_VARIANT_WIDTHS', DEFAULT_VARIANT_WIDTHS)):
+                    if target >= width:
+                        break
+                    resized = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+                    buffer = io.BytesIO()
+                    if image_format == 'JPEG':
+                        resized.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+                    else:
+                        resized.save(buffer, image_format, optimize=True)
+                    buffer.seek(0)
+                    key, _ = self._store(buffer, f"{stem}_w{target}{ext}", {'variant_of': filename}, variants=False)
+                    variants[str(target)] = key
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            current_app.logger.warning(f"Could not make image variants of {filename}: {e}")
+            return {}
+        return {'width': width, 'height': height, 'variants': variants}
+
+    def delete_file(self, public_id, resource_type='image'):
+        path = self.path_for(public_id)
+        if path is None or not os.path.isfile(path):
+            return False, 'not found'
+        try:
+            os.unlink(path)
+            if os.path.exists(path + '.json'):
+                os.unlink(path + '.json')
+        except OSError as e:
+            return False, f"Error deleting file: {e}"
+        _metadata_cache.pop(path + '.json', None)
+        return True, "File deleted successfully"
+
+    def get_url(self, public_id, **transformations):
+        # Root-relative, so it can be built in background workers without a request
+        return self.url_prefix + quote(public_id)
+
+    def metadata(self, key: str) -> Optional[Dict[str, Any]]:
+        """What was recorded about ``key`` when it was stored"""
+        path = self.path_for(key)
+        return None if path is None else _read_metadata(path + '.json')
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        """``key``'s path and the metadata recorded when it was stored"""
+        path = self.path_for(key)
+        metadata = self.metadata(key)
+        if metadata is None:
+            return None
+        return StoredFile(path, metadata['size'], metadata['mime_type'], metadata['created_at'], metadata['sha256'],
+                          metadata['filename'])
+
+
+def local_storage() -> LocalStorage:
+    """The local backend, whichever backend new uploads go to"""
+    app = current_app._get_current_object()
+    storage = app.extensions.get('local_storage')
+    if storage is None:
+        storage = app.extensions['local_storage'] = LocalStorage(
+            app.config.get('STORAGE_LOCAL_ROOT') or os.path.join(app.instance_path, 'media')
+        )
+    return storage
+
+
+def get_storage() -> StorageBackend:
+    """The backend new uploads go to (STORAGE_BACKEND)"""
+    app = current_app._get_current_object()
+    storage = app.extensions.get('storage')
+    if storage is None:
+        backend = (app.config.get('STORAGE_BACKEND') or '').lower()
+        if backend not in ('cloudinary', 'local'):
+            backend = 'cloudinary' if CloudinaryService.is_available() else 'local'
+        storage = app.extensions['storage'] = CloudinaryStorage() if backend == 'cloudinary' else local_storage()
+    return storage
+
+
+def upload_path(*parts: str) -> str:
+    """A path under UPLOAD_FOLDER, which is relative to the app package unless absolute"""
+    return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'], *parts)
+
+
+def stat_file(directory: str, filename: str) -> Optional[StoredFile]:
+    """``filename`` inside ``directory``, None if it is missing or escapes the directory"""
+    path = safe_join(directory, filename)
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return StoredFile(path, st.st_size, mime_type, st.st_mtime, f"{st.st_mtime_ns:x}-{st.st_size:x}",
+                      filename)
+
+
+def list_files(directory: str) -> Set[str]:
+    """
+    Names of the files in ``directory``. The listing is kept until the
+    directory changes, so checking many names costs one stat.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return set()
+    with _listing_lock:
+        cached = _listing_cache.get(directory)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    try:
+        names = {entry.name for entry in os.scandir(directory) if entry.is_file()}
+    except OSError:
+        return set()
+    with _listing_lock:
+        _listing_cache[directory] = (mtime, names)
+    return names
+
@@ -0,0 +1,58 @@
+"""
+Memoized timezone lookups and wall-clock conversions.
+
+Class time slots are rendered once per slot per student, often several
+times on one page, and every render used to call ``pytz.timezone()`` and
+``localize()`` again. Timezone objects are kept in a bounded LRU, and a
+(time, source zone, target zone, date) conversion is computed once per
+process; the date is part of the key so DST changes are still honoured.
+"""
+from __future__ import annotations
+from datetime import date, datetime, time
+from functools import lru_cache
+from typing import Optional
+
+import pytz
+
+# Friendly names for the zones admins schedule classes in
+TIMEZONE_LABELS = {
+    'Asia/Kolkata': 'India (IST)',
+    'Africa/Banjul': 'Gambia (GMT)',
+    'Europe/London': 'UK (GMT/BST)',
+    'America/New_York': 'USA Eastern (EST/EDT)',
+    'America/Los_Angeles': 'USA Pacific (PST/PDT)',
+}
+
+
+@lru_cache(maxsize=128)
+def get_timezone(name: str):
+    """pytz timezone for ``name``; raises ``pytz.UnknownTimeZoneError``"""
+    return pytz.timezone(name)
+
+
+def is_valid_timezone(name: Optional[str]) -> bool:
+    if not name:
+        return False
+    try:
+        get_timezone(name)
+    except pytz.UnknownTimeZoneError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=4096)
+def convert_time(value: time, source: str, target: str, on_date: date) -> time:
+    """
+    Wall-clock ``value`` in ``source`` on ``on_date``, as a wall-clock time
+    in ``target``. Raises ``pytz.UnknownTimeZoneError`` for unknown zones.
+    """
+    localized = get_timezone(source).localize(datetime.combine(on_date, value))
+    return localized.astimezone(get_timezone(target)).time()
+
+
+@lru_cache(maxsize=256)
+def timezone_label(name: Optional[str]) -> Optional[str]:
+    """Human-readable name for a timezone, e.g. 'UK (GMT/BST)'; unknown names are returned as given"""
+    if not is_valid_timezone(name):
+        return name
+    return TIMEZONE_LABELS.get(name, name.replace('_', ' '))
@@ -0,0 +1,355 @@
+"""
+Background uploads to the storage backend (storage.py), normally Cloudinary.
+
+Routes used to push every receipt, photo and video to Cloudinary inside the
+request, holding a sync gunicorn worker for as long as the transfer took.
+``queue_upload()`` instead writes the file to a local spool directory and
+records a PendingUpload row; the route stores ``upload.placeholder`` in the
+model column the Cloudinary URL used to go to, tells ``attach_upload()``
+which row and column that is, and commits as before.
+
+Once the transaction commits, the upload is handed to a small thread pool
+in this process (UPLOAD_WORKERS threads; 0 uploads inline after the
+commit). The worker claims the row with a conditional UPDATE, uploads the
+spooled file with ``get_storage()``, swaps the placeholder for the real URL
+in every attached column and deletes the spool. Failures are retried with exponential backoff
+up to UPLOAD_MAX_ATTEMPTS. Until then the placeholder URL serves the spooled
+file, and afterwards redirects to the stored file, so links handed out early
+keep working.
+
+Uploads left behind by a restarted worker are picked up when the next pool
+starts, or by ``flask process-uploads``.
+
+On a serverless host (SERVERLESS, e.g. the Vercel deployment) nothing may
+run after the response and the instance path is read-only, so there, or
+whenever the spool directory can't be written, ``queue_upload()`` stores
+the file inside the request and returns an upload that is already done;
+``attach_upload()`` then puts the final URL in place of the placeholder
+before the commit.
+
+Files that arrive in chunks (resumable_upload.py) are spooled before any
+form refers to them, so they are queued as ``staged``; ``release_upload()``
+lets one start once the form that attaches it commits.
+"""
+from __future__ import annotations
+import os
+import secrets
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+import sqlalchemy as sa
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import and_, event, func, or_
+from werkzeug.utils import secure_filename
+
+from ..extensions import db
+from ..models import PendingUpload
+from .storage import get_storage
+
+_QUEUED_KEY = 'queued_uploads'
+_RELEASED_KEY = 'released_uploads'
+_TARGETS_KEY = 'upload_targets'
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+_completion_hooks: Dict[str, List[Callable[[], None]]] = {}
+
+
+class UploadError(Exception):
+    """The file could not be queued; nothing was stored"""
+
+
+class UploadUnavailable(UploadError):
+    """This way of uploading can't be used right now; the browser should send the file another way"""
+
+
+def _config(key: str, default: int) -> int:
+    return int(current_app.config.get(key, default))
+
+
+def spool_dir() -> str:
+    return current_app.config.get('UPLOAD_SPOOL_DIR') or os.path.join(current_app.instance_path, 'upload_spool')
+
+
+def inline_uploads() -> bool:
+    """True when files must be stored inside the request: on a serverless host or without a writable spool"""
+    if current_app.config.get('SERVERLESS'):
+        return True
+    directory = spool_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return True
+    return not os.access(directory, os.W_OK)
+
+
+def on_complete(table: str, callback: Callable[[], None]) -> None:
+    """Run ``callback`` in the worker's transaction whenever an upload attached to ``table`` finishes"""
+    hooks = _completion_hooks.setdefault(table, [])
+    if callback not in hooks:
+        hooks.append(callback)
+
+
+def queue_upload(file, folder: str = '', resource_type: str = 'auto',
+                 public_id: Optional[str] = None) -> PendingUpload:
+    """
+    Spool ``file`` (a FileStorage) and add its PendingUpload to the session.
+    Raises UploadError when the storage backend is unavailable or the spool
+    can't be written. The upload starts after the caller commits; a rollback
+    discards it.
+    """
+    if not get_storage().is_available():
+        raise UploadUnavailable('File storage is not available')
+    if inline_uploads():
+        return _store_inline(file, folder, resource_type, public_id)
+
+    token = secrets.token_hex(16)
+    directory = os.path.join(spool_dir(), token)
+    # A directory per upload keeps the original name, which Cloudinary uses for the public ID
+    path = os.path.join(directory, secure_filename(file.filename or '') or 'upload')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        file.save(path)
+    except OSError as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise UploadError(f'Could not store the upload: {e}') from e
+
+    upload = PendingUpload(
+        token=token,
+        spool_path=path,
+        filename=file.filename,
+        folder=folder,
+        resource_type=resource_type,
+        public_id=public_id,
+        created_by=current_user.id if current_user and current_user.is_authenticated else None,
+    )
+    db.session.add(upload)
+    db.session.flush()
+    db.session.info.setdefault(_QUEUED_KEY, []).append((upload.id, directory))
+    return upload
+
+
+def _store_inline(file, folder: str, resource_type: str, public_id: Optional[str]) -> PendingUpload:
+    """Store ``file`` now and record it as a finished upload, so its placeholder still resolves"""
+    success, result = get_storage().upload_file(file, folder=folder, resource_type=resource_type,
+                                                public_id=public_id)
+    if not (success and isinstance(result, dict) and result.get('url')):
+        raise UploadError(f"Could not store the upload: {result if isinstance(result, str) else 'no URL returned'}")
+    upload = PendingUpload(
+        token=secrets.token_hex(16),
+        spool_path='',
+        filename=file.filename,
+        folder=folder,
+        resource_type=resource_type,
+        public_id=public_id,
+        status='done',
+        attempts=1,
+        url=result['url'],
+        result_public_id=result.get('public_id'),
+        bytes=result.get('bytes'),
+        completed_at=datetime.utcnow(),
+        created_by=current_user.id if current_user and current_user.is_authenticated else None,
+    )
+    db.session.add(upload)
+    db.session.flush()
+    return upload
+
+
+def attach_upload(upload: Optional[PendingUpload], obj, column: str) -> None:
+    """
+    Replace ``upload.placeholder`` inside ``obj.<column>`` with the final
+    URL once the upload finishes. ``obj`` may still be unflushed; a None
+    ``upload`` (nothing was queued) is ignored. Attach before the commit
+    that queues the upload: a later target may miss the swap and keep the
+    placeholder, which still redirects to the final URL.
+    """
+    if upload is None:
+        return
+    db.session.info.setdefault(_TARGETS_KEY, []).append((upload, obj, column))
+
+
+def release_upload(upload: PendingUpload) -> None:
+    """Start a staged upload once the caller commits; a rollback leaves it staged"""
+    if upload.status != 'staged':
+        return
+    upload.status = 'pending'
+    upload.next_attempt_at = datetime.utcnow()
+    db.session.info.setdefault(_RELEASED_KEY, []).append(upload.id)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _record_targets(session):
+    targets = session.info.pop(_TARGETS_KEY, None)
+    if not targets:
+        return
+    session.flush()
+    for upload, obj, column in targets:
+        if upload.status == 'done' and upload.url:
+            # Stored inside the request (see inline_uploads()): swap in the final URL right away
+            value = getattr(obj, column)
+            if isinstance(value, str):
+                setattr(obj, column, value.replace(upload.placeholder, upload.url))
+            continue
+        upload.add_target(obj.__table__.name, obj.id, column)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _start_queued(session):
+    upload_ids = [upload_id for upload_id, _ in session.info.pop(_QUEUED_KEY, None) or []]
+    upload_ids += session.info.pop(_RELEASED_KEY, None) or []
+    if upload_ids:
+        schedule(upload_ids)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _discard_queued(session, transaction):
+    # Anything still queued when the outermost transaction ends was rolled back or never committed
+    if transaction.parent is not None:
+        return
+    session.info.pop(_TARGETS_KEY, None)
+    session.info.pop(_RELEASED_KEY, None)
+    for _, directory in session.info.pop(_QUEUED_KEY, None) or []:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _get_executor(app) -> ThreadPoolExecutor:
+    """This process's pool; gunicorn preloads the app, so it is created lazily after the fork"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=int(app.config.get('UPLOAD_WORKERS', 2)),
+                                           thread_name_prefix='upload')
+            _executor_pid = os.getpid()
+            _executor.submit(_run, app, _recover)
+        return _executor
+
+
+def _run(app, target, *args):
+    with app.app_context():
+        try:
+            target(*args)
+        except Exception:
+            app.logger.exception('Background upload failed')
+
+
+def schedule(upload_ids: Iterable[int], delay: float = 0) -> None:
+    """Upload ``upload_ids`` in the background, after ``delay`` seconds"""
+    app = current_app._get_current_object()
+    upload_ids = list(upload_ids)
+    if delay > 0:
+        timer = threading.Timer(delay, _run, args=(app, schedule, upload_ids))
+        timer.daemon = True
+        timer.start()
+    elif int(app.config.get('UPLOAD_WORKERS', 2)) <= 0:
+        for upload_id in upload_ids:
+            # A fresh app context gets its own session, so this is safe inside after_commit
+            _run(app, process_upload, upload_id)
+    else:
+        executor = _get_executor(app)
+        for upload_id in upload_ids:
+            executor.submit(_run, app, process_upload, upload_id)
+
+
+def _claimable(now: datetime):
+    stale_before = now - timedelta(seconds=_config('UPLOAD_STALE_SECONDS', 1800))
+    return or_(
+        and_(PendingUpload.status == 'pending', PendingUpload.next_attempt_at <= now),
+        and_(PendingUpload.status == 'uploading', PendingUpload.claimed_at < stale_before),
+    )
+
+
+def _complete(upload: PendingUpload, result: dict) -> None:
+    placeholder = upload.placeholder
+    tables = set()
+    for table_name, row_id, column in upload.get_targets():
+        table = sa.table(table_name, sa.column('id'), sa.column(column))
+        db.session.execute(table.update().where(table.c.id == row_id).values(
+            {column: func.replace(table.c[column], placeholder, result['url'])}
+        ))
+        tables.add(table_name)
+    upload.status = 'done'
+    upload.url = result['url']
+    upload.result_public_id = result.get('public_id')
+    upload.bytes = result.get('bytes')
+    upload.completed_at = datetime.utcnow()
+    upload.last_error = None
+    for table_name in tables:
+        for callback in _completion_hooks.get(table_name, []):
+            callback()
+
+
+def process_upload(upload_id: int) -> Optional[bool]:
+    """
+    Upload one spooled file. Returns True when done, False when it failed
+    (and was rescheduled or given up on), None when another worker has it.
+    """
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        sa.update(PendingUpload)
+        .where(PendingUpload.id == upload_id, _claimable(now))
+        .values(status='uploading', claimed_at=now, attempts=PendingUpload.attempts + 1)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return None
+
+    upload = db.session.get(PendingUpload, upload_id)
+    if os.path.exists(upload.spool_path):
+        success, result = get_storage().upload_file(
+            upload.spool_path,
+            folder=upload.folder or '',
+            resource_type=upload.resource_type or 'auto',
+            public_id=upload.public_id
+        )
+    else:
+        success, result = False, 'Spooled file is missing'
+        upload.attempts = _config('UPLOAD_MAX_ATTEMPTS', 5)
+
+    if success and isinstance(result, dict) and result.get('url'):
+        _complete(upload, result)
+        db.session.commit()
+        shutil.rmtree(os.path.dirname(upload.spool_path), ignore_errors=True)
+        return True
+
+    upload.last_error = result if isinstance(result, str) else 'Upload returned no URL'
+    delay = None
+    if upload.attempts >= _config('UPLOAD_MAX_ATTEMPTS', 5):
+        upload.status = 'failed'
+        current_app.logger.error(f"Upload {upload.id} ({upload.filename}) failed for good: {upload.last_error}")
+    else:
+        delay = _config('UPLOAD_RETRY_DELAY', 30) * 2 ** (upload.attempts - 1)
+        upload.status = 'pending'
+        upload.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.commit()
+    if delay is not None:
+        schedule([upload_id], delay=delay)
+    return False
+
+
+def due_upload_ids(limit: int = 100) -> List[int]:
+    """Uploads that are due for a retry or were abandoned mid-upload by a dead worker"""
+    return [row[0] for row in db.session.query(PendingUpload.id)
+            .filter(_claimable(datetime.utcnow()))
+            .order_by(PendingUpload.id).limit(limit).all()]
+
+
+def _recover() -> None:
+    from .resumable_upload import sweep_abandoned
+
+    try:
+        upload_ids = due_upload_ids()
+    except Exception:
+        # pending_upload may not exist yet on a database that hasn't been migrated
+        db.session.rollback()
+        return
+    if upload_ids:
+        schedule(upload_ids)
+    try:
+        sweep_abandoned()
+    except Exception:
+        db.session.rollback()